@@ -157,8 +157,16 @@ HF_MODEL={HF_MODEL}
         if key not in config:
             config[key] = value
     
+    content = content.format(**config)
+    
+    # Keep settings the template doesn't know about (tuning, backend, etc.)
+    extra = {k: v for k, v in config.items() if k not in defaults}
+    if extra:
+        content += "\n# Additional Settings\n"
+        content += "".join(f"{key}={value}\n" for key, value in extra.items())
+    
     with open(ENV_FILE, 'w') as f:
-        f.write(content.format(**config))
+        f.write(content)
     
     print("[OK] Configuration saved")
 
@@ -258,6 +266,7 @@ def menu_model_management():
         print("  [2] Switch active model")
         print("  [3] Download from custom repo (gated)")
         print("  [4] Delete a model")
+        print("  [5] Prewarm model into page cache")
         print("  [0] Back to main menu")
         
         choice = input("\nSelect option: ").strip()
@@ -270,6 +279,8 @@ def menu_model_management():
             download_custom_model()
         elif choice == "4":
             delete_model_menu(installed)
+        elif choice == "5":
+            prewarm_model_menu(installed)
         elif choice == "0":
             break
 
@@ -432,13 +443,65 @@ def switch_model_menu(installed: list):
             config['MODEL_PATH'] = f"models/{installed[idx].name}"
             save_env(config)
             print(f"\n[OK] Active model changed to: {installed[idx].name}")
-            print("\n[!] Restart server to load new model")
-    except:
+            
+            running, _ = check_server_status()
+            if running:
+                hot_swap_model(config, config['MODEL_PATH'])
+            else:
+                print("\n[!] Server not running - the new model loads on next start")
+    except ValueError:
         print("Invalid selection")
     
     pause()
 
 
+def hot_swap_model(config: Dict[str, str], model_path: str):
+    """Ask the running server to swap models and follow the progress"""
+    import requests
+    
+    base_url = f"http://localhost:{config.get('PORT', '8080')}/admin/model/swap"
+    headers = {}
+    if config.get('ADMIN_TOKEN'):
+        headers['X-Admin-Token'] = config['ADMIN_TOKEN']
+    
+    try:
+        response = requests.post(base_url, json={"model_path": model_path}, headers=headers, timeout=10)
+    except requests.RequestException as e:
+        print(f"\n[X] Could not reach server: {e}")
+        print("[!] Restart server to load new model")
+        return
+    
+    if response.status_code != 202:
+        detail = response.json().get('detail', response.text) if response.content else response.status_code
+        print(f"\n[X] Hot swap rejected: {detail}")
+        print("[!] Restart server to load new model")
+        return
+    
+    print(f"\nSwapping without restart ({response.json().get('strategy')})...")
+    status = {}
+    while True:
+        time.sleep(1)
+        try:
+            status = requests.get(base_url, headers=headers, timeout=5).json()
+        except requests.RequestException:
+            continue
+        
+        state = status.get('state')
+        if state == 'loading':
+            print(f"\r  Loading new model... {status.get('fraction', 0) * 100:3.0f}%   ", end="", flush=True)
+        elif state == 'draining':
+            print(f"\r  Draining {status.get('in_flight', 0)} in-flight request(s) on old model...   ",
+                  end="", flush=True)
+        else:
+            break
+    
+    print()
+    if status.get('state') == 'completed':
+        print(f"[OK] Now serving {status.get('to')} ({status.get('elapsed', 0):.1f}s, no restart needed)")
+    else:
+        print(f"[X] Hot swap failed: {status.get('error')}")
+
+
 def delete_model_menu(installed: list):
     """Delete an installed model"""
     if not installed:
@@ -472,6 +535,43 @@ def delete_model_menu(installed: list):
     pause()
 
 
+def prewarm_model_menu(installed: list):
+    """Read a model into the OS page cache so the next load is fast"""
+    if not installed:
+        print("\nNo models installed. Download one first.")
+        pause()
+        return
+    
+    clear_screen()
+    print_header("PREWARM MODEL")
+    
+    config = load_env()
+    current = config.get('MODEL_PATH', '')
+    
+    print("\nInstalled Models:\n")
+    for i, model in enumerate(installed, 1):
+        active = "<- CURRENT" if model.name in current else ""
+        print(f"  [{i}] {model.name} {active}")
+    
+    choice = input("\nSelect model number: ").strip()
+    
+    try:
+        idx = int(choice) - 1
+        if 0 <= idx < len(installed):
+            threads = config.get('PREWARM_THREADS', '4')
+            subprocess.run(
+                [sys.executable, 'scripts/prewarm_model.py', str(installed[idx]), '--threads', threads],
+                cwd=PROJECT_ROOT
+            )
+            print("\nTo prewarm before a scheduled class, add a cron entry such as:")
+            print(f"  0 8 * * 1-5 cd {PROJECT_ROOT} && {sys.executable} "
+                  f"scripts/prewarm_model.py models/{installed[idx].name}")
+    except ValueError:
+        print("Invalid selection")
+    
+    pause()
+
+
 # ============================================================
 # MENU: CONFIGURATION
 # ============================================================
@@ -825,6 +925,8 @@ def menu_system_info():
     else:
         print("    None")
     
+    print_kv_plan()
+    
     print("\n  Recommendations:")
     ram_gb = float(info.get('ram_total', '0').replace(' GB', '') or 0)
     
@@ -840,6 +942,54 @@ def menu_system_info():
     pause()
 
 
+def get_kv_plan() -> Optional[Dict[str, Any]]:
+    """Get the KV memory plan from the running server, or compute it for the configured model"""
+    running, status = check_server_status()
+    if running and status.get('model', {}).get('kv_plan'):
+        return dict(status['model']['kv_plan'], source="server")
+    
+    config = load_env()
+    model_path = PROJECT_ROOT / config.get('MODEL_PATH', 'models')
+    if model_path.is_dir():
+        model_path = next(iter(sorted(model_path.glob("*.gguf"))), None)
+    if model_path is None or not model_path.is_file():
+        return None
+    
+    try:
+        sys.path.insert(0, str(PROJECT_ROOT))
+        from src.inference.kv_planner import plan_for_model
+        plan = plan_for_model(
+            model_path,
+            budget_mb=int(config.get('KV_PLAN_BUDGET_MB', '0')),
+            kv_type=config.get('KV_CACHE_TYPE', 'f16'),
+            max_ctx=int(config.get('KV_PLAN_MAX_CTX', '8192')),
+            min_ctx=int(config.get('KV_PLAN_MIN_CTX', '1024')),
+        )
+    except (ImportError, OSError, ValueError):
+        return None
+    applied = config.get('KV_PLAN', 'false').lower() == 'true'
+    return dict(plan.as_status(), applied=applied, source=model_path.name)
+
+
+def print_kv_plan():
+    """Print the KV cache memory plan"""
+    print("\n  KV Memory Plan:")
+    plan = get_kv_plan()
+    if plan is None:
+        print("    Unavailable (no model installed)")
+        return
+    
+    print(f"    Context:     {plan['n_ctx']} tokens, key cache {plan['kv_type']}")
+    print(f"    Memory:      {plan['sequence_mb']:.0f} MB for the context, "
+          f"of {plan['budget_mb'] or '?'} MB budget (fits {plan['max_fit']})")
+    if plan.get('note'):
+        print(f"    [!] {plan['note']}")
+    if plan['applied']:
+        print("    [OK] Applied (KV_PLAN=true)")
+    else:
+        print("    Not applied - set KV_PLAN=true in config.env to use it")
+
+
 # ============================================================
 # MAIN MENU
 # ============================================================
@@ -0,0 +1 @@
+"""Benchmark and load-testing tools for the Campus AI Chat Platform."""
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Engine Microbenchmark - Measure llama runtime settings on this host
+Load time, prompt-eval tokens/s and decode tokens/s across a settings matrix
+"""
+
+import argparse
+import itertools
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stats import compare_to_baseline, load_json, print_regressions, write_json
+from src.inference.autotune import build_prompt_tokens, measure_prompt_and_decode
+from src.inference.backends import load_backend
+from src.utils.system import fingerprint_id, machine_fingerprint
+
+
+HIGHER_IS_BETTER = ("prompt_eval_tps", "decode_tps")
+
+
+def parse_int_list(value: str) -> List[int]:
+    """Parse a comma-separated list of integers."""
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def config_key(n_ctx: int, n_batch: int, n_threads: int, prompt_len: int) -> str:
+    """Stable identifier for one point in the settings matrix."""
+    return f"ctx={n_ctx},batch={n_batch},threads={n_threads},prompt={prompt_len}"
+
+
+def run_matrix(args: argparse.Namespace) -> dict:
+    """
+    Run every combination of the settings matrix.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Report dictionary with per-configuration results
+    """
+    model_path = Path(args.model)
+    results = {}
+
+    matrix = itertools.product(
+        parse_int_list(args.n_ctx),
+        parse_int_list(args.n_batch),
+        parse_int_list(args.threads),
+    )
+
+    for n_ctx, n_batch, n_threads in matrix:
+        print(f"Loading n_ctx={n_ctx} n_batch={n_batch} n_threads={n_threads}...", file=sys.stderr)
+        start = time.perf_counter()
+        model = load_backend(
+            "llama",
+            model_path,
+            n_ctx=n_ctx,
+            n_batch=n_batch,
+            n_threads=n_threads,
+            n_threads_batch=n_threads,
+            n_gpu_layers=args.n_gpu_layers,
+            verbose=False,
+        )
+        load_time = time.perf_counter() - start
+
+        for prompt_len in parse_int_list(args.prompt_lengths):
+            if prompt_len + args.decode_tokens > n_ctx:
+                continue
+
+            prompt_tokens = build_prompt_tokens(model, prompt_len)
+            # One untimed pass so page faults don't skew the first sample
+            measure_prompt_and_decode(model, prompt_tokens[:8], 1)
+            runs = [
+                measure_prompt_and_decode(model, prompt_tokens, args.decode_tokens)
+                for _ in range(args.repeat)
+            ]
+
+            key = config_key(n_ctx, n_batch, n_threads, prompt_len)
+            results[key] = {
+                "n_ctx": n_ctx,
+                "n_batch": n_batch,
+                "n_threads": n_threads,
+                "prompt_tokens": prompt_len,
+                "decode_tokens": args.decode_tokens,
+                "load_time": load_time,
+                "prompt_eval_tps": statistics.median(r["prompt_eval_tps"] for r in runs),
+                "decode_tps": statistics.median(r["decode_tps"] for r in runs),
+            }
+            print(f"  prompt={prompt_len:5d}  eval {results[key]['prompt_eval_tps']:8.1f} tok/s  "
+                  f"decode {results[key]['decode_tps']:6.1f} tok/s", file=sys.stderr)
+
+        del model
+
+    fingerprint = machine_fingerprint()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "model": {"path": str(model_path), "size_bytes": model_path.stat().st_size},
+        "machine": fingerprint,
+        "machine_id": fingerprint_id(fingerprint),
+        "repeat": args.repeat,
+        "results": results,
+    }
+
+
+def comparable_metrics(report: dict) -> Dict[str, float]:
+    """Flatten per-configuration throughput and load time for comparison."""
+    flat = {}
+    for key, entry in report["results"].items():
+        for metric in ("load_time", "prompt_eval_tps", "decode_tps"):
+            flat[f"{key}.{metric}"] = entry[metric]
+    return flat
+
+
+def compare_reports(current: dict, baseline: dict, threshold: float) -> int:
+    """
+    Compare two reports and print regressions.
+
+    Args:
+        current: Report from this run
+        baseline: Stored baseline report
+        threshold: Relative change flagged as a regression
+
+    Returns:
+        Number of regressions
+    """
+    if current.get("machine_id") != baseline.get("machine_id"):
+        print("[!] Baseline was recorded on a different machine "
+              f"({baseline.get('machine_id')} vs {current.get('machine_id')})", file=sys.stderr)
+    if current["model"].get("size_bytes") != baseline["model"].get("size_bytes"):
+        print("[!] Baseline was recorded with a different model file", file=sys.stderr)
+
+    comparison = compare_to_baseline(
+        comparable_metrics(current),
+        comparable_metrics(baseline),
+        HIGHER_IS_BETTER,
+        threshold,
+    )
+    current["baseline_comparison"] = comparison
+    return print_regressions(comparison)
+
+
+def default_model() -> Optional[str]:
+    """First .gguf file in ./models, if any."""
+    models = sorted(Path("models").glob("*.gguf"))
+    return str(models[0]) if models else None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Campus AI Chat engine microbenchmark")
+    parser.add_argument("--model", default=default_model(), help="Path to a .gguf model")
+    parser.add_argument("--n-ctx", default="2048", help="Comma-separated context sizes")
+    parser.add_argument("--n-batch", default="128,512", help="Comma-separated batch sizes")
+    parser.add_argument("--threads", default=str(max((os.cpu_count() or 2) // 2, 1)),
+                        help="Comma-separated thread counts")
+    parser.add_argument("--prompt-lengths", default="32,256,1024",
+                        help="Comma-separated prompt lengths in tokens")
+    parser.add_argument("--decode-tokens", type=int, default=64, help="Tokens to decode per run")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per configuration (median)")
+    parser.add_argument("--n-gpu-layers", type=int, default=0, help="Layers to offload to GPU")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Compare against a stored report")
+    parser.add_argument("--compare", help="Compare this existing report instead of running")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change flagged as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main function"""
+    args = parse_args(argv)
+
+    if args.compare:
+        if not args.baseline:
+            print("--compare requires --baseline", file=sys.stderr)
+            return 2
+        report = load_json(Path(args.compare))
+    else:
+        if not args.model:
+            print("No model found. Pass --model or run: python scripts/download_model.py",
+                  file=sys.stderr)
+            return 2
+        report = run_matrix(args)
+
+    exit_code = 0
+    if args.baseline:
+        print(f"\nComparison against {args.baseline}:", file=sys.stderr)
+        if compare_reports(report, load_json(Path(args.baseline)), args.threshold):
+            exit_code = 1
+
+    write_json(report, Path(args.output) if args.output else None)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
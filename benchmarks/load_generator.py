@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Load Generator - Drive the chat endpoints with classroom traffic profiles
+Measures TTFT, inter-token latency, end-to-end latency, tokens/s and rejections
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stats import (
+    compare_to_baseline,
+    flatten_metrics,
+    load_json,
+    print_regressions,
+    summarize,
+    write_json,
+)
+
+
+# Built-in prompt mix, roughly matching what students send during a lab
+DEFAULT_PROMPTS = {
+    "short": [
+        "What is a variable in Python?",
+        "Define photosynthesis in one sentence.",
+        "What does HTTP stand for?",
+        "Give me a synonym for 'rapid'.",
+    ],
+    "medium": [
+        "Explain the difference between a list and a tuple in Python with an example.",
+        "Summarize the causes of the First World War in a short paragraph.",
+        "How does binary search work? Describe the steps and its time complexity.",
+        "Write a SQL query that returns the ten most recent orders per customer.",
+    ],
+    "long": [
+        "I am writing a lab report on enzyme kinetics. Explain the Michaelis-Menten "
+        "model, what Vmax and Km mean, how a Lineweaver-Burk plot is constructed, and "
+        "what the common pitfalls are when fitting experimental data to the model.",
+        "Review the following approach to a data structures assignment: we store a "
+        "graph as an adjacency matrix, run breadth-first search from every node to "
+        "compute all-pairs shortest paths, and cache the results in a dictionary. "
+        "Point out complexity problems and suggest better alternatives.",
+    ],
+}
+
+# Metrics where a larger value is an improvement when comparing to a baseline
+HIGHER_IS_BETTER = ("tokens_per_second", "success_rate")
+
+
+@dataclass
+class PromptSpec:
+    """A single prompt to send, with its generation length."""
+    prompt: str
+    max_tokens: int
+
+
+@dataclass
+class RequestResult:
+    """Outcome and timings of one request."""
+    endpoint: str
+    status: str  # "ok", "rejected" or "error"
+    start: float
+    ttft: Optional[float] = None
+    e2e: Optional[float] = None
+    tokens: int = 0  # from the response timings; SSE frames can carry several tokens each
+    inter_token: Optional[float] = None  # mean seconds per token after the first
+    frames: int = 0
+    frame_gaps: List[float] = field(default_factory=list)
+    cancelled: bool = False
+    error: Optional[str] = None
+
+
+# ============================================================
+# PROMPT SOURCES
+# ============================================================
+
+def load_replay_prompts(path: Path) -> List[str]:
+    """
+    Load prompts from a JSONL request log.
+
+    Each line may carry a ``prompt`` field, or a ``title``/``body`` pair as in
+    the backlog file at the repository root.
+
+    Args:
+        path: Path to the JSONL file
+
+    Returns:
+        List of prompt strings in file order
+    """
+    prompts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("prompt"):
+                prompts.append(record["prompt"])
+            elif record.get("body"):
+                title = record.get("title")
+                prompts.append(f"{title}\n\n{record['body']}" if title else record["body"])
+    return prompts
+
+
+def parse_range(value: str) -> Tuple[int, int]:
+    """Parse ``N`` or ``LOW:HIGH`` into an inclusive integer range."""
+    if ":" in value:
+        low, high = value.split(":", 1)
+        return int(low), int(high)
+    return int(value), int(value)
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Parse a prompt length mix such as ``short=0.5,medium=0.3,long=0.2``."""
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=", 1)
+        if name not in DEFAULT_PROMPTS:
+            raise ValueError(f"Unknown prompt class: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def build_workload(args: argparse.Namespace, rng: random.Random) -> List[PromptSpec]:
+    """
+    Build the ordered list of prompts for the run.
+
+    Args:
+        args: Parsed command line arguments
+        rng: Seeded random generator
+
+    Returns:
+        One PromptSpec per request
+    """
+    low, high = parse_range(args.max_tokens)
+
+    if args.replay:
+        replay = load_replay_prompts(Path(args.replay))
+        if not replay:
+            raise ValueError(f"No prompts found in {args.replay}")
+        prompts = [replay[i % len(replay)] for i in range(args.requests)]
+    else:
+        mix = parse_mix(args.mix)
+        classes = list(mix)
+        weights = [mix[c] for c in classes]
+        prompts = [
+            rng.choice(DEFAULT_PROMPTS[rng.choices(classes, weights)[0]])
+            for _ in range(args.requests)
+        ]
+
+    # Prompts are capped to the API's character limit
+    return [PromptSpec(p[:4096], rng.randint(low, high)) for p in prompts]
+
+
+# ============================================================
+# ARRIVAL PROCESSES
+# ============================================================
+
+def arrival_offsets(args: argparse.Namespace, rng: random.Random) -> List[float]:
+    """
+    Compute the send time of every request relative to the start of the run.
+
+    Args:
+        args: Parsed command line arguments
+        rng: Seeded random generator
+
+    Returns:
+        Sorted list of offsets in seconds, one per request
+    """
+    if args.arrival == "constant":
+        return [i / args.rate for i in range(args.requests)]
+
+    if args.arrival == "poisson":
+        offsets, t = [], 0.0
+        for _ in range(args.requests):
+            offsets.append(t)
+            t += rng.expovariate(args.rate)
+        return offsets
+
+    # Classroom burst: groups of --burst-size users hit "send" together,
+    # spread over a small reaction-time window, every --burst-interval seconds
+    offsets = []
+    for i in range(args.requests):
+        burst = i // args.burst_size
+        offsets.append(burst * args.burst_interval + rng.uniform(0, args.burst_spread))
+    return sorted(offsets)
+
+
+# ============================================================
+# HTTP CLIENT
+# ============================================================
+
+async def iter_sse_events(response: httpx.Response) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Parse a Server-Sent Events response into (event, data) pairs.
+
+    Args:
+        response: Streaming httpx response
+
+    Yields:
+        Tuples of event name (default "message") and joined data lines
+    """
+    event, data = "message", []
+    async for line in response.aiter_lines():
+        if line == "":
+            if data:
+                yield event, "\n".join(data)
+            event, data = "message", []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            value = line[5:]
+            data.append(value[1:] if value.startswith(" ") else value)
+    if data:
+        yield event, "\n".join(data)
+
+
+def completion_tokens(body: dict) -> int:
+    """
+    Tokens generated, from timings.completion_tokens of a chat response or done event.
+
+    Both endpoints report it the same way, so streaming and non-streaming
+    runs count tokens alike; the done event's token_count (text pieces
+    streamed) is the fallback.
+    """
+    timings = body.get("timings") or {}
+    return int(timings.get("completion_tokens") or body.get("token_count") or 0)
+
+
+async def send_stream(client: httpx.AsyncClient, spec: PromptSpec,
+                      cancel_after: Optional[int] = None) -> RequestResult:
+    """
+    Send one /api/chat/stream request and record token timings.
+
+    The server coalesces tokens into frames (SSE_FLUSH_MS), so the token
+    count comes from the done event and inter-token latency is the time
+    from the first frame to the last divided by the tokens after the first;
+    gaps between frames are recorded separately.
+
+    Args:
+        client: Shared HTTP client
+        spec: Prompt to send
+        cancel_after: Disconnect after this many frames, simulating a user
+            closing the tab mid-answer (the token count of a cancelled stream is unknown)
+
+    Returns:
+        RequestResult for the request
+    """
+    start = time.perf_counter()
+    result = RequestResult(endpoint="stream", status="ok", start=start)
+    payload = {"prompt": spec.prompt, "max_tokens": spec.max_tokens}
+    first = last = None
+
+    try:
+        async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+            if response.status_code in (429, 503):
+                result.status = "rejected"
+                return result
+            if response.status_code != 200:
+                result.status = "error"
+                result.error = f"HTTP {response.status_code}"
+                return result
+
+            async for event, data in iter_sse_events(response):
+                now = time.perf_counter()
+                if event == "error":
+                    result.status = "rejected" if "concurrent" in data.lower() else "error"
+                    result.error = data
+                    break
+                if event == "done":
+                    try:
+                        result.tokens = completion_tokens(json.loads(data))
+                    except ValueError:
+                        pass
+                    if result.tokens > 1 and first is not None:
+                        result.inter_token = (last - first) / (result.tokens - 1)
+                    break
+                if event != "message":
+                    continue
+                if last is None:
+                    result.ttft = now - start
+                    first = now
+                else:
+                    result.frame_gaps.append(now - last)
+                last = now
+                result.frames += 1
+                if cancel_after is not None and result.frames >= cancel_after:
+                    result.cancelled = True
+                    break
+    except httpx.HTTPError as e:
+        result.status = "error"
+        result.error = str(e)
+
+    result.e2e = time.perf_counter() - start
+    return result
+
+
+async def send_chat(client: httpx.AsyncClient, spec: PromptSpec) -> RequestResult:
+    """Send one /api/chat request; TTFT equals end-to-end latency here, tokens come from its timings."""
+    start = time.perf_counter()
+    result = RequestResult(endpoint="chat", status="ok", start=start)
+    payload = {"prompt": spec.prompt, "max_tokens": spec.max_tokens}
+
+    try:
+        response = await client.post("/api/chat", json=payload)
+        result.e2e = time.perf_counter() - start
+        if response.status_code in (429, 503):
+            result.status = "rejected"
+        elif response.status_code != 200:
+            result.status = "error"
+            result.error = f"HTTP {response.status_code}"
+        else:
+            result.ttft = result.e2e
+            try:
+                result.tokens = completion_tokens(response.json())
+            except ValueError:
+                pass
+    except httpx.HTTPError as e:
+        result.status = "error"
+        result.error = str(e)
+        result.e2e = time.perf_counter() - start
+
+    return result
+
+
+async def run_load(args: argparse.Namespace) -> Tuple[List[RequestResult], float]:
+    """
+    Execute the configured workload against the server.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        Tuple of per-request results and total wall-clock duration
+    """
+    rng = random.Random(args.seed)
+    workload = build_workload(args, rng)
+    offsets = arrival_offsets(args, rng)
+    endpoints = [
+        "stream" if rng.random() < args.stream_ratio else "chat"
+        for _ in workload
+    ]
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(args.timeout, connect=10.0)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        run_start = time.perf_counter()
+
+        async def fire(offset: float, spec: PromptSpec, endpoint: str) -> RequestResult:
+            delay = offset - (time.perf_counter() - run_start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if endpoint == "stream":
+                return await send_stream(client, spec)
+            return await send_chat(client, spec)
+
+        results = await asyncio.gather(*(
+            fire(offset, spec, endpoint)
+            for offset, spec, endpoint in zip(offsets, workload, endpoints)
+        ))
+        duration = time.perf_counter() - run_start
+
+    return list(results), duration
+
+
+# ============================================================
+# REPORTING
+# ============================================================
+
+def build_report(results: List[RequestResult], duration: float,
+                 args: argparse.Namespace) -> dict:
+    """
+    Aggregate per-request results into a JSON-serializable report.
+
+    Args:
+        results: Per-request results
+        duration: Wall-clock duration of the run in seconds
+        args: Parsed command line arguments
+
+    Returns:
+        Report dictionary
+    """
+    ok = [r for r in results if r.status == "ok"]
+    rejected = [r for r in results if r.status == "rejected"]
+    errors = [r for r in results if r.status == "error"]
+    streamed = [r for r in ok if r.endpoint == "stream"]
+    total_tokens = sum(r.tokens for r in ok)
+
+    return {
+        "config": {
+            "url": args.url,
+            "arrival": args.arrival,
+            "rate": args.rate,
+            "burst_size": args.burst_size,
+            "requests": args.requests,
+            "stream_ratio": args.stream_ratio,
+            "max_tokens": args.max_tokens,
+            "replay": args.replay,
+            "seed": args.seed,
+        },
+        "duration": duration,
+        "requests": {
+            "total": len(results),
+            "ok": len(ok),
+            "rejected": len(rejected),
+            "errors": len(errors),
+        },
+        "rates": {
+            "success_rate": len(ok) / len(results) if results else 0.0,
+            "rejection_rate": len(rejected) / len(results) if results else 0.0,
+            "error_rate": len(errors) / len(results) if results else 0.0,
+        },
+        "latency": {
+            "ttft": summarize(r.ttft for r in streamed),
+            "inter_token": summarize(r.inter_token for r in streamed),
+            "frame_gap": summarize(t for r in streamed for t in r.frame_gaps),
+            "e2e": summarize(r.e2e for r in ok),
+            "e2e_stream": summarize(r.e2e for r in streamed),
+            "e2e_chat": summarize(r.e2e for r in ok if r.endpoint == "chat"),
+        },
+        "throughput": {
+            "total_tokens": total_tokens,
+            "tokens_per_second": total_tokens / duration if duration > 0 else 0.0,
+            "requests_per_second": len(ok) / duration if duration > 0 else 0.0,
+        },
+        "sample_errors": sorted({r.error for r in errors if r.error})[:5],
+    }
+
+
+def comparable_metrics(report: dict) -> Dict[str, float]:
+    """Select the metrics that are meaningful to compare across runs."""
+    flat = flatten_metrics({
+        "latency": report["latency"],
+        "rates": report["rates"],
+        "throughput": {"tokens_per_second": report["throughput"]["tokens_per_second"]},
+    })
+    return {k: v for k, v in flat.items() if not k.endswith(".count")}
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Campus AI Chat load generator")
+    parser.add_argument("--url", default="http://localhost:8080", help="Server base URL")
+    parser.add_argument("--arrival", choices=["constant", "poisson", "burst"], default="burst",
+                        help="Arrival process")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="Requests per second for constant/poisson arrivals")
+    parser.add_argument("--burst-size", type=int, default=30,
+                        help="Users sending at once in a classroom burst")
+    parser.add_argument("--burst-interval", type=float, default=60.0,
+                        help="Seconds between bursts")
+    parser.add_argument("--burst-spread", type=float, default=2.0,
+                        help="Reaction-time window in seconds within a burst")
+    parser.add_argument("--requests", type=int, default=30, help="Total number of requests")
+    parser.add_argument("--stream-ratio", type=float, default=1.0,
+                        help="Fraction of requests sent to /api/chat/stream")
+    parser.add_argument("--mix", default="short=0.5,medium=0.35,long=0.15",
+                        help="Prompt length mix over the built-in prompt set")
+    parser.add_argument("--replay", help="Replay prompts from a JSONL request log")
+    parser.add_argument("--max-tokens", default="64:256",
+                        help="max_tokens per request, N or LOW:HIGH")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Compare against a saved report")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change flagged as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main function"""
+    args = parse_args(argv)
+
+    print(f"Running {args.requests} requests ({args.arrival}) against {args.url}...",
+          file=sys.stderr)
+    results, duration = asyncio.run(run_load(args))
+    report = build_report(results, duration, args)
+
+    exit_code = 0
+    if args.baseline:
+        baseline = load_json(Path(args.baseline))
+        comparison = compare_to_baseline(
+            comparable_metrics(report),
+            comparable_metrics(baseline),
+            HIGHER_IS_BETTER,
+            args.threshold,
+        )
+        report["baseline_comparison"] = comparison
+        print(f"\nComparison against {args.baseline}:", file=sys.stderr)
+        if print_regressions(comparison):
+            exit_code = 1
+
+    write_json(report, Path(args.output) if args.output else None)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Soak Test - Drive the server for hours and watch for slow resource growth
+Samples RSS, open file descriptors, threads and latency percentiles over time
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import psutil
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.load_generator import (
+    DEFAULT_PROMPTS,
+    PromptSpec,
+    RequestResult,
+    load_replay_prompts,
+    parse_range,
+    send_chat,
+    send_stream,
+)
+from benchmarks.stats import percentile, write_json
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+
+def linear_slope(xs: List[float], ys: List[float]) -> Optional[float]:
+    """
+    Least-squares slope of ys over xs.
+
+    Args:
+        xs: Sample times
+        ys: Sample values
+
+    Returns:
+        Slope in units of y per unit of x, or None with fewer than two points
+    """
+    points = [(x, y) for x, y in zip(xs, ys) if y is not None]
+    if len(points) < 2:
+        return None
+
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    return cov / var_x
+
+
+def open_fd_count(proc: psutil.Process) -> Optional[int]:
+    """Open file descriptors (or handles on Windows) of a process."""
+    try:
+        if hasattr(proc, "num_fds"):
+            return proc.num_fds()
+        return proc.num_handles()
+    except psutil.Error:
+        return None
+
+
+def spawn_server(args: argparse.Namespace) -> subprocess.Popen:
+    """
+    Start server.py as a child process.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        The server process
+    """
+    env = dict(os.environ)
+    env["PORT"] = str(args.port)
+    if args.backend:
+        env["INFERENCE_BACKEND"] = args.backend
+
+    return subprocess.Popen(
+        [sys.executable, "server.py"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float) -> bool:
+    """Poll /ready until the model is loaded."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await client.get("/ready")
+            if response.status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(1.0)
+    return False
+
+
+class SoakRun:
+    """Traffic driver and resource sampler for one soak test."""
+
+    def __init__(self, args: argparse.Namespace, proc: psutil.Process):
+        """
+        Initialize the soak run.
+
+        Args:
+            args: Parsed command line arguments
+            proc: Server process to sample
+        """
+        self.args = args
+        self.proc = proc
+        self.rng = random.Random(args.seed)
+        self.samples: List[Dict] = []
+        self.window: List[RequestResult] = []
+        self.totals = {"ok": 0, "rejected": 0, "error": 0, "cancelled": 0}
+
+        if args.replay:
+            self.prompts = load_replay_prompts(Path(args.replay))
+        else:
+            self.prompts = [p for group in DEFAULT_PROMPTS.values() for p in group]
+        self.token_range = parse_range(args.max_tokens)
+
+    async def one_request(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore):
+        """Send a single randomly chosen request."""
+        async with semaphore:
+            spec = PromptSpec(self.rng.choice(self.prompts)[:4096], self.rng.randint(*self.token_range))
+            if self.rng.random() < self.args.stream_ratio:
+                cancel_after = None
+                if self.rng.random() < self.args.cancel_ratio:
+                    cancel_after = self.rng.randint(1, max(1, spec.max_tokens // 2))
+                result = await send_stream(client, spec, cancel_after=cancel_after)
+                if result.cancelled and result.status == "ok":
+                    self.totals["cancelled"] += 1
+            else:
+                result = await send_chat(client, spec)
+
+            self.totals[result.status] += 1
+            self.window.append(result)
+
+    async def drive_traffic(self, client: httpx.AsyncClient, end: float):
+        """Issue Poisson-distributed requests until the end time."""
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        pending = set()
+        while time.monotonic() < end:
+            await asyncio.sleep(self.rng.expovariate(self.args.rate))
+            task = asyncio.create_task(self.one_request(client, semaphore))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending, timeout=self.args.timeout)
+
+    def take_sample(self, elapsed: float):
+        """Record resource usage and the latency window since the last sample."""
+        window, self.window = self.window, []
+        ok = [r for r in window if r.status == "ok"]
+        e2e = [r.e2e for r in ok if r.e2e is not None]
+        ttft = [r.ttft for r in ok if r.endpoint == "stream" and r.ttft is not None]
+
+        try:
+            with self.proc.oneshot():
+                rss_mb = self.proc.memory_info().rss / (1024 * 1024)
+                threads = self.proc.num_threads()
+            fds = open_fd_count(self.proc)
+        except psutil.Error:
+            rss_mb, threads, fds = None, None, None
+
+        sample = {
+            "elapsed_hours": elapsed / 3600.0,
+            "rss_mb": rss_mb,
+            "open_fds": fds,
+            "threads": threads,
+            "requests": len(window),
+            "errors": sum(1 for r in window if r.status == "error"),
+            "p50_latency": percentile(e2e, 50),
+            "p95_latency": percentile(e2e, 95),
+            "p95_ttft": percentile(ttft, 95),
+        }
+        self.samples.append(sample)
+        print(f"[{elapsed / 60:7.1f} min] rss={rss_mb or 0:8.1f} MB fds={fds} threads={threads} "
+              f"reqs={len(window)} p95={sample['p95_latency']}", file=sys.stderr)
+
+    async def sample_resources(self, start: float, end: float):
+        """Sample the server process at a fixed interval until the end time."""
+        while time.monotonic() < end:
+            await asyncio.sleep(min(self.args.interval, max(0.0, end - time.monotonic())))
+            self.take_sample(time.monotonic() - start)
+
+    async def run(self) -> bool:
+        """
+        Run the soak test.
+
+        Returns:
+            bool: True if the server became ready and traffic ran
+        """
+        timeout = httpx.Timeout(self.args.timeout, connect=10.0)
+        async with httpx.AsyncClient(base_url=self.args.url, timeout=timeout) as client:
+            if not await wait_until_ready(client, self.args.ready_timeout):
+                print("[X] Server did not become ready", file=sys.stderr)
+                return False
+
+            start = time.monotonic()
+            end = start + self.args.duration * 60.0
+            self.take_sample(0.0)
+            await asyncio.gather(
+                self.drive_traffic(client, end),
+                self.sample_resources(start, end),
+            )
+        return True
+
+    def evaluate(self) -> Dict[str, dict]:
+        """
+        Fit growth slopes after the warmup period and check them against limits.
+
+        Returns:
+            Mapping of metric name to slope (per hour), limit and pass flag
+        """
+        warmup_hours = self.args.warmup / 60.0
+        steady = [s for s in self.samples if s["elapsed_hours"] >= warmup_hours]
+        hours = [s["elapsed_hours"] for s in steady]
+
+        limits = {
+            "rss_mb": self.args.max_rss_slope,
+            "open_fds": self.args.max_fd_slope,
+            "threads": self.args.max_thread_slope,
+            "p95_latency": self.args.max_p95_slope,
+        }
+
+        checks = {}
+        for metric, limit in limits.items():
+            slope = linear_slope(hours, [s[metric] for s in steady])
+            checks[metric] = {
+                "slope_per_hour": slope,
+                "limit_per_hour": limit,
+                "passed": slope is None or slope <= limit,
+            }
+        return checks
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Campus AI Chat soak test")
+    parser.add_argument("--url", help="Base URL of an already running server")
+    parser.add_argument("--pid", type=int, help="PID of the running server process to sample")
+    parser.add_argument("--spawn", action="store_true",
+                        help="Start server.py as a child process and sample it")
+    parser.add_argument("--backend", choices=["llama", "stub"],
+                        help="INFERENCE_BACKEND for a spawned server")
+    parser.add_argument("--port", type=int, default=8090, help="Port for a spawned server")
+    parser.add_argument("--duration", type=float, default=240.0, help="Test length in minutes")
+    parser.add_argument("--warmup", type=float, default=10.0,
+                        help="Minutes excluded from slope fitting")
+    parser.add_argument("--interval", type=float, default=60.0, help="Sampling interval in seconds")
+    parser.add_argument("--rate", type=float, default=0.5, help="Mean requests per second")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum in-flight requests")
+    parser.add_argument("--stream-ratio", type=float, default=0.8,
+                        help="Fraction of requests that stream")
+    parser.add_argument("--cancel-ratio", type=float, default=0.1,
+                        help="Fraction of streams the client abandons mid-answer")
+    parser.add_argument("--replay", help="Replay prompts from a JSONL request log")
+    parser.add_argument("--max-tokens", default="32:256", help="max_tokens per request, N or LOW:HIGH")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout")
+    parser.add_argument("--ready-timeout", type=float, default=600.0,
+                        help="Seconds to wait for the model to load")
+    parser.add_argument("--max-rss-slope", type=float, default=50.0, help="Allowed RSS growth, MB/hour")
+    parser.add_argument("--max-fd-slope", type=float, default=5.0, help="Allowed fd growth per hour")
+    parser.add_argument("--max-thread-slope", type=float, default=2.0,
+                        help="Allowed thread growth per hour")
+    parser.add_argument("--max-p95-slope", type=float, default=0.5,
+                        help="Allowed p95 latency growth, seconds/hour")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    if not args.spawn and args.pid is None:
+        parser.error("pass --pid of a running server or --spawn")
+    if args.url is None:
+        args.url = f"http://localhost:{args.port}" if args.spawn else "http://localhost:8080"
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Main function"""
+    args = parse_args(argv)
+
+    child = spawn_server(args) if args.spawn else None
+    try:
+        proc = psutil.Process(child.pid if child else args.pid)
+        soak = SoakRun(args, proc)
+        ready = asyncio.run(soak.run())
+    finally:
+        if child:
+            child.terminate()
+            try:
+                child.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                child.kill()
+
+    if not ready:
+        return 2
+
+    checks = soak.evaluate()
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "duration_minutes": args.duration,
+            "rate": args.rate,
+            "concurrency": args.concurrency,
+            "stream_ratio": args.stream_ratio,
+            "cancel_ratio": args.cancel_ratio,
+            "backend": args.backend,
+        },
+        "totals": soak.totals,
+        "checks": checks,
+        "samples": soak.samples,
+    }
+    write_json(report, Path(args.output) if args.output else None)
+
+    failed = [name for name, check in checks.items() if not check["passed"]]
+    for name in failed:
+        check = checks[name]
+        print(f"[X] {name} grew {check['slope_per_hour']:.3f}/hour "
+              f"(limit {check['limit_per_hour']}/hour)", file=sys.stderr)
+    if not failed:
+        print("[OK] No resource growth or latency drift beyond limits", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Shared statistics and baseline comparison helpers for the benchmark suites."""
+
+import json
+import math
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """
+    Compute a percentile using linear interpolation between closest ranks.
+
+    Args:
+        values: Sample values (need not be sorted)
+        pct: Percentile in the range 0-100
+
+    Returns:
+        The percentile value, or None if there are no samples
+    """
+    if not values:
+        return None
+
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+
+    rank = (pct / 100.0) * (len(ordered) - 1)
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return ordered[int(rank)]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: Iterable[float]) -> Dict[str, Optional[float]]:
+    """
+    Summarize a latency distribution.
+
+    Args:
+        values: Sample values in seconds
+
+    Returns:
+        Dictionary with count, mean, p50, p95, p99 and max
+    """
+    samples = [v for v in values if v is not None]
+    if not samples:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "p99": None, "max": None}
+
+    return {
+        "count": len(samples),
+        "mean": sum(samples) / len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "max": max(samples),
+    }
+
+
+def flatten_metrics(report: dict, prefix: str = "") -> Dict[str, float]:
+    """
+    Flatten the numeric leaves of a nested report into dotted keys.
+
+    Args:
+        report: Nested report dictionary
+        prefix: Key prefix used during recursion
+
+    Returns:
+        Mapping of dotted metric names to numeric values
+    """
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare_to_baseline(current: Dict[str, float], baseline: Dict[str, float],
+                        higher_is_better: Iterable[str],
+                        threshold: float = 0.10) -> Dict[str, dict]:
+    """
+    Compare metrics against a stored baseline and flag regressions.
+
+    Metrics whose name ends with one of ``higher_is_better`` regress when
+    they drop; every other metric regresses when it grows.
+
+    Args:
+        current: Flattened metrics from the current run
+        baseline: Flattened metrics from the baseline run
+        higher_is_better: Metric name suffixes where larger values are better
+        threshold: Relative change tolerated before flagging (0.10 = 10%)
+
+    Returns:
+        Mapping of metric name to baseline, current, relative change and
+        regression flag, for metrics present in both runs
+    """
+    suffixes = tuple(higher_is_better)
+    comparison = {}
+
+    for name, base_value in baseline.items():
+        if name not in current:
+            continue
+        value = current[name]
+        if base_value == 0:
+            change = 0.0 if value == 0 else math.inf
+        else:
+            change = (value - base_value) / abs(base_value)
+
+        if name.endswith(suffixes):
+            regressed = change < -threshold
+        else:
+            regressed = change > threshold
+
+        comparison[name] = {
+            "baseline": base_value,
+            "current": value,
+            "change": change,
+            "regression": regressed,
+        }
+
+    return comparison
+
+
+def load_json(path: Path) -> dict:
+    """Load a JSON report from disk."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(report: dict, path: Optional[Path]):
+    """
+    Write a JSON report to disk, or to stdout when no path is given.
+
+    Args:
+        report: Report dictionary
+        path: Output file path, or None for stdout
+    """
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path is None:
+        print(text)
+        return
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+
+
+def print_regressions(comparison: Dict[str, dict]) -> int:
+    """
+    Print a baseline comparison table.
+
+    Args:
+        comparison: Output of compare_to_baseline
+
+    Returns:
+        Number of regressions found
+    """
+    regressions = 0
+    for name in sorted(comparison):
+        entry = comparison[name]
+        marker = "REGRESSION" if entry["regression"] else "ok"
+        if entry["regression"]:
+            regressions += 1
+        print(f"  {marker:10} {name}: {entry['baseline']:.4f} -> "
+              f"{entry['current']:.4f} ({entry['change'] * 100:+.1f}%)", file=sys.stderr)
+    return regressions
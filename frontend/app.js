@@ -305,6 +305,42 @@ async function streamResponse(prompt, messageId) {
         </div>
     `;
     const textEl = contentEl.querySelector('.message-text');
+    let eventType = 'message';
+    let dataLines = [];
+
+    // Handle one complete event; multi-line data arrives as several data: lines
+    const dispatchEvent = () => {
+        const data = dataLines.join('\n');
+        if (eventType === 'done') {
+            console.log('✅ Stream complete', data);
+            // Answers cut short because the model kept repeating itself get a note
+            if (JSON.parse(data).finish_reason === 'repetition') {
+                textEl.insertAdjacentHTML('beforeend',
+                    '<p><em>(Stopped early: the answer started repeating itself.)</em></p>');
+            }
+        } else if (eventType === 'error') {
+            console.error('❌ Stream error', data);
+        } else if (eventType === 'warmup') {
+            // Model was asleep after an idle period; show a notice until tokens arrive
+            if (!fullText) {
+                textEl.innerHTML = '<em>Waking up the model, this may take a moment...</em>';
+            }
+        } else if (eventType === 'message' && dataLines.length) {
+            fullText += data;
+
+            // Update with rendered markdown
+            textEl.innerHTML = renderMarkdown(fullText);
+
+            // Apply syntax highlighting
+            textEl.querySelectorAll('pre code').forEach((block) => {
+                hljs.highlightElement(block);
+            });
+
+            scrollToBottom(); // Smart scroll during streaming
+        }
+        eventType = 'message';
+        dataLines = [];
+    };
 
     while (true) {
         const { done, value } = await reader.read();
@@ -317,31 +353,17 @@ async function streamResponse(prompt, messageId) {
         const lines = buffer.split('\n');
         buffer = lines.pop() || ''; // Keep incomplete line in buffer
 
-        for (const line of lines) {
-            if (!line.trim()) continue;
+        for (let line of lines) {
+            if (line.endsWith('\r')) line = line.slice(0, -1);
 
             // Parse SSE format
-            if (line.startsWith('data: ')) {
-                const token = line.slice(6); // Remove 'data: ' prefix
-
-                // Unescape newlines
-                const unescaped = token.replace(/\\n/g, '\n').replace(/\\r/g, '\r');
-
-                fullText += unescaped;
-
-                // Update with rendered markdown
-                textEl.innerHTML = renderMarkdown(fullText);
-
-                // Apply syntax highlighting
-                textEl.querySelectorAll('pre code').forEach((block) => {
-                    hljs.highlightElement(block);
-                });
-
-                scrollToBottom(); // Smart scroll during streaming
-            } else if (line.startsWith('event: done')) {
-                console.log('✅ Stream complete');
-            } else if (line.startsWith('event: error')) {
-                console.error('❌ Stream error');
+            if (line === '') {
+                dispatchEvent(); // Blank line ends an event
+            } else if (line.startsWith('event:')) {
+                eventType = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                const value = line.slice(5);
+                dataLines.push(value.startsWith(' ') ? value.slice(1) : value);
             }
         }
     }
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Offline Batch Inference - Run a JSONL file of prompts without the HTTP server
+Spreads prompts over worker processes, each with its own model context, and
+checkpoints results so an interrupted run continues where it stopped
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.inference.batch import BatchJobError, load_checkpoint, parse_prompt_file
+from src.utils.config import settings
+
+
+def default_workers() -> int:
+    """Default worker count: one per four cores."""
+    return max(1, (os.cpu_count() or 1) // 4)
+
+
+def make_blocks(items: list, workers: int, block_size: int) -> list:
+    """
+    Group prompts into blocks that a worker runs back to back.
+
+    Prompts are sorted so ones sharing a prefix land in the same block and
+    reuse its evaluated KV state.
+    """
+    items = sorted(items, key=lambda item: item["prompt"])
+    if block_size <= 0:
+        block_size = max(1, min(16, len(items) // (workers * 4) or 1))
+    return [items[i:i + block_size] for i in range(0, len(items), block_size)]
+
+
+def worker(worker_id: int, model_path: str, threads: int, options: dict, tasks, results):
+    """
+    Load a model and run blocks of prompts until the task queue is drained.
+
+    Runs in its own process; reports ("ready" | "failed" | "result" | "done", worker_id, payload).
+    """
+    from src.inference.batch import run_prompt
+    from src.inference.engine import ModelEngine
+    from src.utils.logger import logger
+
+    logger.setLevel(logging.WARNING)
+    # Each worker gets a share of the cores and none of the server-only features
+    settings.n_threads = threads
+    settings.n_threads_batch = threads
+    settings.autotune = False
+    settings.idle_unload_seconds = 0
+    settings.kv_cache_enabled = False
+    settings.prewarm_mode = "off"
+
+    engine = ModelEngine(model_path)
+    if not engine.load_model():
+        results.put(("failed", worker_id, engine.load_error))
+        return
+    results.put(("ready", worker_id, None))
+
+    while True:
+        block = tasks.get()
+        if block is None:
+            break
+        for item in block:
+            results.put(("result", worker_id, run_prompt(engine, item, **options)))
+    results.put(("done", worker_id, None))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through the model offline")
+    parser.add_argument("input", help="JSONL with a \"prompt\" (or \"title\"/\"body\") per line")
+    parser.add_argument("-o", "--output", help="Results JSONL (default: <input>.results.jsonl)")
+    parser.add_argument("--model", default=settings.model_path, help="Model file or directory")
+    parser.add_argument("--workers", type=int, default=default_workers(),
+                        help="Worker processes, each with its own context")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Threads per worker (default: cores / workers)")
+    parser.add_argument("--block-size", type=int, default=0,
+                        help="Prompts a worker takes at a time (default: automatic)")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Default maximum tokens per response")
+    parser.add_argument("--temperature", type=float, default=None, help="Default sampling temperature")
+    parser.add_argument("--top-p", type=float, default=None, help="Default nucleus sampling parameter")
+    args = parser.parse_args()
+
+    input_path = Path(args.input)
+    output_path = Path(args.output) if args.output else input_path.with_suffix(".results.jsonl")
+    model_path = Path(args.model)
+    if not model_path.is_absolute():
+        model_path = PROJECT_ROOT / model_path
+
+    try:
+        items = parse_prompt_file(input_path.read_text(encoding="utf-8"))
+    except (OSError, BatchJobError) as e:
+        print(f"[X] {e}")
+        return 1
+
+    done = load_checkpoint(output_path)
+    pending = [item for item in items if item["index"] not in done]
+    if done:
+        print(f"Resuming: {len(done)} of {len(items)} prompts already in {output_path}")
+    if not pending:
+        print("[OK] Nothing to do")
+        return 0
+
+    workers = max(1, min(args.workers, len(pending)))
+    threads = args.threads or max(1, (os.cpu_count() or 1) // workers)
+    blocks = make_blocks(pending, workers, args.block_size)
+    options = {"max_tokens": args.max_tokens, "temperature": args.temperature, "top_p": args.top_p}
+    print(f"Running {len(pending)} prompts on {workers} worker(s) x {threads} threads "
+          f"({len(blocks)} blocks)")
+
+    context = multiprocessing.get_context("spawn")
+    tasks = context.Queue()
+    results = context.Queue()
+    for block in blocks:
+        tasks.put(block)
+    for _ in range(workers):
+        tasks.put(None)
+
+    processes = [
+        context.Process(target=worker, args=(i, str(model_path), threads, options, tasks, results),
+                        daemon=True)
+        for i in range(workers)
+    ]
+    start = time.time()
+    for process in processes:
+        process.start()
+
+    finished = ready = written = failed = completion_tokens = 0
+    generation_start = None
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            while finished < workers:
+                try:
+                    kind, worker_id, payload = results.get(timeout=1.0)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in processes):
+                        print("\n[X] Workers exited unexpectedly")
+                        break
+                    continue
+
+                if kind == "ready":
+                    ready += 1
+                    generation_start = generation_start or time.time()
+                elif kind == "failed":
+                    print(f"\n[X] Worker {worker_id} failed to load the model: {payload}")
+                    finished += 1
+                elif kind == "done":
+                    finished += 1
+                elif kind == "result":
+                    out.write(json.dumps(payload) + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())
+                    written += 1
+                    if "error" in payload:
+                        failed += 1
+                    else:
+                        completion_tokens += (payload.get("timings") or {}).get("completion_tokens") or 0
+                    elapsed = time.time() - (generation_start or start)
+                    print(f"\r  {written}/{len(pending)} prompts, "
+                          f"{completion_tokens / elapsed if elapsed > 0 else 0:.1f} tokens/s", end="", flush=True)
+    except KeyboardInterrupt:
+        print(f"\n[X] Interrupted; {written} results saved, rerun to continue")
+        for process in processes:
+            process.terminate()
+        return 130
+
+    for process in processes:
+        process.join(timeout=5)
+
+    total = time.time() - start
+    generation = time.time() - (generation_start or start)
+    print()
+    print("=" * 60)
+    print(f"Prompts:            {written} ({failed} failed), {len(pending) - written} not run")
+    print(f"Completion tokens:  {completion_tokens}")
+    print(f"Wall time:          {total:.1f}s (model load {total - generation:.1f}s)")
+    print(f"Throughput:         {completion_tokens / generation if generation > 0 else 0:.1f} tokens/s, "
+          f"{written / generation * 60 if generation > 0 else 0:.1f} prompts/min")
+    print("=" * 60)
+    print(f"[OK] Results in {output_path}" if written == len(pending) else "[X] Incomplete; rerun to continue")
+    return 0 if written == len(pending) and ready else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
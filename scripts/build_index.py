@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Retrieval Index Builder - Chunk course documents and embed them with the local model
+Writes the memory-mapped vector index that chat requests with "retrieve" search
+"""
+
+import argparse
+import logging
+import math
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.inference.embeddings import EmbeddingError, EmbeddingModel
+from src.inference.retrieval import TEXT_SUFFIXES, chunk_text, write_index
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+def find_documents(paths: list) -> list:
+    """Text documents under the given files and directories, in a stable order."""
+    documents = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            documents.extend(sorted(p for p in path.rglob("*") if p.suffix.lower() in TEXT_SUFFIXES))
+        elif path.is_file():
+            documents.append(path)
+        else:
+            print(f"[X] Not found: {path}")
+    return documents
+
+
+def resolve_model(model: str) -> Path:
+    """Model file to embed with; a directory means its first .gguf file."""
+    path = Path(model)
+    if not path.is_absolute():
+        path = PROJECT_ROOT / path
+    if path.is_dir():
+        gguf_files = sorted(path.glob("*.gguf"))
+        if not gguf_files:
+            raise FileNotFoundError(f"No .gguf files found in {path}")
+        path = gguf_files[0]
+    if not path.is_file():
+        raise FileNotFoundError(f"Model not found: {path}")
+    return path
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Build the retrieval index from course documents")
+    parser.add_argument("paths", nargs="+", help=f"Files or directories ({', '.join(TEXT_SUFFIXES)})")
+    parser.add_argument("-o", "--output", default=settings.retrieval_index_dir, help="Index directory")
+    parser.add_argument("--model", default=settings.embedding_model_path or settings.model_path,
+                        help="Embedding model file or directory")
+    parser.add_argument("--chunk-chars", type=int, default=settings.retrieval_chunk_chars,
+                        help="Target passage length in characters")
+    parser.add_argument("--overlap", type=int, default=settings.retrieval_chunk_overlap,
+                        help="Characters repeated between neighbouring passages")
+    parser.add_argument("--ivf-lists", type=int, default=-1,
+                        help="IVF partitions (0 = exhaustive search; default: sqrt(chunks) above 20k chunks)")
+    parser.add_argument("--batch", type=int, default=64, help="Passages per embedding call")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+
+    documents = find_documents(args.paths)
+    chunks = []
+    for document in documents:
+        try:
+            text = document.read_text(encoding="utf-8", errors="replace")
+        except OSError as e:
+            print(f"[X] {document}: {e}")
+            continue
+        for number, passage in enumerate(chunk_text(text, args.chunk_chars, args.overlap)):
+            chunks.append({"source": str(document), "chunk": number, "text": passage})
+    if not chunks:
+        print("[X] No text found")
+        return 1
+    print(f"Chunked {len(documents)} documents into {len(chunks)} passages")
+
+    try:
+        model_path = resolve_model(args.model)
+    except FileNotFoundError as e:
+        print(f"[X] {e}")
+        return 1
+
+    import numpy as np
+
+    embedder = EmbeddingModel(settings.embedding_batch_tokens)
+    vectors = None
+    tokens = 0
+    start = time.time()
+    try:
+        for i in range(0, len(chunks), args.batch):
+            batch, timings = embedder.embed([c["text"] for c in chunks[i:i + args.batch]], model_path)
+            if vectors is None:
+                vectors = np.zeros((len(chunks), batch.shape[1]), dtype=np.float32)
+            vectors[i:i + len(batch)] = batch
+            tokens += timings["tokens"]
+            done = i + len(batch)
+            elapsed = time.time() - start
+            print(f"\r  Embedded {done}/{len(chunks)} passages, {tokens / elapsed:.0f} tokens/s",
+                  end="", flush=True)
+    except (EmbeddingError, OSError, ValueError) as e:
+        print(f"\n[X] Embedding failed: {e}")
+        return 1
+    except KeyboardInterrupt:
+        print("\n[X] Interrupted; index not written")
+        return 130
+    print()
+
+    n_lists = args.ivf_lists
+    if n_lists < 0:
+        n_lists = int(math.sqrt(len(chunks))) if len(chunks) > 20000 else 0
+    info = write_index(Path(args.output), chunks, vectors, model_path, n_lists)
+
+    print("=" * 60)
+    print(f"Passages:    {info['count']} from {info['sources']} documents")
+    print(f"Vectors:     {info['dim']} dims, {info['count'] * info['dim'] * 4 / 1024 ** 2:.1f} MB")
+    print(f"Search:      {f'IVF, {n_lists} lists' if n_lists else 'exhaustive'}")
+    print(f"Embed time:  {time.time() - start:.1f}s")
+    print("=" * 60)
+    print(f"[OK] Index written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Model Prewarm Utility - Pull model weights into the OS page cache
+Run ahead of a scheduled class (e.g. from cron) so the next server start loads from RAM
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.inference.prewarm import PREWARM_MODES, prewarm_file
+
+
+def resolve_model(path: Path) -> Path:
+    """Resolve a model file or a directory containing .gguf files."""
+    if path.is_dir():
+        gguf_files = sorted(path.glob("*.gguf"))
+        if not gguf_files:
+            raise FileNotFoundError(f"No .gguf files found in {path}")
+        return gguf_files[0]
+    if not path.exists():
+        raise FileNotFoundError(f"Model not found: {path}")
+    return path
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description="Prewarm a model file into the page cache")
+    parser.add_argument("model", nargs="?", default="models", help="Model file or directory")
+    parser.add_argument("--mode", choices=[m for m in PREWARM_MODES if m != "off"], default="read",
+                        help="read = parallel read (blocks until cached), advise = kernel hint only")
+    parser.add_argument("--threads", type=int, default=4, help="Parallel reader threads")
+    args = parser.parse_args()
+
+    model = Path(args.model)
+    if not model.is_absolute():
+        model = PROJECT_ROOT / model
+
+    try:
+        model = resolve_model(model)
+    except FileNotFoundError as e:
+        print(f"[X] {e}")
+        return 1
+
+    total_mb = model.stat().st_size / (1024 * 1024)
+    print(f"Prewarming {model.name} ({total_mb:.0f} MB, mode={args.mode}, threads={args.threads})")
+
+    shown = [-1]
+
+    def on_progress(done: int, total: int):
+        percent = done * 100 // max(1, total)
+        if percent != shown[0]:
+            shown[0] = percent
+            print(f"\r  {percent:3d}%", end="", flush=True)
+
+    try:
+        result = prewarm_file(model, args.mode, args.threads, progress_callback=on_progress)
+    except OSError as e:
+        print(f"\n[X] Prewarm failed: {e}")
+        return 1
+
+    print()
+    if result["mb_per_s"]:
+        print(f"[OK] Cached {result['bytes'] / (1024 * 1024):.0f} MB in {result['seconds']:.1f}s "
+              f"({result['mb_per_s']:.0f} MB/s)")
+    else:
+        print("[OK] Readahead requested; the kernel continues loading in the background")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,9 +6,15 @@ from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import uvicorn
 
+from src.api.admin_routes import router as admin_router
+from src.api.batch_routes import router as batch_router
+from src.api.embedding_routes import router as embedding_router
 from src.api.routes import router
 from src.api.streaming_routes import router as streaming_router
+from src.api.ws_routes import router as ws_router
+from src.inference.batch import batch_manager
 from src.inference.engine import model_engine
+from src.inference.warmup import mine_warmup_prompts
 from src.utils.config import settings
 from src.utils.logger import logger
 
@@ -27,24 +33,27 @@ async def lifespan(app: FastAPI):
     logger.info("=" * 60)
     logger.info(f"Server: {settings.host}:{settings.port}")
     logger.info(f"Model: {settings.model_path}")
-    logger.info("Loading model... This may take a few minutes.")
+    logger.info("Loading model in the background... This may take a few minutes.")
+    logger.info("Chat requests return 503 until /ready reports the model is loaded.")
+    logger.info("=" * 60)
     
-    # Load model
-    success = model_engine.load_model()
+    # Prefixes from recorded traffic are replayed as the last load phase, before /ready
+    model_engine.warmup_prompts = mine_warmup_prompts()
     
-    if success:
-        logger.info("[OK] Model loaded successfully!")
-        logger.info(f"Ready to accept connections at http://{settings.host}:{settings.port}")
-    else:
-        logger.warning("[X] Model failed to load. Server will start but won't accept chat requests.")
-        logger.warning("Please check model path and configuration.")
+    # Load model without blocking startup, so the port opens immediately
+    model_engine.start_background_load()
     
-    logger.info("=" * 60)
+    # Run stored and newly submitted batch jobs whenever the model is idle
+    batch_manager.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down server...")
+    await batch_manager.stop()
+    if settings.kv_cache_enabled:
+        from src.inference.kv_cache import flush_all
+        flush_all()
     logger.info("Goodbye!")
 
 
@@ -68,6 +77,10 @@ app.add_middleware(
 # Include API routes FIRST (before static files)
 app.include_router(router)
 app.include_router(streaming_router)
+app.include_router(ws_router)
+app.include_router(admin_router)
+app.include_router(batch_router)
+app.include_router(embedding_router)
 
 # Mount static files for frontend LAST (catches all remaining routes)
 app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
@@ -0,0 +1,74 @@
+"""Admin API routes for managing the running server."""
+
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import BaseModel, Field
+from typing import Optional
+
+from src.inference.engine import model_engine
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(None)):
+    """
+    Allow admin requests carrying ADMIN_TOKEN, or from localhost when no token is set.
+
+    Raises:
+        HTTPException: 403 if the caller is not authorized
+    """
+    if settings.admin_token:
+        if not secrets.compare_digest(x_admin_token or "", settings.admin_token):
+            raise HTTPException(status_code=403, detail="Invalid admin token")
+        return
+
+    if request.client is None or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(
+            status_code=403,
+            detail="Admin API is only available from localhost unless ADMIN_TOKEN is set"
+        )
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+class SwapRequest(BaseModel):
+    """Model swap request."""
+    model_path: str = Field(..., min_length=1)
+    strategy: Optional[str] = Field(None, pattern="^(auto|side_by_side|sequential)$")
+
+
+@router.post("/model/swap", status_code=202)
+async def swap_model(request: SwapRequest):
+    """
+    Start loading a different model and switch to it without a restart.
+
+    Args:
+        request: Target model path and optional swap strategy
+
+    Returns:
+        dict: Initial swap status; poll GET /admin/model/swap or /status for progress
+    """
+    try:
+        status = model_engine.start_swap(request.model_path, request.strategy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    logger.info(f"Model swap requested: {request.model_path}")
+    return status
+
+
+@router.get("/model/swap")
+async def get_swap_status():
+    """
+    Get progress of the current or most recent model swap.
+
+    Returns:
+        dict: Swap status
+    """
+    return model_engine.get_swap_status()
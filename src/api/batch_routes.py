@@ -0,0 +1,122 @@
+"""Batch job API: submit JSONL prompt files, poll progress, download results."""
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from src.api.admin_routes import require_admin
+from src.inference.batch import BatchJob, BatchJobError, batch_manager
+from src.utils.logger import logger
+
+
+# Bulk jobs use the admin credentials (ADMIN_TOKEN, or localhost)
+router = APIRouter(prefix="/api/batch", dependencies=[Depends(require_admin)])
+
+
+def get_job(job_id: str) -> BatchJob:
+    """
+    Look up a job.
+
+    Raises:
+        HTTPException: 404 if there is no such job
+    """
+    job = batch_manager.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch job '{job_id}'")
+    return job
+
+
+@router.post("", status_code=202)
+async def submit_batch(
+    file: UploadFile = File(..., description="JSONL, one {\"prompt\": ...} object per line"),
+    model: Optional[str] = Query(None, max_length=256),
+    max_tokens: Optional[int] = Query(None, ge=1, le=1024),
+    temperature: Optional[float] = Query(None, ge=0.0, le=2.0),
+    top_p: Optional[float] = Query(None, ge=0.0, le=1.0)
+):
+    """
+    Queue a batch of prompts. Jobs run when the model has no interactive requests.
+
+    Args:
+        file: JSONL upload; lines may override max_tokens, temperature and top_p
+        model: Model to use, or None for the default model
+        max_tokens: Default maximum tokens per response
+        temperature: Default sampling temperature
+        top_p: Default nucleus sampling parameter
+
+    Returns:
+        dict: The new job's status; poll GET /api/batch/{id} for progress
+    """
+    data = await file.read()
+    try:
+        job = batch_manager.submit(data, model=model, max_tokens=max_tokens,
+                                   temperature=temperature, top_p=top_p)
+    except BatchJobError as e:
+        logger.warning(f"Batch rejected: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return job.as_status()
+
+
+@router.get("")
+async def list_batches():
+    """
+    List batch jobs, newest first.
+
+    Returns:
+        dict: Job statuses
+    """
+    jobs = sorted(batch_manager.jobs.values(), key=lambda j: j.created, reverse=True)
+    return {"jobs": [job.as_status() for job in jobs]}
+
+
+@router.get("/{job_id}")
+async def batch_status(job_id: str):
+    """
+    Get a job's progress.
+
+    Returns:
+        dict: Status, counts, progress fraction and throughput
+    """
+    return get_job(job_id).as_status()
+
+
+@router.get("/{job_id}/results")
+async def batch_results(job_id: str):
+    """
+    Stream the results finished so far as JSONL.
+
+    Lines are in completion order; "index" is the line's position in the
+    submitted file and "custom_id" is echoed back. Failed prompts carry
+    "error" instead of "response".
+
+    Returns:
+        StreamingResponse: application/x-ndjson
+    """
+    get_job(job_id)
+    path = batch_manager.results_path(job_id)
+
+    def read_lines():
+        if not path.exists():
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.endswith("\n"):  # skip a line still being written
+                    yield line
+
+    return StreamingResponse(
+        read_lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="batch-{job_id}.jsonl"'}
+    )
+
+
+@router.delete("/{job_id}")
+async def cancel_batch(job_id: str):
+    """
+    Cancel a job after its current prompt. Results so far are kept.
+
+    Returns:
+        dict: The job's status
+    """
+    get_job(job_id)
+    return batch_manager.cancel(job_id).as_status()
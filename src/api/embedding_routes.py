@@ -0,0 +1,111 @@
+"""Embedding API: vectors for many texts per call, as JSON or packed floats."""
+
+import asyncio
+import json
+from pathlib import Path
+from typing import List, Union
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel, Field, field_validator
+
+from src.api.routes import MAX_PROMPT_CHARS
+from src.inference.embeddings import EmbeddingError, InputTooLongError, embedding_model
+from src.inference.engine import model_engine
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+router = APIRouter()
+
+
+class EmbeddingRequest(BaseModel):
+    """Embedding request model."""
+    input: Union[str, List[str]]
+    normalize: bool = True  # unit-length vectors, so a dot product is the cosine similarity
+    format: str = Field("json", pattern="^(json|float32|float16)$")
+    truncate: bool = True  # cut inputs over EMBEDDING_BATCH_TOKENS instead of failing
+
+    @field_validator("input")
+    @classmethod
+    def check_input(cls, value: Union[str, List[str]]) -> List[str]:
+        texts = [value] if isinstance(value, str) else value
+        if not texts:
+            raise ValueError("input is empty")
+        if len(texts) > settings.embedding_max_inputs:
+            raise ValueError(f"At most {settings.embedding_max_inputs} inputs per request")
+        if any(len(text) > MAX_PROMPT_CHARS for text in texts):
+            raise ValueError(f"Inputs are limited to {MAX_PROMPT_CHARS} characters")
+        return texts
+
+
+def embedding_model_file() -> Path:
+    """
+    Pick the GGUF file to embed with.
+
+    Raises:
+        HTTPException: 503 if no file is configured and the chat model is not loaded
+    """
+    if settings.embedding_model_path:
+        return Path(settings.embedding_model_path)
+    if model_engine.model_file is None:
+        raise HTTPException(
+            status_code=503,
+            detail="No embedding model: set EMBEDDING_MODEL_PATH or wait for the chat model to load",
+            headers={"Retry-After": str(model_engine.retry_after())}
+        )
+    return model_engine.model_file
+
+
+@router.post("/api/embeddings")
+async def create_embeddings(request: EmbeddingRequest):
+    """
+    Embed one or more texts.
+
+    With format "json" the vectors come back as lists in input order. With
+    "float32" or "float16" the body is the (count, dim) matrix as
+    little-endian floats, row-major; the shape is in the X-Embedding-Count
+    and X-Embedding-Dim headers and timings in X-Embedding-Timings.
+
+    Args:
+        request: Texts and output options
+
+    Returns:
+        dict or Response: Vectors with dimension, model and throughput timings
+    """
+    model_file = embedding_model_file()
+    logger.info(f"Embedding request received (inputs={len(request.input)})")
+
+    try:
+        vectors, timings = await asyncio.to_thread(
+            embedding_model.embed, request.input, model_file,
+            normalize=request.normalize, truncate=request.truncate
+        )
+    except InputTooLongError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (EmbeddingError, OSError, ValueError) as e:
+        logger.error(f"Embedding failed: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+    logger.info(f"Embedded {timings['texts']} texts ({timings['tokens']} tokens) in {timings['embed_s']:.2f}s")
+
+    count, dim = vectors.shape
+    if request.format != "json":
+        return Response(
+            content=vectors.astype("<f4" if request.format == "float32" else "<f2").tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Embedding-Count": str(count),
+                "X-Embedding-Dim": str(dim),
+                "X-Embedding-Dtype": request.format,
+                "X-Embedding-Timings": json.dumps(timings),
+            }
+        )
+
+    return {
+        "embeddings": vectors.tolist(),
+        "dim": dim,
+        "model": model_file.name,
+        "normalized": request.normalize,
+        "timings": timings,
+    }
@@ -1,47 +1,322 @@
 """API routes for the Campus AI Chat Platform."""
 
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional
-from src.inference.engine import model_engine
-from src.utils.queue import request_queue
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, Dict, List, Optional, Tuple
+from src.inference.batch import batch_manager
+from src.inference.embeddings import EmbeddingError, embedding_model
+from src.inference.engine import ModelEngine, model_engine
+from src.inference.grammar import GrammarError, GrammarSpec, grammar_cache
+from src.inference.prompt_budget import PromptTooLongError, fit_prompt, get_tokenizer
+from src.inference.registry import ModelBudgetError, UnknownModelError, model_registry
+from src.inference.repetition import repetition_stats
+from src.inference.retrieval import RetrievalError, ground_prompt, retriever
+from src.inference.warmup import record_prompt
+from src.utils.config import settings
+from src.utils.queue import RequestQueue, request_queue
 from src.utils.logger import logger
+import asyncio
 import time
 
 
 router = APIRouter()
 
+# Upper bound on request size; whether a prompt fits is decided in tokens by render_prompt()
+MAX_PROMPT_CHARS = 65536
+
+# Upper bound on a GBNF grammar in a request
+MAX_GRAMMAR_CHARS = 65536
+
+# Upper bound on the turns of a conversation in a request
+MAX_MESSAGES = 256
+
+# Upper bound on completions per request (n)
+MAX_COMPLETIONS = 8
+
+
+class ChatMessage(BaseModel):
+    """One turn of a conversation."""
+    role: str = Field(..., pattern="^(system|user|assistant)$")
+    content: str = Field(..., max_length=MAX_PROMPT_CHARS)
+
+
+def validate_chat_request(request: BaseModel) -> BaseModel:
+    """Validate that a request has a prompt or messages (not both), and no grammar with n > 1."""
+    if (request.prompt is None) == (not request.messages):
+        raise ValueError("Give either prompt or messages")
+    if request.n > 1 and (request.grammar or request.json_schema is not None):
+        raise ValueError("grammar and json_schema need n = 1")
+    return request
+
 
 class ChatRequest(BaseModel):
     """Chat request model."""
-    prompt: str = Field(..., min_length=1, max_length=4096)
+    prompt: Optional[str] = Field(None, min_length=1, max_length=MAX_PROMPT_CHARS)
+    messages: Optional[List[ChatMessage]] = Field(None, max_length=MAX_MESSAGES)  # or a whole conversation
     max_tokens: Optional[int] = Field(None, ge=1, le=1024)
     temperature: Optional[float] = Field(None, ge=0.0, le=2.0)
     top_p: Optional[float] = Field(None, ge=0.0, le=1.0)
+    model: Optional[str] = Field(None, max_length=256)
+    grammar: Optional[str] = Field(None, max_length=MAX_GRAMMAR_CHARS)  # GBNF the output must follow
+    json_schema: Optional[Dict[str, Any]] = None  # or a JSON schema the output must match
+    retrieve: Optional[int] = Field(None, ge=1, le=20)  # add the top passages from the course notes index
+    n: int = Field(1, ge=1, le=MAX_COMPLETIONS)  # alternative completions sharing one prompt evaluation
+
+    @model_validator(mode="after")
+    def check_input(self):
+        return validate_chat_request(self)
 
 
 class ChatResponse(BaseModel):
     """Chat response model."""
     response: str
+    choices: Optional[List[str]] = None  # all n completions; response is the first
     prompt_length: int
     response_length: int
     generation_time: float
+    timings: Optional[dict] = None
+
+
+def ensure_model_ready(engine: ModelEngine = model_engine):
+    """
+    Reject requests until the model is ready.
+    
+    Args:
+        engine: Engine that will serve the request
+    
+    Raises:
+        HTTPException: 503 with Retry-After while loading, or 503 if loading failed
+    """
+    if engine.model_loaded:
+        return
+    
+    if engine.load_state == "failed":
+        raise HTTPException(
+            status_code=503,
+            detail="Model failed to load. Check server logs."
+        )
+    
+    raise HTTPException(
+        status_code=503,
+        detail="Model is loading. Please retry shortly.",
+        headers={"Retry-After": str(engine.retry_after())}
+    )
+
+
+def resolve_model(name: Optional[str]) -> Tuple[ModelEngine, RequestQueue]:
+    """
+    Route a request to the engine for the named model, loading it on demand.
+    
+    Args:
+        name: Model requested by the client, or None for the default model
+        
+    Returns:
+        Tuple of (engine, queue) serving the model
+        
+    Raises:
+        HTTPException: 404 for an unknown model, 503 while the model is not ready
+        (a sleeping model is woken instead; callers wait for it with wait_for_model)
+    """
+    try:
+        engine, queue = model_registry.resolve(name)
+        model_registry.ensure_loaded(engine)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelBudgetError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    
+    if engine.sleep_mode is None:
+        ensure_model_ready(engine)
+    return engine, queue
+
+
+async def wait_for_model(engine: ModelEngine) -> bool:
+    """
+    Wait up to WAKE_TIMEOUT for a model that is waking, loading or was evicted.
+    
+    Raises:
+        HTTPException: 503 if busy models leave no room to load it again
+    """
+    try:
+        return await model_registry.wait_ready(engine, settings.wake_timeout)
+    except ModelBudgetError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
+
+def user_message(prompt: Optional[str], messages: Optional[List[ChatMessage]]) -> str:
+    """The request's latest user message: the prompt, or the last user turn."""
+    if prompt is not None:
+        return prompt
+    user_turns = [message.content for message in messages or [] if message.role == "user"]
+    return user_turns[-1] if user_turns else ""
+
+
+async def retrieve_passages(question: str, k: Optional[int]) -> Tuple[List[dict], dict]:
+    """
+    Find the course-note passages a request asked for.
+    
+    Args:
+        question: The user's latest message
+        k: Passages wanted, or None for no retrieval
+        
+    Returns:
+        Tuple of (passages, retrieval details for the response timings)
+        
+    Raises:
+        HTTPException: 503 if there is no usable index
+    """
+    if not k:
+        return [], {}
+    try:
+        return await asyncio.to_thread(retriever.retrieve, question, k)
+    except (RetrievalError, EmbeddingError, OSError) as e:
+        logger.warning(f"Retrieval failed: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def render_prompt(engine: ModelEngine, prompt: Optional[str], messages: Optional[List[ChatMessage]],
+                  max_tokens: int, passages: Optional[List[dict]] = None) -> Tuple[str, str, dict, Optional[str]]:
+    """
+    Render a request through the model's chat template, fitted to the context.
+    
+    Runs before the request takes a queue slot. Oversized conversations
+    lose their oldest exchanges first, then the latest user message is
+    truncated by PROMPT_BUDGET_STRATEGY; the template itself is never cut.
+    
+    Args:
+        engine: Engine that will serve the request
+        prompt: Single user message
+        messages: Conversation, used instead of prompt
+        max_tokens: Tokens reserved for the response
+        passages: Retrieved passages to put in front of the latest user message
+        
+    Returns:
+        Tuple of (prompt text for the model, the user's latest message for logs and warmup,
+        budget details for the response timings, the system turn that context shifting keeps)
+        
+    Raises:
+        HTTPException: 400 if the template rejects the conversation, or if the prompt
+        is too long and PROMPT_BUDGET_STRATEGY is "reject"
+    """
+    question = user_message(prompt, messages)
+    turns = [message.model_dump() for message in messages or []]
+    users = [i for i, turn in enumerate(turns) if turn["role"] == "user"]
+    last = users[-1] if users else None
+    if passages:
+        grounded = ground_prompt(question, passages, settings.retrieval_max_context_chars)
+        if prompt is not None:
+            prompt = grounded
+        else:
+            turns[last]["content"] = grounded
+    
+    # Older exchanges (a user turn and the replies to it), oldest first; system turns are kept
+    exchanges: List[List[int]] = []
+    for i, turn in enumerate(turns[:last] if last is not None else []):
+        if turn["role"] == "user" or (exchanges and turn["role"] != "system"):
+            if turn["role"] == "user":
+                exchanges.append([])
+            exchanges[-1].append(i)
+    
+    def render(content: str, dropped: int) -> str:
+        if prompt is not None:
+            return engine.format_prompt(content)
+        skip = {i for exchange in exchanges[:dropped] for i in exchange}
+        kept = [dict(turn, content=content) if i == last else turn
+                for i, turn in enumerate(turns) if i not in skip]
+        return engine.format_prompt(None, kept)
+    
+    content = prompt if prompt is not None else (turns[last]["content"] if last is not None else "")
+    tokenizer = None
+    if settings.prompt_budget_strategy != "off":
+        tokenizer = get_tokenizer(engine.model_file, fallback=engine.model)
+    try:
+        if tokenizer is None:
+            text, info = render(content, 0), {}
+        else:
+            n_ctx = engine.runtime_params.get("n_ctx") or settings.n_ctx
+            text, info = fit_prompt(tokenizer, render, content, n_ctx, max_tokens, history=len(exchanges))
+    except PromptTooLongError as e:
+        logger.warning(f"Prompt rejected ({e.prompt_tokens} tokens, budget {e.budget})")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if info.get("prompt_tokens_truncated"):
+        logger.info(f"Prompt truncated ({info['truncation']}): {info['budget_prompt_tokens']} -> "
+                    f"{info['budget_prompt_tokens'] - info['prompt_tokens_truncated']} tokens"
+                    + (f", {info['turns_dropped']} oldest exchanges dropped" if "turns_dropped" in info else ""))
+    return text, question, info, engine.system_prefix(text, turns if prompt is None else None)
+
+
+async def prepare_grammar(grammar: Optional[str],
+                          json_schema: Optional[Dict[str, Any]]) -> Tuple[Optional[GrammarSpec], dict]:
+    """
+    Compile a request's output grammar before it takes a queue slot.
+    
+    Compiling can take seconds, so it runs off the event loop.
+    
+    Args:
+        grammar: GBNF grammar text
+        json_schema: JSON schema
+        
+    Returns:
+        Tuple of (grammar spec or None, compile details for the response timings)
+        
+    Raises:
+        HTTPException: 400 if both are given or the grammar does not compile
+    """
+    try:
+        spec = GrammarSpec.from_request(grammar, json_schema)
+        if spec is None:
+            return None, {}
+        return spec, await asyncio.to_thread(grammar_cache.prepare, spec)
+    except GrammarError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/health")
 async def health_check():
     """
-    Health check endpoint.
+    Liveness endpoint. Answers as soon as the server is up, even while the
+    model is still loading; use /ready for readiness.
     
     Returns:
         dict: Health status
     """
     return {
         "status": "healthy",
-        "model_loaded": model_engine.model_loaded
+        "model_loaded": model_engine.model_loaded,
+        "load_state": model_engine.load_state
     }
 
 
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness endpoint. Returns 200 once the model can serve requests,
+    otherwise 503 with load progress.
+    
+    Returns:
+        dict: Readiness status and load progress
+    """
+    load_status = model_engine.get_load_status()
+    
+    if model_engine.model_loaded or model_engine.sleep_mode:
+        # A sleeping model wakes on the next request, so the node can still take traffic
+        return {"status": "ready", "load": load_status}
+    
+    headers = {}
+    if model_engine.load_state != "failed":
+        headers["Retry-After"] = str(model_engine.retry_after())
+    
+    return JSONResponse(
+        status_code=503,
+        content={"status": "not_ready", "load": load_status},
+        headers=headers
+    )
+
+
 @router.get("/status")
 async def get_status():
     """
@@ -57,11 +332,30 @@ async def get_status():
         "status": "running",
         "model": model_info,
         "queue": queue_status,
+        "load": model_engine.get_load_status(),
+        "swap": model_engine.get_swap_status(),
+        "models": model_registry.get_status(),
+        "batch": batch_manager.get_status(),
+        "grammar": grammar_cache.get_status(),
+        "embeddings": embedding_model.get_status(),
+        "retrieval": retriever.get_status(),
+        "repetition": repetition_stats.get_status(),
         "current_users": queue_status["active_requests"],
         "max_users": queue_status["max_concurrent"]
     }
 
 
+@router.get("/api/models")
+async def list_models():
+    """
+    List installed models and whether they are loaded.
+    
+    Returns:
+        dict: Registry status with memory budget and per-model state
+    """
+    return model_registry.get_status()
+
+
 @router.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -73,36 +367,74 @@ async def chat(request: ChatRequest):
     Returns:
         ChatResponse: Generated response with metadata
     """
-    if not model_engine.model_loaded:
-        raise HTTPException(
-            status_code=503, 
-            detail="Model not loaded. Server is starting up."
-        )
-    
-    try:
-        # Log request (just metadata, not full prompt for privacy)
-        logger.info(f"Chat request received (prompt_length={len(request.prompt)})")
-        
-        # Generate response
-        start_time = time.time()
-        response_text = model_engine.generate(
-            prompt=request.prompt,
-            max_tokens=request.max_tokens,
-            temperature=request.temperature,
-            top_p=request.top_p
-        )
-        generation_time = time.time() - start_time
-        
-        # Log completion
-        logger.info(f"Response generated in {generation_time:.2f}s")
-        
-        return ChatResponse(
-            response=response_text,
-            prompt_length=len(request.prompt),
-            response_length=len(response_text),
-            generation_time=generation_time
-        )
+    engine, queue = resolve_model(request.model)
+    # Pinned until generation holds a lease: the registry must not evict the model meanwhile
+    with engine.pin():
+        passages, retrieval = await retrieve_passages(user_message(request.prompt, request.messages),
+                                                      request.retrieve)
+        # Room for all n completions, which share the context
+        prompt, user_text, budget, system = render_prompt(engine, request.prompt, request.messages,
+                                                          (request.max_tokens or settings.max_tokens) * request.n,
+                                                          passages)
+        grammar, grammar_info = await prepare_grammar(request.grammar, request.json_schema)
+        if not await queue.acquire():
+            raise HTTPException(status_code=429, detail="Maximum concurrent users reached. Please try again later.")
         
-    except Exception as e:
-        logger.error(f"Error processing chat request: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        try:
+            if not engine.model_loaded and not await wait_for_model(engine):
+                ensure_model_ready(engine)
+            
+            # Log request (just metadata, not full prompt for privacy)
+            logger.info(f"Chat request received (prompt_length={len(user_text)})")
+            record_prompt(user_text)
+            
+            # Generate response off the event loop, so streams keep flowing meanwhile
+            start_time = time.time()
+            timings = {**budget, **grammar_info, **retrieval}
+            choices = None
+            if request.n > 1:
+                choices = await asyncio.to_thread(
+                    engine.generate_n,
+                    prompt=prompt,
+                    n=request.n,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature,
+                    top_p=request.top_p,
+                    timings=timings
+                )
+                response_text = choices[0]
+            else:
+                response_text = await asyncio.to_thread(
+                    engine.generate,
+                    prompt=prompt,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature,
+                    top_p=request.top_p,
+                    timings=timings,
+                    grammar=grammar,
+                    pinned_prefix=system
+                )
+            generation_time = time.time() - start_time
+            if grammar is not None:
+                grammar_cache.record_output(grammar, response_text, timings.get("finish_reason"),
+                                            timings.get("completion_tokens"))
+            
+            # Log completion
+            logger.info(f"Response generated in {generation_time:.2f}s")
+            
+            return ChatResponse(
+                response=response_text,
+                choices=choices,
+                prompt_length=len(user_text),
+                response_length=len(response_text),
+                generation_time=generation_time,
+                timings=timings
+            )
+            
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing chat request: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            await queue.release()
@@ -0,0 +1,66 @@
+"""Server-Sent Events transport: framing and time-window token coalescing."""
+
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Optional
+
+from src.inference.streaming import TokenBuffer
+
+
+_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+def format_event(data: str, event: Optional[str] = None) -> str:
+    """
+    Frame one SSE event.
+
+    Each line of data gets its own ``data:`` field, which clients join back
+    with newlines, so no escaping is needed.
+
+    Args:
+        data: Event payload, may contain newlines
+        event: Event name; omitted for the default "message" event
+
+    Returns:
+        The framed event, terminated by a blank line
+    """
+    header = f"event: {event}\n" if event else ""
+    return header + "".join(f"data: {line}\n" for line in _LINE_BREAK.split(data)) + "\n"
+
+
+async def coalesce(buffer: TokenBuffer, window_s: float, flush_bytes: int,
+                   take: Optional[Callable[[], Any]] = None) -> AsyncIterator[Any]:
+    """
+    Group streamed tokens into frames.
+
+    The first text is sent as soon as it arrives so time to first token is
+    unchanged. After each frame, text collects for window_s seconds, or until
+    flush_bytes are pending, before the next frame is sent. A window of 0
+    sends whatever is pending each time the event loop gets to it.
+
+    Args:
+        buffer: Buffer filled by the generation thread
+        window_s: Minimum seconds between frames
+        flush_bytes: Pending text that triggers a frame before the window ends
+        take: Drains the buffer; defaults to buffer.take (buffer.take_choices splits by completion)
+
+    Yields:
+        Text for one frame (or what take returns)
+    """
+    take = take or buffer.take
+    last_flush: Optional[float] = None
+    while not buffer.finished:
+        if not buffer.pending_bytes and not buffer.closed:
+            await buffer.wait()
+
+        if last_flush is not None and window_s > 0:
+            while not buffer.closed and buffer.pending_bytes < flush_bytes:
+                remaining = last_flush + window_s - time.monotonic()
+                if remaining <= 0:
+                    break
+                await buffer.wait(remaining)
+
+        text = take()
+        if text:
+            last_flush = time.monotonic()
+            yield text
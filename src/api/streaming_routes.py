@@ -1,15 +1,25 @@
 """Streaming API routes using Server-Sent Events."""
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 import asyncio
+import json
 import time
 
-from src.inference.engine import model_engine
-from src.inference.streaming import stream_generate
-from src.utils.queue import request_queue
+from src.api.routes import (
+    MAX_COMPLETIONS, MAX_GRAMMAR_CHARS, MAX_MESSAGES, MAX_PROMPT_CHARS, ChatMessage,
+    prepare_grammar, render_prompt, resolve_model, retrieve_passages, user_message, validate_chat_request
+)
+from src.api.sse import coalesce, format_event
+from src.inference.engine import ModelEngine
+from src.inference.grammar import GrammarSpec, grammar_cache
+from src.inference.registry import model_registry
+from src.inference.streaming import SlowClientError, TokenBuffer, start_stream
+from src.inference.warmup import record_prompt
+from src.utils.config import settings
+from src.utils.queue import RequestQueue
 from src.utils.logger import logger
 
 
@@ -18,66 +28,172 @@ router = APIRouter()
 
 class StreamChatRequest(BaseModel):
     """Streaming chat request model."""
-    prompt: str = Field(..., min_length=1, max_length=4096)
+    prompt: Optional[str] = Field(None, min_length=1, max_length=MAX_PROMPT_CHARS)
+    messages: Optional[List[ChatMessage]] = Field(None, max_length=MAX_MESSAGES)  # or a whole conversation
     max_tokens: Optional[int] = Field(None, ge=1, le=1024)
     temperature: Optional[float] = Field(None, ge=0.0, le=2.0)
     top_p: Optional[float] = Field(None, ge=0.0, le=1.0)
+    model: Optional[str] = Field(None, max_length=256)
+    grammar: Optional[str] = Field(None, max_length=MAX_GRAMMAR_CHARS)  # GBNF the output must follow
+    json_schema: Optional[Dict[str, Any]] = None  # or a JSON schema the output must match
+    retrieve: Optional[int] = Field(None, ge=1, le=20)  # add the top passages from the course notes index
+    n: int = Field(1, ge=1, le=MAX_COMPLETIONS)  # completions, streamed as "choice" events tagged with index
 
+    @model_validator(mode="after")
+    def check_input(self):
+        return validate_chat_request(self)
 
-async def generate_sse_stream(prompt: str, max_tokens: int, temperature: float, top_p: float):
+
+async def stream_events(engine: ModelEngine, queue: RequestQueue, prompt: str,
+                        max_tokens: int, temperature: float, top_p: float,
+                        budget: Optional[dict] = None,
+                        grammar: Optional[GrammarSpec] = None,
+                        n: int = 1,
+                        pinned_prefix: Optional[str] = None) -> AsyncIterator[Tuple[Optional[str], Any]]:
     """
-    Generate Server-Sent Events stream for chat responses.
+    Run one streamed generation and yield its events, independent of transport.
+    
+    Generation stops when the consumer stops iterating or closes the
+    iterator, so a consumer that waits before asking for the next event
+    applies backpressure.
     
     Args:
+        engine: Engine serving the requested model
+        queue: Concurrency queue of that model
         prompt: User input prompt
         max_tokens: Maximum tokens to generate
         temperature: Sampling temperature
         top_p: Nucleus sampling parameter
+        budget: Prompt budget and grammar details, reported in the done event timings
+        grammar: Grammar the output must follow, or None for free text
+        n: Completions to generate from one prompt evaluation
+        pinned_prefix: System turn at the start of the prompt, kept by context shifting
         
     Yields:
-        SSE formatted messages
+        Tuples of (event name, payload): None with generated text, "choice"
+        with {"index", "text"} when n > 1, or "error", "warmup", "start"
+        and "done" with a message or dict
     """
-    try:
-        # Acquire a slot in the queue
-        if not await request_queue.acquire():
-            yield f"event: error\ndata: Maximum concurrent users reached. Please try again later.\n\n"
-            return
-        
+    # Pinned until generation holds a lease: the registry must not evict the model meanwhile
+    with engine.pin():
         try:
-            # Send start event
-            yield f"event: start\ndata: Generation started\n\n"
-            
-            start_time = time.time()
-            token_count = 0
+            # Acquire a slot in the queue
+            if not await queue.acquire():
+                yield "error", "Maximum concurrent users reached. Please try again later."
+                return
             
-            # Stream tokens from model
-            async for token in stream_generate(
-                model=model_engine.model,
-                prompt=prompt,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p
-            ):
-                token_count += 1
-                # Send token as SSE message
-                # Escape newlines in token for SSE format
-                escaped_token = token.replace('\n', '\\n').replace('\r', '\\r')
-                yield f"data: {escaped_token}\n\n"
-                
-                # Small delay to prevent overwhelming the client
-                await asyncio.sleep(0.01)
+            released = False
             
-            # Send completion event
-            generation_time = time.time() - start_time
-            yield f"event: done\ndata: {{\"token_count\": {token_count}, \"generation_time\": {generation_time:.2f}}}\n\n"
+            async def release_slot():
+                nonlocal released
+                if not released:
+                    released = True
+                    await asyncio.shield(queue.release())
             
-        finally:
-            # Always release the slot
-            await request_queue.release()
+            async def release_when_generated(buffer: TokenBuffer):
+                await buffer.wait_closed()
+                await release_slot()
             
-    except Exception as e:
-        logger.error(f"Error in SSE stream: {str(e)}")
-        yield f"event: error\ndata: {str(e)}\n\n"
+            watcher = None
+            try:
+                # Tell the client a sleeping model is waking up, then wait for it
+                if not engine.model_loaded:
+                    wake = "warm" if engine.sleep_mode == "context" else "cold"
+                    yield "warmup", {"wake": wake}
+                    if not await model_registry.wait_ready(engine, settings.wake_timeout):
+                        yield "error", "Model failed to wake up. Please try again later."
+                        return
+                
+                # Send start event
+                yield "start", "Generation started"
+                
+                start_time = time.time()
+                timings = dict(budget or {})
+                frames = 0
+                
+                # Generate on a worker thread; it holds the model (through a hot swap too)
+                # until it finishes or the buffer is cancelled
+                buffer = TokenBuffer(settings.sse_buffer_bytes, settings.sse_slow_client,
+                                     settings.sse_slow_client_timeout, engine.contended,
+                                     settings.sse_slow_client_shared_timeout)
+                if n > 1:
+                    tokens = engine.stream_n(prompt, n, max_tokens, temperature, top_p, timings=timings)
+                else:
+                    tokens = engine.stream(prompt, max_tokens, temperature, top_p, timings=timings, grammar=grammar,
+                                           pinned_prefix=pinned_prefix)
+                output = []
+                start_stream(tokens, buffer)
+                # The slot is freed when generation ends, not when a slow client has read it all
+                watcher = asyncio.create_task(release_when_generated(buffer))
+                try:
+                    async for text in coalesce(buffer, settings.sse_flush_ms / 1000, settings.sse_flush_bytes,
+                                               take=buffer.take_choices if n > 1 else buffer.take):
+                        frames += 1
+                        if n > 1:
+                            for index, piece in text.items():
+                                yield "choice", {"index": index, "text": piece}
+                            continue
+                        if grammar is not None:
+                            output.append(text)
+                        yield None, text
+                finally:
+                    # Stops generation if the client disconnected or cancelled mid-stream
+                    buffer.cancel()
+                
+                if buffer.error is not None:
+                    if isinstance(buffer.error, SlowClientError):
+                        logger.warning(f"Stream aborted: {buffer.error}")
+                    raise buffer.error
+                
+                if grammar is not None:
+                    grammar_cache.record_output(grammar, "".join(output).strip(), timings.get("finish_reason"),
+                                                buffer.tokens)
+                
+                # Send completion event
+                generation_time = time.time() - start_time
+                done = {"token_count": buffer.tokens, "frames": frames,
+                        "generation_time": round(generation_time, 2), "timings": timings}
+                if n == 1:
+                    # With n > 1 each completion's reason is in timings["choices"]
+                    done["finish_reason"] = timings.get("finish_reason")
+                yield "done", done
+                
+            finally:
+                # Always release the slot
+                if watcher is not None:
+                    watcher.cancel()
+                await release_slot()
+                
+        except Exception as e:
+            logger.error(f"Error in stream: {str(e)}")
+            yield "error", str(e)
+
+
+async def generate_sse_stream(engine: ModelEngine, queue: RequestQueue, prompt: str,
+                              max_tokens: int, temperature: float, top_p: float,
+                              budget: Optional[dict] = None, grammar: Optional[GrammarSpec] = None,
+                              n: int = 1, pinned_prefix: Optional[str] = None):
+    """
+    Generate Server-Sent Events stream for chat responses.
+    
+    Args:
+        engine: Engine serving the requested model
+        queue: Concurrency queue of that model
+        prompt: User input prompt
+        max_tokens: Maximum tokens to generate
+        temperature: Sampling temperature
+        top_p: Nucleus sampling parameter
+        budget: Prompt budget and grammar details, reported in the done event timings
+        grammar: Grammar the output must follow, or None for free text
+        n: Completions to generate from one prompt evaluation
+        pinned_prefix: System turn at the start of the prompt, kept by context shifting
+        
+    Yields:
+        SSE formatted messages
+    """
+    async for event, data in stream_events(engine, queue, prompt, max_tokens, temperature, top_p,
+                                           budget, grammar, n, pinned_prefix):
+        yield format_event(data if isinstance(data, str) else json.dumps(data), event)
 
 
 @router.post("/api/chat/stream")
@@ -91,21 +207,25 @@ async def stream_chat(request: StreamChatRequest):
     Returns:
         StreamingResponse: SSE stream of generated tokens
     """
-    if not model_engine.model_loaded:
-        raise HTTPException(
-            status_code=503,
-            detail="Model not loaded. Server is starting up."
-        )
-    
-    logger.info(f"Streaming chat request received (prompt_length={len(request.prompt)})")
+    engine, queue = resolve_model(request.model)
+    passages, retrieval = await retrieve_passages(user_message(request.prompt, request.messages), request.retrieve)
     
     # Use defaults from settings if not provided
-    max_tokens = request.max_tokens or model_engine.get_model_info()["max_tokens"]
-    temperature = request.temperature or model_engine.get_model_info()["temperature"]
-    top_p = request.top_p or model_engine.get_model_info()["top_p"]
+    max_tokens = request.max_tokens or engine.get_model_info()["max_tokens"]
+    temperature = request.temperature or engine.get_model_info()["temperature"]
+    top_p = request.top_p or engine.get_model_info()["top_p"]
+    
+    # Reject or truncate before the stream takes a queue slot
+    prompt, user_text, budget, system = render_prompt(engine, request.prompt, request.messages,
+                                                      max_tokens * request.n, passages)
+    
+    logger.info(f"Streaming chat request received (prompt_length={len(user_text)})")
+    record_prompt(user_text)
+    grammar, grammar_info = await prepare_grammar(request.grammar, request.json_schema)
     
     return StreamingResponse(
-        generate_sse_stream(request.prompt, max_tokens, temperature, top_p),
+        generate_sse_stream(engine, queue, prompt, max_tokens, temperature, top_p,
+                            {**budget, **grammar_info, **retrieval}, grammar, request.n, system),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
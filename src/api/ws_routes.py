@@ -0,0 +1,217 @@
+"""WebSocket API: many concurrent generation streams over one connection.
+
+Messages are JSON text frames. The client sends:
+
+    {"type": "start", "id": "a", "prompt": "...", "max_tokens": 64, ...}
+    {"type": "ack", "id": "a", "seq": 7}      # frames up to seq 7 were consumed
+    {"type": "cancel", "id": "a"}
+
+start takes the same fields as POST /api/chat/stream plus a client-chosen
+stream id. The server answers with token frames and events per stream:
+
+    {"id": "a", "seq": 0, "t": "Hello"}      # with n > 1, also "i": the completion index
+    {"id": "a", "type": "start" | "warmup" | "done" | "error" | "cancelled", "data": ...}
+
+Each stream may have WS_STREAM_WINDOW token frames unacknowledged; after
+that the stream waits for an ack while tokens collect in its buffer, where
+the SSE slow-client policy applies. Streams take request_queue slots like
+/api/chat/stream.
+"""
+
+import asyncio
+import json
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import Field, ValidationError
+from starlette.websockets import WebSocketState
+
+from src.api.routes import (
+    prepare_grammar, render_prompt, resolve_model, retrieve_passages, user_message
+)
+from src.api.streaming_routes import StreamChatRequest, stream_events
+from src.inference.warmup import record_prompt
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+router = APIRouter()
+
+
+class WSStartMessage(StreamChatRequest):
+    """Start message: a streaming chat request with the stream id."""
+    id: str = Field(..., min_length=1, max_length=64)
+
+
+class _Stream:
+    """One generation stream of a connection: its task and flow control window."""
+
+    def __init__(self, stream_id: str, window: int):
+        """
+        Initialize the stream.
+
+        Args:
+            stream_id: Client-chosen id
+            window: Token frames that may be unacknowledged, 0 = unlimited
+        """
+        self.id = stream_id
+        self.window = window
+        self.sent = 0
+        self.acked = 0
+        self.task: Optional[asyncio.Task] = None
+        self._credit = asyncio.Event()
+
+    def ack(self, seq: int):
+        """Record that frames up to and including seq were consumed."""
+        if seq + 1 > self.acked:
+            self.acked = min(seq + 1, self.sent)
+            self._credit.set()
+
+    async def wait_credit(self):
+        """Wait until another token frame may be sent."""
+        while self.window and self.sent - self.acked >= self.window:
+            self._credit.clear()
+            await self._credit.wait()
+
+
+class _Connection:
+    """Streams multiplexed over one WebSocket."""
+
+    def __init__(self, websocket: WebSocket):
+        """
+        Initialize the connection.
+
+        Args:
+            websocket: Accepted WebSocket
+        """
+        self.websocket = websocket
+        self.streams: Dict[str, _Stream] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, message: dict):
+        """Send one JSON frame; frames of different streams never interleave."""
+        text = json.dumps(message, separators=(",", ":"))
+        async with self._send_lock:
+            await self.websocket.send_text(text)
+
+    async def start(self, message: dict):
+        """Validate a start message and launch its stream."""
+        try:
+            request = WSStartMessage(**message)
+        except ValidationError as e:
+            await self.send({"id": message.get("id"), "type": "error",
+                             "data": e.errors(include_url=False, include_context=False)})
+            return
+
+        if request.id in self.streams:
+            await self.send({"id": request.id, "type": "error", "data": "Stream id already in use"})
+            return
+        if len(self.streams) >= settings.ws_max_streams:
+            await self.send({"id": request.id, "type": "error",
+                             "data": f"At most {settings.ws_max_streams} streams per connection"})
+            return
+
+        stream = _Stream(request.id, settings.ws_stream_window)
+        self.streams[request.id] = stream
+        stream.task = asyncio.create_task(self._run(stream, request))
+
+    async def _run(self, stream: _Stream, request: WSStartMessage):
+        """Generate one stream and forward its events."""
+        try:
+            engine, queue = resolve_model(request.model)
+            passages, retrieval = await retrieve_passages(user_message(request.prompt, request.messages),
+                                                          request.retrieve)
+            info = engine.get_model_info()
+            max_tokens = request.max_tokens or info["max_tokens"]
+            temperature = request.temperature or info["temperature"]
+            top_p = request.top_p or info["top_p"]
+            prompt, user_text, budget, system = render_prompt(engine, request.prompt, request.messages,
+                                                              max_tokens * request.n, passages)
+            logger.info(f"WebSocket stream {request.id} received (prompt_length={len(user_text)})")
+            record_prompt(user_text)
+            grammar, grammar_info = await prepare_grammar(request.grammar, request.json_schema)
+
+            events = stream_events(engine, queue, prompt, max_tokens, temperature, top_p,
+                                   {**budget, **grammar_info, **retrieval}, grammar, request.n, system)
+            try:
+                async for event, data in events:
+                    if event is None or event == "choice":
+                        frame = {"id": stream.id, "seq": stream.sent, "t": data}
+                        if event == "choice":
+                            frame.update(i=data["index"], t=data["text"])
+                        await self.send(frame)
+                        stream.sent += 1
+                        # Not asking for the next frame stalls generation until the client acks
+                        await stream.wait_credit()
+                    else:
+                        await self.send({"id": stream.id, "type": event, "data": data})
+            finally:
+                await events.aclose()
+        except HTTPException as e:
+            await self.send({"id": stream.id, "type": "error", "data": e.detail})
+        except asyncio.CancelledError:
+            logger.info(f"WebSocket stream {stream.id} cancelled after {stream.sent} frames")
+            if self.websocket.client_state == WebSocketState.CONNECTED:
+                await self.send({"id": stream.id, "type": "cancelled", "data": {"frames": stream.sent}})
+        except Exception as e:
+            # The socket itself failed; the receive loop handles the disconnect
+            logger.warning(f"WebSocket stream {stream.id} ended: {e}")
+        finally:
+            self.streams.pop(stream.id, None)
+
+    async def handle(self, message: dict):
+        """Dispatch one client message."""
+        kind = message.get("type")
+        stream_id = message.get("id")
+        if not isinstance(stream_id, str) or not stream_id:
+            # Answered on the connection: the frame has no usable stream id to echo
+            await self.send({"type": "error", "data": "Messages need a non-empty string \"id\""})
+            return
+        stream = self.streams.get(stream_id)
+        if kind == "start":
+            await self.start(message)
+        elif kind == "ack":
+            if stream is not None and isinstance(message.get("seq"), int):
+                stream.ack(message["seq"])
+        elif kind == "cancel":
+            if stream is not None and stream.task is not None:
+                stream.task.cancel()
+        else:
+            await self.send({"id": stream_id, "type": "error", "data": f"Unknown message type '{kind}'"})
+
+    async def close(self):
+        """Cancel every stream and wait for them to release their slots."""
+        tasks = [s.task for s in self.streams.values() if s.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@router.websocket("/ws")
+async def websocket_chat(websocket: WebSocket):
+    """
+    Multiplexed streaming chat over a WebSocket.
+
+    Args:
+        websocket: Client connection
+    """
+    await websocket.accept()
+    connection = _Connection(websocket)
+    logger.info("WebSocket connection opened")
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                message = json.loads(raw)
+            except json.JSONDecodeError:
+                await connection.send({"type": "error", "data": "Messages must be JSON"})
+                continue
+            if not isinstance(message, dict):
+                await connection.send({"type": "error", "data": "Messages must be JSON objects"})
+                continue
+            await connection.handle(message)
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket connection closed ({len(connection.streams)} streams open)")
+    finally:
+        await connection.close()
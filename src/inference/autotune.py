@@ -0,0 +1,217 @@
+"""Startup autotuner for llama runtime thread and batch settings."""
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.config import settings
+from src.utils.logger import logger
+from src.utils.system import fingerprint_id, machine_fingerprint
+
+
+# Filler text used to build prompts of an exact token length
+FILLER = (
+    "Students in the biology lab measured how enzyme activity changes with "
+    "temperature and recorded their observations in a shared notebook. "
+)
+
+# Candidate batch sizes for prompt evaluation
+BATCH_CANDIDATES = [128, 256, 512]
+
+# Tokens used for each tuning measurement
+TUNE_PROMPT_TOKENS = 256
+TUNE_DECODE_TOKENS = 16
+
+
+def build_prompt_tokens(model, length: int) -> List[int]:
+    """
+    Build a prompt of exactly ``length`` tokens.
+
+    Args:
+        model: Loaded backend
+        length: Desired token count
+
+    Returns:
+        List of token ids
+    """
+    tokens = model.tokenize(FILLER.encode("utf-8"))
+    while len(tokens) < length:
+        tokens += model.tokenize(FILLER.encode("utf-8"), add_bos=False)
+    return tokens[:length]
+
+
+def measure_prompt_and_decode(model, prompt_tokens: List[int], decode_tokens: int) -> Dict[str, float]:
+    """
+    Time prompt evaluation and greedy single-token decoding.
+
+    Args:
+        model: Loaded llama_cpp.Llama instance
+        prompt_tokens: Prompt token ids
+        decode_tokens: Number of tokens to decode after the prompt
+
+    Returns:
+        Dictionary with prompt_eval_s, prompt_eval_tps, decode_s and decode_tps
+    """
+    import numpy as np
+
+    model.reset()
+    start = time.perf_counter()
+    model.eval(prompt_tokens)
+    prompt_eval_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(decode_tokens):
+        token = int(np.argmax(model.scores[model.n_tokens - 1]))
+        model.eval([token])
+    decode_s = time.perf_counter() - start
+
+    return {
+        "prompt_eval_s": prompt_eval_s,
+        "prompt_eval_tps": len(prompt_tokens) / prompt_eval_s if prompt_eval_s > 0 else 0.0,
+        "decode_s": decode_s,
+        "decode_tps": decode_tokens / decode_s if decode_s > 0 else 0.0,
+    }
+
+
+def thread_candidates() -> List[int]:
+    """
+    Thread counts worth trying on this host.
+
+    Returns:
+        Sorted unique candidates around the physical and logical core counts
+    """
+    logical = os.cpu_count() or 1
+    physical = logical
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False) or logical
+    except ImportError:
+        pass
+
+    candidates = {max(1, physical // 2), max(1, physical - 1), physical, logical}
+    return sorted(candidates)
+
+
+def profile_path(model_path: Path) -> Path:
+    """
+    Location of the stored tuning profile for a model on this machine.
+
+    Args:
+        model_path: Path to the .gguf file
+
+    Returns:
+        Path of the profile JSON file
+    """
+    machine_id = fingerprint_id(machine_fingerprint())
+    size = model_path.stat().st_size
+    return Path(settings.autotune_profile_dir) / f"{model_path.stem}-{size}-{machine_id}.json"
+
+
+def load_profile(model_path: Path) -> Optional[dict]:
+    """
+    Load a previously saved tuning profile.
+
+    Args:
+        model_path: Path to the .gguf file
+
+    Returns:
+        The best runtime parameters, or None if the model was never tuned here
+    """
+    path = profile_path(model_path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["best"]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable tuning profile {path}: {e}")
+        return None
+
+
+def save_profile(model_path: Path, best: dict, trials: List[dict]):
+    """
+    Persist a tuning profile.
+
+    Args:
+        model_path: Path to the .gguf file
+        best: Chosen runtime parameters
+        trials: All measurements taken
+    """
+    path = profile_path(model_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fingerprint = machine_fingerprint()
+    profile = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "model": model_path.name,
+        "machine": fingerprint,
+        "machine_id": fingerprint_id(fingerprint),
+        "best": best,
+        "trials": trials,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    logger.info(f"Saved tuning profile: {path}")
+
+
+def autotune(model, model_path: Path) -> dict:
+    """
+    Benchmark thread and batch candidates on a loaded model and apply the best.
+
+    Decode speed picks ``n_threads``; prompt-eval speed picks ``n_threads_batch``
+    and ``n_batch``. The model must have been loaded with ``n_batch`` at least
+    as large as the biggest batch candidate.
+
+    Args:
+        model: Loaded llama_cpp.Llama instance
+        model_path: Path to the .gguf file, used to key the saved profile
+
+    Returns:
+        The chosen runtime parameters
+    """
+    start = time.perf_counter()
+    n_ctx = model.n_ctx()
+    prompt_len = min(TUNE_PROMPT_TOKENS, n_ctx - TUNE_DECODE_TOKENS - 1)
+    prompt_tokens = build_prompt_tokens(model, prompt_len)
+    threads = thread_candidates()
+    batches = [b for b in BATCH_CANDIDATES if b <= model.n_batch] or [model.n_batch]
+    max_batch = model.n_batch
+    trials = []
+
+    logger.info(f"Autotuning runtime settings (threads {threads}, batches {batches})...")
+
+    # Untimed pass to fault in weights before measuring
+    measure_prompt_and_decode(model, prompt_tokens[:8], 1)
+
+    for n_threads in threads:
+        model._ctx.set_n_threads(n_threads, n_threads)
+        for n_batch in batches:
+            model.n_batch = n_batch
+            result = measure_prompt_and_decode(model, prompt_tokens, TUNE_DECODE_TOKENS)
+            result.update({"n_threads": n_threads, "n_batch": n_batch})
+            trials.append(result)
+            logger.info(f"  threads={n_threads:3d} batch={n_batch:4d}  "
+                        f"eval {result['prompt_eval_tps']:8.1f} tok/s  "
+                        f"decode {result['decode_tps']:6.1f} tok/s")
+
+    best_decode = max(trials, key=lambda t: t["decode_tps"])
+    best_eval = max(trials, key=lambda t: t["prompt_eval_tps"])
+    best = {
+        "n_threads": best_decode["n_threads"],
+        "n_threads_batch": best_eval["n_threads"],
+        "n_batch": best_eval["n_batch"],
+    }
+
+    model._ctx.set_n_threads(best["n_threads"], best["n_threads_batch"])
+    model.n_batch = min(best["n_batch"], max_batch)
+    # Keep the stored params in step so a recreated context uses the tuned threads
+    model.n_threads, model.n_threads_batch = best["n_threads"], best["n_threads_batch"]
+    model.context_params.n_threads = best["n_threads"]
+    model.context_params.n_threads_batch = best["n_threads_batch"]
+    model.reset()
+
+    save_profile(model_path, best, trials)
+    logger.info(f"Autotune finished in {time.perf_counter() - start:.1f}s: {best}")
+    return best
@@ -0,0 +1,230 @@
+"""Pluggable inference backends for the model engine."""
+
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+
+# Serializes loads that temporarily hook llama_model_default_params
+_progress_hook_lock = threading.Lock()
+
+
+class InferenceBackend:
+    """
+    Interface implemented by every inference backend.
+
+    The surface mirrors the subset of ``llama_cpp.Llama`` the engine and the
+    streaming layer use, so a ``Llama`` instance is a valid backend as-is.
+    """
+
+    def __call__(self, prompt: str, max_tokens: int = 16, temperature: float = 0.8,
+                 top_p: float = 0.95, echo: bool = False, stream: bool = False,
+                 stop: Optional[List[str]] = None, **kwargs) -> Union[dict, Iterator[dict]]:
+        """
+        Run a completion.
+
+        Returns:
+            A completion dict, or an iterator of completion chunks when
+            ``stream`` is True
+        """
+        raise NotImplementedError
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        """Tokenize UTF-8 encoded text."""
+        raise NotImplementedError
+
+    def detokenize(self, tokens: List[int]) -> bytes:
+        """Convert token ids back to UTF-8 encoded text."""
+        raise NotImplementedError
+
+    def n_ctx(self) -> int:
+        """Return the context window size in tokens."""
+        raise NotImplementedError
+
+
+def load_llama_backend(model_path: Optional[Path],
+                       progress_callback: Optional[Callable[[float], None]] = None,
+                       kv_type: Optional[str] = None,
+                       **params) -> InferenceBackend:
+    """
+    Load a GGUF model with llama-cpp-python.
+
+    ``Llama`` does not accept a load progress callback, so when one is given
+    the model params factory is wrapped for the duration of the load to
+    install llama.cpp's native ``progress_callback``.
+
+    Args:
+        model_path: Path to the .gguf file
+        progress_callback: Called with the load fraction (0.0-1.0) as tensors load
+        kv_type: Key cache type ("f16", "q8_0", "q4_0"); None keeps the default f16
+        **params: Keyword arguments passed to ``llama_cpp.Llama``
+
+    Returns:
+        Loaded Llama instance
+    """
+    model = _construct_llama(model_path, progress_callback, **params)
+    if kv_type and kv_type != "f16":
+        set_kv_cache_type(model, kv_type)
+    return model
+
+
+def _construct_llama(model_path: Optional[Path],
+                     progress_callback: Optional[Callable[[float], None]],
+                     **params) -> InferenceBackend:
+    """Construct ``llama_cpp.Llama``, reporting load progress if asked to."""
+    from llama_cpp import Llama
+
+    if progress_callback is None:
+        return Llama(model_path=str(model_path), **params)
+
+    import llama_cpp.llama_cpp as llama_lib
+
+    def on_progress(progress: float, user_data) -> bool:
+        progress_callback(progress)
+        return True  # keep loading
+
+    # Keep a reference to the ctypes callback for the whole load
+    c_callback = llama_lib.llama_progress_callback(on_progress)
+
+    with _progress_hook_lock:
+        default_params = llama_lib.llama_model_default_params
+
+        def params_with_progress():
+            model_params = default_params()
+            model_params.progress_callback = c_callback
+            return model_params
+
+        llama_lib.llama_model_default_params = params_with_progress
+        try:
+            return Llama(model_path=str(model_path), **params)
+        finally:
+            llama_lib.llama_model_default_params = default_params
+
+
+def load_stub_backend(model_path: Optional[Path],
+                      progress_callback: Optional[Callable[[float], None]] = None,
+                      **params) -> InferenceBackend:
+    """
+    Create the deterministic stub backend.
+
+    Args:
+        model_path: Ignored; the stub needs no model file
+        progress_callback: Called once with 1.0, as the stub loads instantly
+        **params: Keyword arguments passed to ``StubBackend``
+
+    Returns:
+        StubBackend instance
+    """
+    from src.inference.stub_backend import StubBackend
+
+    backend = StubBackend(**params)
+    if progress_callback is not None:
+        progress_callback(1.0)
+    return backend
+
+
+def release_context(model: InferenceBackend) -> bool:
+    """
+    Free a backend's context (KV cache and logits buffers) but keep its weights.
+    
+    Args:
+        model: Loaded backend with no generation in progress
+        
+    Returns:
+        bool: True if the context was released, False if the backend can't do this
+    """
+    if hasattr(model, "release_context"):
+        model.release_context()
+        return True
+    if not (hasattr(model, "_ctx") and hasattr(model, "_batch") and hasattr(model, "_model")):
+        return False
+    
+    import numpy as np
+    
+    # llama_cpp.Llama: dropping the wrappers calls llama_free / llama_batch_free
+    model.n_tokens = 0
+    model._ctx = None
+    model._batch = None
+    model.input_ids = np.ndarray((0,), dtype=np.intc)
+    model.scores = np.ndarray((0, model._n_vocab), dtype=np.single)
+    return True
+
+
+def restore_context(model: InferenceBackend):
+    """
+    Recreate a context freed by release_context().
+    
+    Args:
+        model: Backend whose context was released
+    """
+    if hasattr(model, "restore_context"):
+        model.restore_context()
+        return
+    
+    import numpy as np
+    from llama_cpp._internals import _LlamaBatch, _LlamaContext
+    
+    model._ctx = _LlamaContext(model=model._model, params=model.context_params, verbose=model.verbose)
+    model._batch = _LlamaBatch(
+        n_tokens=model.n_batch, embd=0, n_seq_max=model.context_params.n_ctx, verbose=model.verbose
+    )
+    model.input_ids = np.ndarray((model._n_ctx,), dtype=np.intc)
+    model.scores = np.ndarray((model._n_ctx, model._n_vocab), dtype=np.single)
+    model.n_tokens = 0
+
+
+def set_kv_cache_type(model: InferenceBackend, kv_type: str):
+    """
+    Rebuild a llama context with its key cache stored as kv_type.
+
+    ``Llama`` does not take a KV type, so the context created by the
+    constructor is replaced by one built from the same params with
+    ``type_k`` set; it is kept on wake since restore_context reuses them.
+
+    Args:
+        model: Llama instance with no generation in progress
+        kv_type: Key in kv_planner.GGML_TYPE_IDS
+    """
+    from src.inference.kv_planner import GGML_TYPE_IDS
+
+    if not hasattr(model, "context_params"):
+        return
+    model.context_params.type_k = GGML_TYPE_IDS[kv_type]
+    release_context(model)
+    restore_context(model)
+
+
+# Registry of available backends, keyed by INFERENCE_BACKEND value
+BACKENDS: Dict[str, Callable[..., InferenceBackend]] = {
+    "llama": load_llama_backend,
+    "stub": load_stub_backend,
+}
+
+
+def requires_model_file(name: str) -> bool:
+    """Whether the named backend loads weights from a model file."""
+    return name != "stub"
+
+
+def load_backend(name: str, model_path: Optional[Path], **params) -> InferenceBackend:
+    """
+    Load an inference backend by name.
+
+    Args:
+        name: Backend name (a key of BACKENDS)
+        model_path: Path to the model file, if the backend needs one
+        **params: Backend-specific keyword arguments
+
+    Returns:
+        Backend instance
+
+    Raises:
+        ValueError: If the backend name is unknown
+    """
+    try:
+        loader = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown inference backend '{name}'. Available: {', '.join(BACKENDS)}"
+        )
+    return loader(model_path, **params)
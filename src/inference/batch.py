@@ -0,0 +1,424 @@
+"""Batch jobs: bulk prompts from JSONL, run in the engine's idle capacity."""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from src.inference.engine import ModelEngine
+from src.inference.prompt_budget import PromptTooLongError, fit_prompt, get_tokenizer
+from src.inference.registry import ModelBudgetError, model_registry
+from src.utils.config import settings
+from src.utils.logger import logger
+from src.utils.queue import RequestQueue
+
+
+# Job states; "queued" and "running" jobs resume after a restart
+BATCH_STATES = ("queued", "running", "completed", "cancelled")
+
+
+# Per-prompt overrides allowed in a batch file, with the same limits as /api/chat
+ITEM_LIMITS = {
+    "max_tokens": (1, 1024),
+    "temperature": (0.0, 2.0),
+    "top_p": (0.0, 1.0),
+}
+
+
+class BatchJobError(ValueError):
+    """Raised when a submitted batch file is malformed or too large."""
+
+
+def parse_prompt_file(text: str, max_prompts: Optional[int] = None) -> List[dict]:
+    """
+    Parse a JSONL prompt file into batch items.
+
+    Each line is an object with a "prompt", or with "title" and "body"
+    (the backlog format, joined by a blank line). "custom_id" (or
+    "request_id") is echoed back in the result, and "max_tokens",
+    "temperature" and "top_p" override the batch defaults. Blank lines
+    are ignored.
+
+    Args:
+        text: Contents of the file
+        max_prompts: Largest accepted number of prompts, or None for no limit
+
+    Returns:
+        Items with "index" (position among the prompts), "custom_id" and "prompt"
+
+    Raises:
+        BatchJobError: If a line is not valid or there are too many prompts
+    """
+    items = []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BatchJobError(f"Line {number}: invalid JSON ({e.msg})")
+        if not isinstance(entry, dict):
+            raise BatchJobError(f"Line {number}: expected a JSON object")
+        prompt = entry.get("prompt")
+        if prompt is None and isinstance(entry.get("body"), str):
+            prompt = "\n\n".join(part for part in (entry.get("title"), entry["body"]) if part)
+        if not isinstance(prompt, str) or not prompt:
+            raise BatchJobError(f"Line {number}: expected a non-empty \"prompt\" (or \"title\" and \"body\")")
+
+        custom_id = entry.get("custom_id", entry.get("request_id"))
+        item = {"index": len(items), "custom_id": custom_id, "prompt": prompt}
+        for key, (low, high) in ITEM_LIMITS.items():
+            value = entry.get(key)
+            if value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+                raise BatchJobError(f"Line {number}: \"{key}\" must be a number from {low} to {high}")
+            item[key] = int(value) if key == "max_tokens" else value
+        items.append(item)
+        if max_prompts is not None and len(items) > max_prompts:
+            raise BatchJobError(f"A batch may hold at most {max_prompts} prompts")
+    if not items:
+        raise BatchJobError("The batch file contains no prompts")
+    return items
+
+
+def load_checkpoint(path: Path) -> Dict[int, dict]:
+    """
+    Read the results already written to a results JSONL file.
+
+    A line cut short by a crash is dropped and the file rewritten, so new
+    results are not appended onto it.
+
+    Args:
+        path: Results file; it need not exist
+
+    Returns:
+        Results by item index
+    """
+    if not path.exists():
+        return {}
+
+    results: Dict[int, dict] = {}
+    valid: List[str] = []
+    damaged = False
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                damaged = True
+                continue
+            results[result["index"]] = result
+            valid.append(line if line.endswith("\n") else line + "\n")
+
+    if damaged:
+        logger.warning(f"Dropping a partial result line from {path}")
+        path.write_text("".join(valid), encoding="utf-8")
+    return results
+
+
+def run_prompt(engine: ModelEngine, item: dict, max_tokens: Optional[int] = None,
+               temperature: Optional[float] = None, top_p: Optional[float] = None) -> dict:
+    """
+    Generate the result line for one batch item (blocking).
+
+    The prompt is rendered with the model's chat template and fitted to the
+    context like an /api/chat prompt; per-item overrides take precedence
+    over the arguments.
+
+    Args:
+        engine: Loaded engine
+        item: Item from parse_prompt_file
+        max_tokens: Default maximum tokens
+        temperature: Default sampling temperature
+        top_p: Default nucleus sampling parameter
+
+    Returns:
+        Result with "index", "custom_id" and either "response" or "error"
+    """
+    max_tokens = item.get("max_tokens") or max_tokens or settings.max_tokens
+    result = {"index": item["index"], "custom_id": item["custom_id"]}
+    timings: dict = {}
+    try:
+        prompt = engine.format_prompt(item["prompt"])
+        tokenizer = get_tokenizer(engine.model_file, fallback=engine.model)
+        if settings.prompt_budget_strategy != "off" and tokenizer is not None:
+            n_ctx = engine.runtime_params.get("n_ctx") or settings.n_ctx
+            prompt, timings = fit_prompt(tokenizer, lambda content, _: engine.format_prompt(content),
+                                         item["prompt"], n_ctx, max_tokens)
+        start = time.time()
+        result["response"] = engine.generate(
+            prompt=prompt,
+            max_tokens=max_tokens,
+            temperature=item.get("temperature") or temperature,
+            top_p=item.get("top_p") or top_p,
+            timings=timings,
+            pinned_prefix=engine.system_prefix(prompt)
+        )
+        result["generation_time"] = round(time.time() - start, 3)
+        result["timings"] = timings
+    except (PromptTooLongError, RuntimeError, ValueError) as e:
+        result["error"] = str(e)
+    return result
+
+
+@dataclass
+class BatchJob:
+    """A submitted batch and its progress."""
+    id: str
+    total: int
+    model: Optional[str] = None
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    top_p: Optional[float] = None
+    status: str = "queued"
+    completed: int = 0
+    failed: int = 0
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+    def as_status(self) -> dict:
+        """Job summary for the API, with progress and throughput."""
+        status = asdict(self)
+        done = self.completed + self.failed
+        status["progress"] = round(done / self.total, 3) if self.total else 1.0
+        if self.started and done:
+            elapsed = (self.finished or time.time()) - self.started
+            status["prompts_per_minute"] = round(done / elapsed * 60, 1) if elapsed > 0 else None
+        return status
+
+
+class BatchManager:
+    """
+    Stores batch jobs on disk and runs them one prompt at a time.
+
+    Each job is a directory holding input.jsonl, job.json and results.jsonl.
+    A result line is appended and synced as each prompt finishes, so the
+    results file is the checkpoint: after a restart, unfinished jobs skip
+    the prompts already in it.
+
+    A prompt only starts when the job's model has no interactive requests
+    in flight, so a student waits for at most one batch prompt.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        """
+        Initialize the manager.
+
+        Args:
+            root: Directory for job data; defaults to BATCH_DIR from config.env
+        """
+        self.root = Path(root or settings.batch_dir)
+        self.jobs: Dict[str, BatchJob] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------
+
+    def _dir(self, job_id: str) -> Path:
+        """Directory of a job."""
+        return self.root / job_id
+
+    def results_path(self, job_id: str) -> Path:
+        """Path of a job's results.jsonl."""
+        return self._dir(job_id) / "results.jsonl"
+
+    def _save(self, job: BatchJob):
+        """Write job.json atomically."""
+        path = self._dir(job.id) / "job.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(job), indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _read_items(self, job: BatchJob) -> Iterator[dict]:
+        """Yield the normalized input items of a job."""
+        with open(self._dir(job.id) / "input.jsonl", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _checkpoint(self, job: BatchJob) -> Set[int]:
+        """Indices already in results.jsonl, updating the job's counters from it."""
+        results = load_checkpoint(self.results_path(job.id))
+        job.failed = sum(1 for result in results.values() if "error" in result)
+        job.completed = len(results) - job.failed
+        return set(results)
+
+    def load(self):
+        """Load jobs from disk; jobs that were running are queued again."""
+        if not self.root.exists():
+            return
+        for path in sorted(self.root.glob("*/job.json")):
+            try:
+                job = BatchJob(**json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning(f"Skipping unreadable batch job {path.parent.name}: {e}")
+                continue
+            if job.status == "running":
+                job.status = "queued"
+            self.jobs[job.id] = job
+
+        pending = sum(1 for job in self.jobs.values() if job.status == "queued")
+        if pending:
+            logger.info(f"Resuming {pending} batch job(s)")
+
+    # ------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------
+
+    def submit(self, data: bytes, model: Optional[str] = None, max_tokens: Optional[int] = None,
+               temperature: Optional[float] = None, top_p: Optional[float] = None) -> BatchJob:
+        """
+        Create a job from a JSONL file.
+
+        See parse_prompt_file for the line format.
+
+        Args:
+            data: Contents of the JSONL file
+            model: Model to run the job on, or None for the default model
+            max_tokens: Default maximum tokens per response
+            temperature: Default sampling temperature
+            top_p: Default nucleus sampling parameter
+
+        Returns:
+            The queued BatchJob
+
+        Raises:
+            BatchJobError: If a line is not valid or the file has too many prompts
+        """
+        items = parse_prompt_file(data.decode("utf-8", errors="replace"), settings.batch_max_prompts)
+
+        job = BatchJob(id=uuid.uuid4().hex[:12], total=len(items), model=model,
+                       max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        job_dir = self._dir(job.id)
+        job_dir.mkdir(parents=True, exist_ok=True)
+        with open(job_dir / "input.jsonl", "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+        self._save(job)
+        self.jobs[job.id] = job
+
+        logger.info(f"Batch {job.id} submitted ({job.total} prompts)")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def cancel(self, job_id: str) -> BatchJob:
+        """
+        Stop a job after its current prompt. Finished jobs are left as they are.
+
+        Raises:
+            KeyError: If there is no such job
+        """
+        job = self.jobs[job_id]
+        if job.status in ("queued", "running"):
+            job.status = "cancelled"
+            job.finished = time.time()
+            self._save(job)
+            logger.info(f"Batch {job.id} cancelled ({job.completed + job.failed}/{job.total} done)")
+        return job
+
+    def get_status(self) -> dict:
+        """Counts of jobs by state and the job currently running."""
+        counts = {state: 0 for state in BATCH_STATES}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        running = next((job.id for job in self.jobs.values() if job.status == "running"), None)
+        return {"jobs": counts, "running": running}
+
+    # ------------------------------------------------------------
+    # Runner
+    # ------------------------------------------------------------
+
+    def start(self):
+        """Load stored jobs and start the runner on the current event loop."""
+        self.load()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the runner; the current prompt's result is not recorded."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        """Run queued jobs oldest first, forever."""
+        while True:
+            queued = sorted((j for j in self.jobs.values() if j.status == "queued"), key=lambda j: j.created)
+            if not queued:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job = queued[0]
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Queue the job again and retry later (e.g. its model failed to load)
+                logger.error(f"Batch {job.id} interrupted: {str(e)}")
+                if job.status == "running":
+                    job.status = "queued"
+                    self._save(job)
+                await asyncio.sleep(settings.batch_retry_s)
+
+    async def _wait_idle(self, engine: ModelEngine, queue: RequestQueue):
+        """Wait until the model is loaded and serving no interactive requests."""
+        while True:
+            if engine.load_state in ("idle", "sleeping"):
+                try:
+                    model_registry.ensure_loaded(engine)
+                except ModelBudgetError:
+                    pass
+            if engine.model_loaded and queue.active_requests == 0 and engine.in_flight() == 0:
+                return
+            await asyncio.sleep(settings.batch_idle_poll_ms / 1000)
+
+    async def _run_job(self, job: BatchJob):
+        """Run the unfinished prompts of one job, checkpointing each result."""
+        engine, queue = model_registry.resolve(job.model)
+        done = self._checkpoint(job)
+        # Prompts sharing a prefix (rubrics, templates) run back to back and reuse its KV state
+        items = sorted((item for item in self._read_items(job) if item["index"] not in done),
+                       key=lambda item: item["prompt"])
+
+        job.status = "running"
+        job.started = job.started or time.time()
+        self._save(job)
+        logger.info(f"Batch {job.id} running ({len(items)} of {job.total} prompts left)")
+
+        with open(self.results_path(job.id), "a", encoding="utf-8") as results:
+            for item in items:
+                await self._wait_idle(engine, queue)
+                if job.status != "running":
+                    return  # cancelled
+                result = await asyncio.to_thread(run_prompt, engine, item, job.max_tokens,
+                                                 job.temperature, job.top_p)
+                results.write(json.dumps(result) + "\n")
+                results.flush()
+                os.fsync(results.fileno())
+                if "error" in result:
+                    job.failed += 1
+                else:
+                    job.completed += 1
+                self._save(job)
+
+        job.status = "completed"
+        job.finished = time.time()
+        self._save(job)
+        logger.info(f"Batch {job.id} completed ({job.completed} ok, {job.failed} failed)")
+
+
+# Global batch manager instance
+batch_manager = BatchManager()
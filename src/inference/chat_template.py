@@ -0,0 +1,288 @@
+"""Chat templates from GGUF metadata: prompt rendering and end-of-turn stops."""
+
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.inference.backends import InferenceBackend
+from src.inference.gguf import read_gguf_metadata
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# CHAT_TEMPLATE values: "auto" renders prompts with the model's template, "off" sends them raw
+CHAT_TEMPLATE_MODES = ("auto", "off")
+
+# Stop sequences for models without a chat template
+DEFAULT_STOP = ["</s>", "User:", "\n\n\n"]
+
+# Metadata keys of tokens that end an assistant turn
+END_OF_TURN_KEYS = ("tokenizer.ggml.eos_token_id", "tokenizer.ggml.eot_token_id", "tokenizer.ggml.eom_token_id")
+
+# Placeholder used to find the text a template puts around a message
+_PROBE = "\x00assistant-turn\x00"
+
+
+def _raise_exception(message: str):
+    """Templates call raise_exception() to reject malformed conversations."""
+    raise ValueError(message)
+
+
+@lru_cache(maxsize=32)
+def compile_template(source: str) -> Any:
+    """
+    Compile a Jinja chat template (cached by source text).
+
+    Uses the same sandbox and whitespace options as Hugging Face tokenizers,
+    so GGUF templates render the way their authors tested them.
+    """
+    from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+    env = ImmutableSandboxedEnvironment(trim_blocks=True, lstrip_blocks=True)
+    env.globals["raise_exception"] = _raise_exception
+    return env.from_string(source)
+
+
+def end_of_turn_processor(eos_id: int, stop_ids: Sequence[int], temperature: float):
+    """
+    Logits processor that folds end-of-turn tokens into EOS.
+
+    The probability of every stop token is moved onto EOS (at the sampling
+    temperature, so the chance of ending the turn is unchanged), which makes
+    the backend stop right where the model ends its turn instead of one
+    token later.
+
+    Args:
+        eos_id: End-of-sequence token id
+        stop_ids: Other token ids that end a turn
+        temperature: Sampling temperature the logits will be scaled by
+
+    Returns:
+        A llama-cpp LogitsProcessorList
+    """
+    import numpy as np
+    from llama_cpp import LogitsProcessorList
+
+    stop_ids = [i for i in stop_ids if i != eos_id]
+
+    def fold(input_ids, scores):
+        ids = [eos_id] + stop_ids
+        if temperature > 0:
+            merged = temperature * np.logaddexp.reduce(scores[ids] / temperature)
+        else:
+            merged = scores[ids].max()
+        scores[eos_id] = merged
+        scores[stop_ids] = -np.inf
+        return scores
+
+    return LogitsProcessorList([fold])
+
+
+class ChatFormat:
+    """
+    How prompts for one model are rendered and where its answers end.
+
+    Without a template, prompts are sent as given and generation stops on
+    DEFAULT_STOP.
+    """
+
+    def __init__(self, template: Optional[str] = None, bos_token: str = "", eos_token: str = "",
+                 eos_id: Optional[int] = None, stop_token_ids: Sequence[int] = (),
+                 stop: Optional[List[str]] = None):
+        """
+        Initialize the format.
+
+        Args:
+            template: Jinja chat template source, or None for raw prompts
+            bos_token: Text of the BOS token, passed to the template
+            eos_token: Text of the EOS token, passed to the template
+            eos_id: End-of-sequence token id
+            stop_token_ids: Token ids other than EOS that end a turn
+            stop: Stop sequences; defaults to DEFAULT_STOP
+        """
+        self.template = template
+        self.bos_token = bos_token
+        self.eos_token = eos_token
+        self.eos_id = eos_id
+        self.stop_token_ids = list(stop_token_ids)
+        self.stop = list(stop) if stop is not None else list(DEFAULT_STOP)
+
+    @property
+    def active(self) -> bool:
+        """Whether prompts are rendered through a chat template."""
+        return self.template is not None
+
+    def render(self, messages: List[Dict[str, str]], add_generation_prompt: bool = True) -> str:
+        """
+        Render a conversation through the template.
+
+        The output is never trimmed or normalized, so a conversation renders
+        to a byte-identical prefix of the same conversation with more turns,
+        and the KV state of earlier turns can be reused.
+
+        Args:
+            messages: Dicts with "role" and "content"
+            add_generation_prompt: Append the header that starts the assistant's turn
+
+        Returns:
+            Prompt text, without a leading BOS (the tokenizer adds it)
+
+        Raises:
+            ValueError: If the template rejects the conversation
+        """
+        if not self.active:
+            lines = [f"{m['role'].capitalize()}: {m['content']}\n" for m in messages]
+            return "".join(lines) + ("Assistant:" if add_generation_prompt else "")
+
+        try:
+            text = compile_template(self.template).render(
+                messages=messages,
+                add_generation_prompt=add_generation_prompt,
+                bos_token=self.bos_token,
+                eos_token=self.eos_token,
+            )
+        except Exception as e:
+            raise ValueError(f"Chat template rejected the conversation: {e}")
+        if self.bos_token and text.startswith(self.bos_token):
+            text = text[len(self.bos_token):]
+        return text
+
+    def format_prompt(self, prompt: Optional[str] = None,
+                      messages: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Build the prompt for a request.
+
+        Args:
+            prompt: A single user message (sent raw when there is no template)
+            messages: A conversation, used instead of prompt when given
+
+        Returns:
+            Prompt text for the backend
+        """
+        if messages:
+            return self.render(messages)
+        if not self.active:
+            return prompt or ""
+        return self.render([{"role": "user", "content": prompt or ""}])
+
+    def system_prefix(self, prompt: str, messages: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+        """
+        The start of a rendered prompt that holds its system turn.
+
+        The leading system messages are rendered on their own, followed by
+        a placeholder user turn; the text before the placeholder that the
+        prompt starts with is the system part, including any default system
+        prompt the template adds. Templates that fold the system prompt into
+        the first user turn are handled the same way.
+
+        Args:
+            prompt: Prompt text rendered by format_prompt()
+            messages: The conversation it was rendered from, if any
+
+        Returns:
+            Prefix of prompt, or None when nothing precedes the first message's text
+        """
+        system = []
+        for message in messages or []:
+            if message["role"] != "system":
+                break
+            system.append(message)
+        if not system and not self.active:
+            return None
+        try:
+            text = self.render(system + [{"role": "user", "content": _PROBE}], add_generation_prompt=False)
+        except ValueError:
+            return None
+        text = text[:text.find(_PROBE)] if _PROBE in text else text
+        return os.path.commonprefix([text, prompt]) or None
+
+    def logits_processor(self, temperature: float):
+        """Processor that ends the turn on any stop token id, or None if EOS is the only one."""
+        if self.eos_id is None or not any(i != self.eos_id for i in self.stop_token_ids):
+            return None
+        return end_of_turn_processor(self.eos_id, self.stop_token_ids, temperature)
+
+    def describe(self) -> Dict[str, Any]:
+        """Summary for /status."""
+        return {
+            "template": "gguf" if self.active else None,
+            "stop": self.stop,
+            "stop_token_ids": self.stop_token_ids,
+        }
+
+
+def _token_text(backend: InferenceBackend, token_id: Optional[int]) -> str:
+    """Text of a vocabulary token, including special tokens."""
+    if token_id is None:
+        return ""
+    llama_model = getattr(backend, "_model", None)
+    if llama_model is not None and hasattr(llama_model, "token_get_text"):
+        return llama_model.token_get_text(token_id)
+    return backend.detokenize([token_id]).decode("utf-8", errors="ignore")
+
+
+def _turn_suffix(chat_format: ChatFormat) -> str:
+    """Text the template writes right after an assistant message, e.g. "<|im_end|>"."""
+    try:
+        text = chat_format.render(
+            [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": _PROBE}],
+            add_generation_prompt=False,
+        )
+    except Exception:
+        return ""
+    end = text.find(_PROBE)
+    if end < 0:
+        return ""
+    suffix = text[end + len(_PROBE):].strip()
+    # Up to the next line: later text belongs to the next turn
+    return suffix.splitlines()[0].strip() if suffix else ""
+
+
+def load_chat_format(model_path: Optional[Path], backend: InferenceBackend) -> ChatFormat:
+    """
+    Build the chat format of a loaded model from its GGUF metadata.
+
+    Args:
+        model_path: The model's .gguf file, or None for backends without one
+        backend: Loaded backend, used to look up token text
+
+    Returns:
+        ChatFormat; raw prompts with DEFAULT_STOP when CHAT_TEMPLATE=off or the
+        model has no usable template
+    """
+    if settings.chat_template == "off" or model_path is None:
+        return ChatFormat()
+
+    try:
+        metadata = read_gguf_metadata(model_path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read chat template: {e}")
+        return ChatFormat()
+
+    template = metadata.get("tokenizer.chat_template")
+    if not isinstance(template, str) or not template.strip():
+        logger.info("Model has no chat template; prompts are sent raw")
+        return ChatFormat()
+
+    eos_id = metadata.get("tokenizer.ggml.eos_token_id")
+    stop_ids = sorted({metadata[key] for key in END_OF_TURN_KEYS if isinstance(metadata.get(key), int)})
+    try:
+        compile_template(template)
+    except Exception as e:
+        logger.warning(f"Chat template does not compile ({e}); prompts are sent raw")
+        return ChatFormat()
+
+    chat_format = ChatFormat(
+        template,
+        bos_token=_token_text(backend, metadata.get("tokenizer.ggml.bos_token_id")),
+        eos_token=_token_text(backend, eos_id),
+        eos_id=eos_id,
+        stop_token_ids=stop_ids,
+        stop=[],
+    )
+    # Text forms of the end-of-turn markers catch them if they are generated as plain text
+    stops = [_turn_suffix(chat_format)] + [_token_text(backend, i) for i in stop_ids]
+    chat_format.stop = [s for i, s in enumerate(stops) if s and s not in stops[:i]]
+    logger.info(f"Chat template loaded from GGUF (stops: {chat_format.stop}, stop ids: {stop_ids})")
+    return chat_format
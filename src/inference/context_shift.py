@@ -0,0 +1,230 @@
+"""KV context shifting: keep generating past a full context window."""
+
+import time
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from src.inference.backends import InferenceBackend
+from src.utils.config import settings
+
+
+def supports_context_shift(model: InferenceBackend) -> bool:
+    """Whether a backend exposes the llama context needed to shift its KV cache."""
+    return all(hasattr(model, attr) for attr in ("_ctx", "eval", "sample", "input_ids", "n_tokens"))
+
+
+def pinned_token_count(model: InferenceBackend, prompt: str, tokens: List[int],
+                       pinned_prefix: Optional[str] = None) -> int:
+    """
+    Number of leading tokens that are never discarded.
+
+    The pinned prefix is the given system turn (see ChatFormat.system_prefix),
+    or else the prompt up to its first blank line, capped at CONTEXT_KEEP_TOKENS.
+
+    Args:
+        model: Loaded backend
+        prompt: Full prompt text
+        tokens: Tokenized prompt
+        pinned_prefix: Text at the start of the prompt to keep, if known
+
+    Returns:
+        Token count, at most half the context window
+    """
+    if pinned_prefix is None:
+        end = prompt.find("\n\n")
+        pinned_prefix = prompt[:end + 2] if end >= 0 else ""
+    n_keep = len(model.tokenize(pinned_prefix.encode("utf-8"), special=True)) if pinned_prefix else 1
+    return max(1, min(n_keep, settings.context_keep_tokens, len(tokens), model.n_ctx() // 2))
+
+
+def _shift(model: InferenceBackend, n_keep: int, n_discard: int):
+    """Drop n_discard tokens after the pinned prefix and slide the rest down."""
+    n_past = model.n_tokens
+    model._ctx.kv_cache_seq_rm(0, n_keep, n_keep + n_discard)
+    model._ctx.kv_cache_seq_shift(0, n_keep + n_discard, n_past, -n_discard)
+    model.input_ids[n_keep:n_past - n_discard] = model.input_ids[n_keep + n_discard:n_past].copy()
+    model.scores[n_past - n_discard - 1, :] = model.scores[n_past - 1, :]
+    model.n_tokens = n_past - n_discard
+
+
+def _decode(generated: bytes):
+    """
+    Decode generated bytes, replacing invalid sequences.
+
+    Returns:
+        Tuple of (text, or None while the last character is incomplete; cleaned bytes)
+    """
+    while True:
+        try:
+            return generated.decode("utf-8"), generated
+        except UnicodeDecodeError as e:
+            if e.end == len(generated) and e.reason == "unexpected end of data":
+                return None, generated
+            generated = generated[:e.start] + "\ufffd".encode("utf-8") + generated[e.end:]
+
+
+def _stop_hold(text: str, stop: List[str]) -> int:
+    """Length of the tail of text that could be the start of a stop sequence."""
+    hold = 0
+    for sequence in stop:
+        for size in range(min(len(sequence) - 1, len(text)), 0, -1):
+            if text.endswith(sequence[:size]):
+                hold = max(hold, size)
+                break
+    return hold
+
+
+def _shifting_chunks(model: InferenceBackend, prompt: str, max_tokens: int,
+                     temperature: float, top_p: float, stop: List[str],
+                     timings: dict, pinned_prefix: Optional[str], grammar: Any = None,
+                     logits_processor: Any = None) -> Iterator[dict]:
+    """Decode with context shifting, yielding completion chunks in Llama's format."""
+    start = time.perf_counter()
+    n_ctx = model.n_ctx()
+    tokens = model.tokenize(prompt.encode("utf-8"), special=True)
+    n_keep = pinned_token_count(model, prompt, tokens, pinned_prefix)
+    timings.update(prompt_tokens=len(tokens), pinned_tokens=n_keep, prompt_tokens_dropped=0,
+                   context_shifts=0, tokens_discarded=0)
+
+    # A prompt that cannot fit with room to answer loses its oldest middle tokens
+    reserve = min(max_tokens, n_ctx // 4)
+    limit = n_ctx - reserve
+    if len(tokens) > limit:
+        dropped = len(tokens) - limit
+        tokens = tokens[:n_keep] + tokens[n_keep + dropped:]
+        timings["prompt_tokens_dropped"] = dropped
+
+    # Reuse the evaluated prefix left by the previous request
+    prefix = model.longest_token_prefix(model.input_ids[:model.n_tokens].tolist(), tokens)
+    model.n_tokens = min(prefix, len(tokens) - 1)
+    pending = tokens[model.n_tokens:]
+
+    if grammar is not None:
+        grammar.reset()
+
+    generated = b""
+    emitted = 0
+    stopped = False
+    finish_reason = "length"
+    completion_tokens = 0
+    first_token_at = None
+
+    while completion_tokens < max_tokens:
+        overflow = model.n_tokens + len(pending) - n_ctx
+        if overflow > 0:
+            n_discard = max(overflow, (model.n_tokens - n_keep) // 2)
+            _shift(model, n_keep, n_discard)
+            timings["context_shifts"] += 1
+            timings["tokens_discarded"] += n_discard
+
+        model.eval(pending)
+        token = model.sample(temp=temperature, top_p=top_p, grammar=grammar,
+                             logits_processor=logits_processor)
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        if token == model.token_eos():
+            finish_reason = "stop"
+            break
+        completion_tokens += 1
+        pending = [token]
+
+        text, generated = _decode(generated + model.detokenize([token]))
+        if text is None:
+            continue  # wait for the rest of a multi-byte character
+
+        stop_at = min((i for i in (text.find(s, emitted) for s in stop) if i >= 0), default=-1)
+        if stop_at >= 0:
+            if stop_at > emitted:
+                yield {"choices": [{"text": text[emitted:stop_at], "index": 0, "finish_reason": None}]}
+            stopped = True
+            finish_reason = "stop"
+            break
+
+        safe = len(text) - _stop_hold(text[emitted:], stop)
+        if safe > emitted:
+            yield {"choices": [{"text": text[emitted:safe], "index": 0, "finish_reason": None}]}
+            emitted = safe
+
+    if not stopped:
+        # Text held back in case it began a stop sequence
+        text = generated.decode("utf-8", errors="ignore")
+        if len(text) > emitted:
+            yield {"choices": [{"text": text[emitted:], "index": 0, "finish_reason": None}]}
+
+    if timings["context_shifts"] or timings["prompt_tokens_dropped"]:
+        # Shifted KV entries no longer match a fresh evaluation; only the pinned prefix is reusable
+        model.n_tokens = min(model.n_tokens, n_keep)
+
+    end = time.perf_counter()
+    timings.update(
+        completion_tokens=completion_tokens,
+        prompt_eval_s=round((first_token_at or end) - start, 3),
+        decode_s=round(end - (first_token_at or end), 3),
+    )
+    yield {
+        "choices": [{"text": "", "index": 0, "finish_reason": finish_reason}],
+        "usage": {"prompt_tokens": timings["prompt_tokens"], "completion_tokens": completion_tokens,
+                  "total_tokens": timings["prompt_tokens"] + completion_tokens},
+    }
+
+
+def complete(model: InferenceBackend, prompt: str, max_tokens: int, temperature: float,
+             top_p: float, stop: Optional[List[str]] = None, stream: bool = False,
+             timings: Optional[Dict[str, object]] = None,
+             pinned_prefix: Optional[str] = None, grammar: Any = None,
+             logits_processor: Any = None) -> Union[dict, Iterator[dict]]:
+    """
+    Run a completion, shifting the KV context if it would overflow the window.
+
+    Completions that fit go through the backend as usual (including the
+    persistent KV cache). When prompt plus max_tokens exceeds the context
+    and CONTEXT_SHIFT is on, the pinned prefix is kept, the oldest tokens
+    after it are discarded from the KV cache as the window fills, and
+    decoding continues without re-evaluating the prompt.
+
+    Args:
+        model: Loaded backend
+        prompt: Input text prompt
+        max_tokens: Maximum tokens to generate
+        temperature: Sampling temperature
+        top_p: Nucleus sampling parameter
+        stop: Stop sequences
+        stream: Return an iterator of chunks instead of one completion
+        timings: Filled with token counts and context shift statistics
+        pinned_prefix: Text at the start of the prompt that must never be discarded
+        grammar: Compiled LlamaGrammar constraining the output, or None
+        logits_processor: llama-cpp logits processor applied before sampling, or None
+
+    Returns:
+        A completion dict, or an iterator of completion chunks when stream is True
+    """
+    stop = stop or []
+    timings = timings if timings is not None else {}
+    timings.update(context_shifts=0, tokens_discarded=0, prompt_tokens_dropped=0)
+
+    shifting = False
+    if settings.context_shift and supports_context_shift(model):
+        prompt_tokens = len(model.tokenize(prompt.encode("utf-8"), special=True))
+        timings["prompt_tokens"] = prompt_tokens
+        shifting = prompt_tokens + max_tokens > model.n_ctx()
+
+    if not shifting:
+        extra = {key: value for key, value in (("grammar", grammar), ("logits_processor", logits_processor))
+                 if value is not None}
+        return model(prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p,
+                     echo=False, stream=stream, stop=stop, **extra)
+
+    chunks = _shifting_chunks(model, prompt, max_tokens, temperature, top_p, stop,
+                              timings, pinned_prefix, grammar, logits_processor)
+    if stream:
+        return chunks
+
+    text = []
+    final = None
+    for chunk in chunks:
+        text.append(chunk["choices"][0]["text"])
+        final = chunk
+    return {
+        "choices": [{"text": "".join(text), "index": 0,
+                     "finish_reason": final["choices"][0]["finish_reason"]}],
+        "usage": final["usage"],
+    }
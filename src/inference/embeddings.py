@@ -0,0 +1,237 @@
+"""Text embeddings: an embedding-mode llama context fed token-packed batches."""
+
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.inference.gguf import architecture_value, read_gguf_metadata
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# Response formats: JSON lists, or a row-major little-endian matrix
+EMBEDDING_FORMATS = ("json", "float32", "float16")
+
+
+class EmbeddingError(RuntimeError):
+    """Raised when embeddings cannot be computed (no model, unsupported backend)."""
+
+
+class InputTooLongError(ValueError):
+    """Raised when an input exceeds the batch size and truncation is off."""
+
+
+def pack_batches(lengths: List[int], batch_tokens: int) -> List[List[int]]:
+    """
+    Group inputs into batches of at most batch_tokens tokens.
+
+    Longest inputs are placed first and each batch is filled with the next
+    ones that fit, so short inputs share a decode call instead of each
+    paying for one.
+
+    Args:
+        lengths: Token count of each input (each at most batch_tokens)
+        batch_tokens: Tokens evaluated per decode call
+
+    Returns:
+        Lists of input indices, one per batch
+    """
+    batches: List[List[int]] = []
+    used: List[int] = []
+    for index in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        for b, total in enumerate(used):
+            if total + lengths[index] <= batch_tokens:
+                batches[b].append(index)
+                used[b] += lengths[index]
+                break
+        else:
+            batches.append([index])
+            used.append(lengths[index])
+    return batches
+
+
+class EmbeddingModel:
+    """
+    Embedding-mode context on a GGUF model, loaded on first use.
+
+    By default it opens the chat model's file; with mmap the weights pages
+    are shared with the chat context, so the extra memory is mostly the
+    embedding context itself. Models that declare a pooling type (BERT-style
+    embedding GGUFs) pool inside llama.cpp; for the rest, token embeddings
+    are mean-pooled here.
+    """
+
+    def __init__(self, batch_tokens: int = 2048):
+        """
+        Initialize the embedding model.
+
+        Args:
+            batch_tokens: Context and batch size; longer inputs are truncated
+        """
+        self.batch_tokens = batch_tokens
+        self.model_file: Optional[Path] = None
+        self.pooled = False
+        self._model = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "texts": 0, "tokens": 0, "batches": 0, "embed_s": 0.0}
+
+    def _ensure_loaded(self, model_path: Path) -> float:
+        """Load (or switch to) the model at model_path; returns the load time."""
+        if self._model is not None and self.model_file == model_path:
+            return 0.0
+        if settings.inference_backend != "llama":
+            raise EmbeddingError("Embeddings need the llama inference backend")
+
+        from llama_cpp import Llama
+
+        logger.info(f"Loading embedding context from: {model_path}")
+        start = time.perf_counter()
+        self._model = None
+        metadata = read_gguf_metadata(model_path)
+        self._model = Llama(
+            model_path=str(model_path),
+            embedding=True,
+            n_ctx=self.batch_tokens,
+            n_batch=self.batch_tokens,
+            n_threads=settings.n_threads or None,
+            n_threads_batch=settings.n_threads_batch or None,
+            use_mmap=settings.use_mmap,
+            verbose=False,
+        )
+        self.model_file = model_path
+        self.pooled = (architecture_value(metadata, "pooling_type") or 0) > 0
+        load_s = time.perf_counter() - start
+        logger.info(f"Embedding context ready: dim={self._model.n_embd()}, "
+                    f"pooling={'model' if self.pooled else 'mean'} ({load_s:.1f}s)")
+        return load_s
+
+    def _decode(self, token_lists: List[List[int]]) -> Any:
+        """Evaluate one packed batch; returns an (inputs, n_embd) float32 array."""
+        import llama_cpp
+        import numpy as np
+
+        model = self._model
+        ctx = model._ctx.ctx
+        batch = model._batch
+        batch.reset()
+        for seq, tokens in enumerate(token_lists):
+            for pos, token in enumerate(tokens):
+                j = batch.batch.n_tokens
+                batch.batch.token[j] = token
+                batch.batch.pos[j] = pos
+                batch.batch.seq_id[j][0] = seq
+                batch.batch.n_seq_id[j] = 1
+                # Mean pooling reads every token's output, model pooling only needs the last
+                batch.batch.logits[j] = not self.pooled or pos == len(tokens) - 1
+                batch.batch.n_tokens += 1
+
+        llama_cpp.llama_kv_cache_clear(ctx)
+        model._ctx.decode(batch)
+        n_embd = model.n_embd()
+
+        if self.pooled:
+            return np.stack([
+                np.ctypeslib.as_array(llama_cpp.llama_get_embeddings_seq(ctx, seq), shape=(n_embd,))
+                for seq in range(len(token_lists))
+            ]).astype(np.float32)
+
+        rows = np.ctypeslib.as_array(llama_cpp.llama_get_embeddings(ctx), shape=(batch.batch.n_tokens, n_embd))
+        bounds = np.cumsum([0] + [len(tokens) for tokens in token_lists])
+        return np.add.reduceat(rows, bounds[:-1], axis=0) / np.diff(bounds)[:, None]
+
+    def embed(self, texts: List[str], model_path: Path, normalize: bool = True,
+              truncate: bool = True) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Embed texts (blocking; one call at a time).
+
+        Args:
+            texts: Inputs to embed
+            model_path: GGUF file to embed with
+            normalize: Scale each vector to unit length
+            truncate: Cut inputs longer than the batch size instead of failing
+
+        Returns:
+            Tuple of (float32 array of shape (len(texts), dim), timings)
+
+        Raises:
+            EmbeddingError: If the backend cannot compute embeddings
+            InputTooLongError: If an input is too long and truncate is False
+        """
+        import numpy as np
+
+        with self._lock:
+            load_s = self._ensure_loaded(model_path)
+            start = time.perf_counter()
+
+            token_lists = []
+            truncated = 0
+            for index, text in enumerate(texts):
+                tokens = self._model.tokenize(text.encode("utf-8"), add_bos=True)
+                if len(tokens) > self.batch_tokens:
+                    if not truncate:
+                        raise InputTooLongError(f"Input {index} has {len(tokens)} tokens, "
+                                                f"more than the {self.batch_tokens} token limit")
+                    tokens = tokens[:self.batch_tokens]
+                    truncated += 1
+                token_lists.append(tokens)
+
+            vectors = np.zeros((len(texts), self._model.n_embd()), dtype=np.float32)
+            batches = pack_batches([len(tokens) for tokens in token_lists], self.batch_tokens)
+            for indices in batches:
+                vectors[indices] = self._decode([token_lists[i] for i in indices])
+            embed_s = time.perf_counter() - start
+
+        if normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms > 0, norms, 1.0)
+
+        n_tokens = sum(len(tokens) for tokens in token_lists)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["texts"] += len(texts)
+            self.stats["tokens"] += n_tokens
+            self.stats["batches"] += len(batches)
+            self.stats["embed_s"] += embed_s
+
+        timings = {
+            "texts": len(texts),
+            "tokens": n_tokens,
+            "batches": len(batches),
+            "inputs_truncated": truncated,
+            "load_s": round(load_s, 3),
+            "embed_s": round(embed_s, 4),
+            "texts_per_s": round(len(texts) / embed_s, 1) if embed_s > 0 else None,
+            "tokens_per_s": round(n_tokens / embed_s, 1) if embed_s > 0 else None,
+        }
+        return vectors, timings
+
+    def unload(self):
+        """Free the embedding context."""
+        with self._lock:
+            self._model = None
+            self.model_file = None
+
+    def get_status(self) -> Dict[str, Any]:
+        """Loaded model and lifetime throughput."""
+        with self._lock:
+            stats = dict(self.stats)
+            loaded = self._model is not None
+            dim = self._model.n_embd() if loaded else None
+        return {
+            "loaded": loaded,
+            "model": self.model_file.name if self.model_file else None,
+            "dim": dim,
+            "pooling": ("model" if self.pooled else "mean") if loaded else None,
+            "batch_tokens": self.batch_tokens,
+            "requests": stats["requests"],
+            "texts": stats["texts"],
+            "tokens": stats["tokens"],
+            "batches": stats["batches"],
+            "texts_per_s": round(stats["texts"] / stats["embed_s"], 1) if stats["embed_s"] else None,
+            "tokens_per_s": round(stats["tokens"] / stats["embed_s"], 1) if stats["embed_s"] else None,
+        }
+
+
+# Global embedding model
+embedding_model = EmbeddingModel(settings.embedding_batch_tokens)
@@ -1,79 +1,890 @@
 """Model inference engine for the Campus AI Chat Platform."""
 
+import gc
 import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
-from llama_cpp import Llama
-from huggingface_hub import hf_hub_download
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.inference.autotune import BATCH_CANDIDATES, autotune, load_profile
+from src.inference.backends import (
+    InferenceBackend,
+    load_backend,
+    release_context,
+    requires_model_file,
+    restore_context,
+)
+from src.inference.chat_template import ChatFormat, load_chat_format
+from src.inference.context_shift import complete
+from src.inference.nbest import collect, sample_n
+from src.inference.gguf import architecture_value, read_gguf_metadata
+from src.inference.grammar import GrammarSpec, grammar_cache
+from src.inference.kv_planner import GGML_TYPE_IDS, KVPlan, plan_for_model
+from src.inference.prewarm import prewarm_file
+from src.inference.repetition import finish, make_guard, with_guard
+from src.inference.streaming import stream_generate
+from src.inference.warmup import replay_prompts
 from src.utils.config import settings
 from src.utils.logger import logger
+from src.utils.queue import RequestQueue, request_queue
+
+
+# Memory needed to hold a model alongside the current one, relative to file size
+SWAP_MEMORY_FACTOR = 1.2
+
+SWAP_STRATEGIES = ("auto", "side_by_side", "sequential")
 
 
 class ModelEngine:
     """Handles model loading and inference."""
     
-    def __init__(self):
-        """Initialize the model engine."""
-        self.model: Optional[Llama] = None
+    def __init__(self, model_path: Optional[str] = None, queue: Optional[RequestQueue] = None):
+        """
+        Initialize the model engine.
+        
+        Args:
+            model_path: Model file to serve; defaults to MODEL_PATH from config.env
+            queue: Request queue for this model, resized when KV_PLAN sets concurrency
+        """
+        self.configured_path = model_path
+        self.queue = queue
+        self.model: Optional[InferenceBackend] = None
+        self.model_file: Optional[Path] = None
+        # Prompt template and stops of the served model; kept while asleep
+        self.chat_format = ChatFormat()
         self.model_loaded = False
+        self.runtime_params: dict = {}
+        self.last_used: Optional[float] = None
+        self.kv_cache = None
+        
+        # KV memory plan for the loaded model (applied only when KV_PLAN is on)
+        self.kv_plan: Optional[KVPlan] = None
+        
+        # Frequent prompt prefixes replayed before the first load reports ready
+        self.warmup_prompts: List[str] = []
+        
+        # In-flight generations per model instance, so a swapped-out model can drain
+        self._leases: dict = {}
+        # Requests routed to this engine that do not hold a lease yet
+        self._pins = 0
+        self._lease_cond = threading.Condition()
+        
+        # Generations on one model share its context, so they run one at a time
+        self._generation_locks: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        
+        # Idle policy: set to "context" or "weights" while asleep, until woken
+        self.sleep_mode: Optional[str] = None
+        self.wake_stats = {
+            kind: {"count": 0, "total_s": 0.0, "last_s": None, "max_s": None}
+            for kind in ("warm", "cold")
+        }
+        self._idle_thread: Optional[threading.Thread] = None
+        
+        # Hot swap: idle -> loading -> draining -> completed | failed
+        self.swap_status: dict = {"state": "idle"}
+        self._swap_started: Optional[float] = None
+        self._swap_thread: Optional[threading.Thread] = None
+        
+        # Load lifecycle: idle -> loading -> ready | failed
+        self.load_state = "idle"
+        self.load_error: Optional[str] = None
+        self.load_progress: dict = {}
+        self.load_report: dict = {}
+        self._weights_loaded_at: Optional[float] = None
+        self._load_started: Optional[float] = None
+        self._load_thread: Optional[threading.Thread] = None
+        
+    def _resolve_model_path(self) -> Optional[Path]:
+        """
+        Resolve the configured model path (or MODEL_PATH) to a .gguf file.
+        
+        Returns:
+            Path to the model file, or None if no model could be found
+        """
+        model_path = Path(self.configured_path or settings.model_path)
+        
+        # Check if model file exists
+        if not model_path.exists():
+            logger.error(f"Model not found: {model_path}")
+            logger.info("Run: python scripts/download_model.py")
+            return None
+        
+        # If it's a directory, look for .gguf files
+        if model_path.is_dir():
+            gguf_files = list(model_path.glob("*.gguf"))
+            if not gguf_files:
+                logger.error(f"No .gguf files found in {model_path}")
+                logger.info("Run: python scripts/download_model.py")
+                return None
+            model_path = gguf_files[0]
+            logger.info(f"Found model: {model_path.name}")
+        
+        return model_path
+    
+    def _backend_params(self, model_path: Optional[Path]) -> dict:
+        """
+        Build keyword arguments for the configured inference backend.
+        
+        When AUTOTUNE is enabled, thread and batch settings come from the saved
+        tuning profile for this model and machine, if there is one.
+        
+        Args:
+            model_path: Resolved model file, or None for backends without one
+            
+        Returns:
+            Dictionary of backend constructor arguments
+        """
+        if settings.inference_backend == "stub":
+            return {
+                "n_ctx": settings.n_ctx,
+                "prompt_eval_rate": settings.stub_prompt_eval_rate,
+                "decode_rate": settings.stub_decode_rate,
+                "jitter": settings.stub_jitter,
+                "stall_probability": settings.stub_stall_probability,
+                "stall_seconds": settings.stub_stall_seconds,
+                "failure_probability": settings.stub_failure_probability,
+                "seed": settings.stub_seed,
+            }
+        
+        # Determine if we should use GPU
+        use_gpu = settings.use_gpu.lower() in ['true', 'auto', 'yes']
+        n_gpu_layers = -1 if use_gpu else 0  # -1 means use all layers on GPU
+        
+        params = {
+            "n_ctx": settings.n_ctx,  # Context window
+            "n_batch": settings.n_batch,
+            "n_threads": settings.n_threads or None,
+            "n_threads_batch": settings.n_threads_batch or None,
+            "use_mmap": settings.use_mmap,
+            "use_mlock": settings.use_mlock,
+            "n_gpu_layers": n_gpu_layers,
+            "verbose": False,
+        }
+        
+        if settings.autotune:
+            profile = load_profile(model_path)
+            if profile:
+                logger.info(f"Using saved tuning profile: {profile}")
+                params.update(profile)
+            else:
+                # Allocate for the largest candidate so tuning can try every size
+                params["n_batch"] = max(settings.n_batch, max(BATCH_CANDIDATES))
+        
+        return params
+    
+    def _plan_kv_memory(self, model_path: Optional[Path], params: dict) -> Optional[KVPlan]:
+        """
+        Plan context size and KV type for a model file.
+        
+        With KV_PLAN on, the plan's context size and KV type replace N_CTX and
+        KV_CACHE_TYPE in params; otherwise the plan is only reported.
+        
+        Args:
+            model_path: Resolved model file, or None for backends without one
+            params: Backend constructor arguments, updated in place
+            
+        Returns:
+            The KVPlan, or None if the model's shape could not be read
+        """
+        if settings.inference_backend == "llama" and settings.kv_cache_type != "auto":
+            params["kv_type"] = settings.kv_cache_type
+        if model_path is None:
+            return None
         
+        try:
+            plan = plan_for_model(
+                model_path,
+                budget_mb=settings.kv_plan_budget_mb,
+                kv_type=settings.kv_cache_type,
+                max_ctx=settings.kv_plan_max_ctx,
+                min_ctx=settings.kv_plan_min_ctx,
+            )
+        except (OSError, ValueError) as e:
+            logger.warning(f"KV memory plan unavailable: {e}")
+            return None
+        
+        summary = (f"n_ctx={plan.n_ctx}, kv_type={plan.kv_type} "
+                   f"({plan.sequence_bytes / (1024 * 1024):.0f} MB for the context)")
+        if settings.kv_plan:
+            params["n_ctx"] = plan.n_ctx
+            if settings.inference_backend == "llama":
+                params["kv_type"] = plan.kv_type
+            logger.info(f"KV memory plan: {summary}" + (f" - {plan.note}" if plan.note else ""))
+        else:
+            logger.info(f"KV memory plan (not applied, KV_PLAN=false): {summary}")
+        return plan
+    
     def load_model(self) -> bool:
         """
         Load the language model from local storage.
-        Uses MODEL_PATH from config.env for the model file.
+        Uses MODEL_PATH from config.env for the model file, and
+        INFERENCE_BACKEND to choose between llama-cpp and the stub backend.
         
         Returns:
             bool: True if model loaded successfully, False otherwise
         """
+        self.load_state = "loading"
+        self.load_error = None
+        self._load_started = time.monotonic()
+        self.load_progress = {"phase": "resolving", "fraction": 0.0}
+        self.load_report = {}
+        self._weights_loaded_at = None
+        
         try:
-            # Get model path from settings (MODEL_PATH in config.env)
-            model_path = Path(settings.model_path)
-            
-            logger.info(f"Loading model from: {model_path}")
-            
-            # Check if model file exists
-            if not model_path.exists():
-                # If it's a directory, look for .gguf files
-                if model_path.is_dir():
-                    gguf_files = list(model_path.glob("*.gguf"))
-                    if gguf_files:
-                        model_path = gguf_files[0]
-                        logger.info(f"Found model: {model_path.name}")
-                    else:
-                        logger.error(f"No .gguf files found in {model_path}")
-                        logger.info("Run: python scripts/download_model.py")
-                        return False
-                else:
-                    logger.error(f"Model not found: {model_path}")
-                    logger.info("Run: python scripts/download_model.py")
+            backend = settings.inference_backend
+            model_path = None
+            
+            if requires_model_file(backend):
+                logger.info(f"Loading model from: {self.configured_path or settings.model_path}")
+                phase_start = time.perf_counter()
+                model_path = self._resolve_model_path()
+                if model_path is None:
+                    self._fail_load("Model file not found")
                     return False
+                self._describe_model_file(model_path)
+                self.load_report["file_open_s"] = time.perf_counter() - phase_start
+                
+                if settings.prewarm_mode != "off":
+                    self._prewarm(model_path)
             
-            # Load model with llama-cpp-python
-            logger.info("Loading model into memory...")
+            logger.info(f"Loading model into memory ({backend} backend)...")
+            self.load_progress["phase"] = "loading_weights"
+            params = self._backend_params(model_path)
+            plan = self._plan_kv_memory(model_path, params)
+            needs_tuning = (settings.autotune and backend == "llama"
+                            and load_profile(model_path) is None)
+            phase_start = time.perf_counter()
+            self.model = load_backend(
+                backend, model_path, progress_callback=self._on_load_progress, **params
+            )
+            self._record_construction_phases(phase_start, time.perf_counter())
+            self.chat_format = load_chat_format(model_path, self.model)
             
-            # Determine if we should use GPU
-            use_gpu = settings.use_gpu.lower() in ['true', 'auto', 'yes']
-            n_gpu_layers = -1 if use_gpu else 0  # -1 means use all layers on GPU
+            if needs_tuning:
+                self.load_progress["phase"] = "autotuning"
+                phase_start = time.perf_counter()
+                params.update(autotune(self.model, model_path))
+                self.load_report["autotune_s"] = time.perf_counter() - phase_start
             
-            self.model = Llama(
-                model_path=str(model_path),
-                n_ctx=2048,  # Context window
-                n_gpu_layers=n_gpu_layers,
-                verbose=False
-            )
+            if settings.kv_cache_enabled and model_path is not None:
+                self.load_progress["phase"] = "warming_kv_cache"
+                phase_start = time.perf_counter()
+                self.kv_cache = self._attach_kv_cache(self.model, model_path)
+                self.load_report["kv_cache_s"] = time.perf_counter() - phase_start
+            
+            if settings.warmup_first_token:
+                self.load_progress["phase"] = "warming_up"
+                phase_start = time.perf_counter()
+                self.model("Hello", max_tokens=1, temperature=0.0)
+                self.load_report["first_token_s"] = time.perf_counter() - phase_start
+            
+            # A cold wake skips the replay; its prefixes are already in the KV cache
+            if self.warmup_prompts and self.sleep_mode is None:
+                self._replay_warmup_prompts()
             
+            self.runtime_params = self._runtime_summary(params)
+            self.kv_plan = plan
+            self.model_file = model_path
+            self.last_used = time.monotonic()
             self.model_loaded = True
-            logger.info(f"Model loaded successfully: {model_path.name}")
+            self.load_state = "ready"
+            self.load_progress["phase"] = "ready"
+            self.load_progress["fraction"] = 1.0
+            self.load_report["total_s"] = time.monotonic() - self._load_started
+            logger.info(f"Model loaded successfully: {model_path.name if model_path else backend} "
+                        f"({self.load_report['total_s']:.1f}s)")
+            logger.info("Load phases: " + ", ".join(
+                f"{name[:-2]}={seconds:.2f}s" for name, seconds in self.load_report.items()
+                if name.endswith("_s")
+            ))
+            self.start_idle_monitor()
             return True
             
         except Exception as e:
             logger.error(f"Failed to load model: {str(e)}")
-            self.model_loaded = False
+            self._fail_load(str(e))
             return False
     
+    @staticmethod
+    def _runtime_summary(params: dict) -> dict:
+        """Pick the runtime settings worth reporting from backend params."""
+        return {
+            key: params[key]
+            for key in ("n_ctx", "kv_type", "n_batch", "n_threads", "n_threads_batch",
+                        "use_mmap", "use_mlock")
+            if key in params
+        }
+    
+    def start_background_load(self):
+        """Load the model in a background thread so the server can bind immediately."""
+        if self._load_thread is not None and self._load_thread.is_alive():
+            return
+        # Report "loading" right away rather than once the thread gets scheduled
+        self.load_state = "loading"
+        self._load_started = time.monotonic()
+        self._load_thread = threading.Thread(
+            target=self.load_model, name="model-loader", daemon=True
+        )
+        self._load_thread.start()
+    
+    def _fail_load(self, error: str):
+        """Record a failed load."""
+        self.model_loaded = False
+        self.load_state = "failed"
+        self.load_error = error
+        self.load_progress["phase"] = "failed"
+    
+    def _describe_model_file(self, model_path: Path):
+        """Record the totals that load progress is measured against."""
+        self.load_progress["bytes_total"] = model_path.stat().st_size
+        self.load_progress["bytes_loaded"] = 0
+        try:
+            metadata = read_gguf_metadata(model_path)
+            layers = architecture_value(metadata, "block_count")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read GGUF metadata: {e}")
+            layers = None
+        self.load_progress["layers_total"] = layers
+        self.load_progress["layers_loaded"] = 0 if layers else None
+    
+    def _attach_kv_cache(self, model: InferenceBackend, model_path: Path):
+        """
+        Give a model the persistent KV cache for its file and context size.
+        
+        Args:
+            model: Loaded backend
+            model_path: Model file, hashed to key the cache entries
+            
+        Returns:
+            The attached PersistentKVCache, or None if the backend has no cache hook
+        """
+        if not hasattr(model, "set_cache"):
+            return None
+        
+        from src.inference.kv_cache import PersistentKVCache, model_file_hash
+        
+        try:
+            namespace = f"{model_file_hash(model_path)}-ctx{model.n_ctx()}"
+            type_k = getattr(getattr(model, "context_params", None), "type_k", GGML_TYPE_IDS["f16"])
+            if type_k != GGML_TYPE_IDS["f16"]:
+                # Saved state is only valid for the same key cache type
+                namespace += f"-k{type_k}"
+            if self.kv_cache is not None and self.kv_cache.namespace == namespace:
+                # Reloading the same model (e.g. after an idle unload); keep the warm tier
+                model.set_cache(self.kv_cache)
+                return self.kv_cache
+            cache = PersistentKVCache(
+                settings.kv_cache_dir,
+                namespace=namespace,
+                capacity_bytes=settings.kv_cache_size_mb * 1024 * 1024,
+                ram_bytes=settings.kv_cache_ram_mb * 1024 * 1024,
+                min_prefix=settings.kv_cache_min_prefix,
+            )
+        except Exception as e:
+            logger.warning(f"KV cache disabled: {e}")
+            return None
+        
+        model.set_cache(cache)
+        status = cache.get_status()
+        logger.info(f"KV cache: {status['entries']} entries for this model, "
+                    f"{status['warm_entries']} warmed into memory ({status['ram_mb']} MB)")
+        return cache
+    
+    def _replay_warmup_prompts(self):
+        """Evaluate the mined prompt prefixes so the first matching requests start warm."""
+        self.load_progress["phase"] = "warming_prompts"
+        prompts = [self.chat_format.format_prompt(prompt) for prompt in self.warmup_prompts]
+        result = replay_prompts(self.model, prompts,
+                                settings.warmup_timeout, kv_cache=self.kv_cache)
+        self.load_report["prompt_warmup_s"] = result["seconds"]
+        self.load_report["prompt_warmup_prompts"] = result["prompts"]
+        self.load_report["prompt_warmup_tokens"] = result["prompt_tokens"]
+        self.load_report["prompt_warmup_entries"] = result["cache_entries_created"]
+        cached = (f", {result['cache_entries_created']} KV cache entries created"
+                  if self.kv_cache is not None else "")
+        logger.info(f"Prompt warmup: {result['prompts']} prefixes ({result['prompt_tokens']} tokens) "
+                    f"evaluated in {result['seconds']:.1f}s{cached}")
+    
+    def _prewarm(self, model_path: Path):
+        """Pull the model file into the page cache before the backend maps it."""
+        self.load_progress["phase"] = "prewarming"
+        
+        def on_read(done: int, total: int):
+            self.load_progress["prewarm_bytes"] = done
+        
+        try:
+            result = prewarm_file(model_path, settings.prewarm_mode,
+                                  settings.prewarm_threads, progress_callback=on_read)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Prewarm skipped: {e}")
+            return
+        
+        self.load_report["prewarm_s"] = result["seconds"]
+        if result["mb_per_s"]:
+            self.load_report["prewarm_mb_per_sec"] = round(result["mb_per_s"], 1)
+    
+    def _record_construction_phases(self, start: float, end: float):
+        """
+        Split backend construction into weight mapping and context creation.
+        
+        The load callback reaches 1.0 once every tensor is mapped; the
+        remaining constructor time is spent allocating the context and KV cache.
+        """
+        weights_done = self._weights_loaded_at
+        if weights_done is None or not start <= weights_done <= end:
+            self.load_report["weights_s"] = end - start
+            return
+        self.load_report["weights_s"] = weights_done - start
+        self.load_report["context_s"] = end - weights_done
+    
+    def _on_load_progress(self, fraction: float):
+        """Update progress from the backend's load callback."""
+        progress = self.load_progress
+        progress["fraction"] = fraction
+        if fraction >= 1.0 and self._weights_loaded_at is None:
+            self._weights_loaded_at = time.perf_counter()
+        if progress.get("bytes_total"):
+            progress["bytes_loaded"] = int(progress["bytes_total"] * fraction)
+        if progress.get("layers_total"):
+            progress["layers_loaded"] = int(progress["layers_total"] * fraction)
+    
+    def get_load_status(self) -> dict:
+        """
+        Get the model load state and progress.
+        
+        Returns:
+            Dictionary with state, progress counters, elapsed time and error
+        """
+        elapsed = None
+        if self._load_started is not None:
+            elapsed = round(time.monotonic() - self._load_started, 2)
+        return {
+            "state": self.load_state,
+            "elapsed": elapsed,
+            "error": self.load_error,
+            **self.load_progress,
+            "phases": {name: round(value, 3) for name, value in self.load_report.items()},
+        }
+    
+    def retry_after(self) -> int:
+        """
+        Estimate how many seconds until the model is ready.
+        
+        Returns:
+            Suggested Retry-After value in seconds (1-60)
+        """
+        fraction = self.load_progress.get("fraction") or 0.0
+        if self._load_started is None or fraction <= 0.0:
+            return 5
+        elapsed = time.monotonic() - self._load_started
+        remaining = elapsed * (1.0 - fraction) / fraction
+        return max(1, min(60, int(remaining) + 1))
+    
+    @contextmanager
+    def lease_model(self) -> Iterator[InferenceBackend]:
+        """
+        Hold the current model for the duration of one generation.
+        
+        A model that is swapped out stays alive until every lease on it has
+        been released, so in-flight requests finish on the model they started on.
+        
+        Yields:
+            The model instance to generate with
+            
+        Raises:
+            RuntimeError: If no model is loaded
+        """
+        with self._lease_cond:
+            model = self.model
+            if not self.model_loaded or model is None:
+                raise RuntimeError("Model not loaded. Call load_model() first.")
+            key = id(model)
+            self._leases[key] = self._leases.get(key, 0) + 1
+            self.last_used = time.monotonic()
+        try:
+            yield model
+        finally:
+            with self._lease_cond:
+                self._leases[key] -= 1
+                if not self._leases[key]:
+                    del self._leases[key]
+                self._lease_cond.notify_all()
+    
+    @contextmanager
+    def lock_model(self) -> Iterator[InferenceBackend]:
+        """
+        Lease the current model and wait for exclusive use of its context.
+        
+        Yields:
+            The model instance to generate with
+            
+        Raises:
+            RuntimeError: If no model is loaded
+        """
+        with self.lease_model() as model:
+            with self._lease_cond:
+                lock = self._generation_locks.setdefault(model, threading.Lock())
+            with lock:
+                yield model
+    
+    def format_prompt(self, prompt: Optional[str] = None,
+                      messages: Optional[List[Dict[str, str]]] = None) -> str:
+        """
+        Render a request into prompt text for the loaded model's chat format.
+        
+        Args:
+            prompt: A single user message
+            messages: A conversation ({"role", "content"} dicts), used instead of prompt
+            
+        Returns:
+            Prompt text; the raw prompt when the model has no chat template
+        """
+        return self.chat_format.format_prompt(prompt, messages)
+    
+    def system_prefix(self, prompt: str, messages: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+        """
+        The system turn at the start of a rendered prompt, kept by context shifting.
+        
+        Args:
+            prompt: Prompt text from format_prompt()
+            messages: The conversation it was rendered from, if any
+            
+        Returns:
+            Prefix of prompt, or None to pin the prompt up to its first blank line
+        """
+        return self.chat_format.system_prefix(prompt, messages)
+    
+    def in_flight(self) -> int:
+        """Number of generations currently holding a lease on any model instance."""
+        with self._lease_cond:
+            return sum(self._leases.values())
+    
+    @contextmanager
+    def pin(self) -> Iterator[None]:
+        """
+        Mark a request as on its way to a lease on this engine.
+        
+        The registry does not evict a pinned engine, so a request cannot
+        lose its model between being routed here and starting to generate.
+        """
+        with self._lease_cond:
+            self._pins += 1
+        try:
+            yield
+        finally:
+            with self._lease_cond:
+                self._pins -= 1
+    
+    def contended(self) -> bool:
+        """Whether a request other than a single generation is waiting on this engine."""
+        with self._lease_cond:
+            return self._pins > 1 or sum(self._leases.values()) > 1
+    
+    def busy(self) -> bool:
+        """Whether any request is generating on this engine or pinned to it."""
+        with self._lease_cond:
+            return self._pins > 0 or any(self._leases.values())
+    
+    def unload(self):
+        """
+        Release the loaded model.
+        
+        New requests are refused until the model is loaded again; generations
+        already running keep their lease and the memory is freed when they finish.
+        """
+        with self._lease_cond:
+            model, self.model = self.model, None
+            self.model_loaded = False
+            self.load_state = "idle"
+            self.load_progress = {}
+            self.load_report = {}
+            self.sleep_mode = None
+        if model is not None:
+            name = self.model_file.name if self.model_file else settings.inference_backend
+            logger.info(f"Unloaded model: {name}")
+            del model
+            gc.collect()
+    
+    def start_idle_monitor(self):
+        """Watch for inactivity and put the model to sleep after IDLE_UNLOAD_SECONDS."""
+        if settings.idle_unload_seconds <= 0:
+            return
+        if self._idle_thread is not None and self._idle_thread.is_alive():
+            return
+        self._idle_thread = threading.Thread(target=self._idle_loop, name="idle-monitor", daemon=True)
+        self._idle_thread.start()
+    
+    def _idle_loop(self):
+        """Put the model to sleep once it has gone unused for the idle period."""
+        interval = max(1.0, min(30.0, settings.idle_unload_seconds / 4))
+        while True:
+            time.sleep(interval)
+            if self.load_state != "ready" or self.last_used is None:
+                continue
+            if time.monotonic() - self.last_used >= settings.idle_unload_seconds:
+                self.sleep()
+    
+    def sleep(self) -> bool:
+        """
+        Free the context, or the whole model, of an idle engine.
+        
+        With IDLE_UNLOAD_MODE=context the weights stay mapped and only the KV
+        cache and logits buffers are freed; backends that can't release their
+        context fall back to unloading the weights. Unloaded weights usually
+        stay in the OS page cache, so waking still avoids a disk read.
+        
+        Returns:
+            bool: True if the engine went to sleep
+        """
+        mode = settings.idle_unload_mode
+        with self._lease_cond:
+            if not self.model_loaded or sum(self._leases.values()):
+                return False
+            if mode == "context" and release_context(self.model):
+                self.model_loaded = False
+                self.load_state = "sleeping"
+                self.load_progress = {"phase": "sleeping"}
+            else:
+                mode = "weights"
+                self.unload()
+            self.sleep_mode = mode
+        
+        name = self.model_file.name if self.model_file else settings.inference_backend
+        logger.info(f"Model idle for {settings.idle_unload_seconds}s; released {mode} of {name}")
+        return True
+    
+    def wake(self):
+        """Start bringing a sleeping model back. Returns immediately."""
+        with self._lease_cond:
+            if self.sleep_mode is None:
+                return
+            if self._load_thread is not None and self._load_thread.is_alive():
+                return
+            self.load_state = "loading"
+            self._load_started = time.monotonic()
+            self._load_thread = threading.Thread(target=self._wake_worker, name="model-wake", daemon=True)
+            self._load_thread.start()
+    
+    def _wake_worker(self):
+        """Restore the context or reload the weights, and record the wake latency."""
+        mode = self.sleep_mode
+        start = time.perf_counter()
+        
+        if mode == "context":
+            self.load_progress = {"phase": "waking", "fraction": 0.0}
+            try:
+                restore_context(self.model)
+                with self._lease_cond:
+                    self.model_loaded = True
+                    self.load_state = "ready"
+                    self.load_progress = {"phase": "ready", "fraction": 1.0}
+                    self.last_used = time.monotonic()
+                ok = True
+            except Exception as e:
+                logger.error(f"Failed to restore model context: {str(e)}")
+                self._fail_load(str(e))
+                ok = False
+        else:
+            ok = self.load_model()
+        
+        self.sleep_mode = None
+        if ok:
+            kind = "warm" if mode == "context" else "cold"
+            seconds = time.perf_counter() - start
+            stats = self.wake_stats[kind]
+            stats["count"] += 1
+            stats["total_s"] += seconds
+            stats["last_s"] = seconds
+            stats["max_s"] = max(stats["max_s"] or 0.0, seconds)
+            logger.info(f"Model woke ({kind}) in {seconds:.2f}s")
+    
+    def start_swap(self, model_path: str, strategy: Optional[str] = None) -> dict:
+        """
+        Replace the loaded model without restarting the server.
+        
+        With the side_by_side strategy the new model is loaded while the old
+        one keeps serving, new requests switch over atomically, and the old
+        model is freed once its in-flight requests drain. The sequential
+        strategy, used by "auto" when there is not enough free memory for
+        both, stops admitting requests and drains the old model before
+        loading the new one.
+        
+        Args:
+            model_path: Path to a .gguf file or a directory containing one
+            strategy: "auto", "side_by_side" or "sequential" (default SWAP_STRATEGY)
+            
+        Returns:
+            The initial swap status
+            
+        Raises:
+            ValueError: If the path, strategy or backend cannot be swapped
+            RuntimeError: If a load or another swap is already in progress
+        """
+        strategy = strategy or settings.swap_strategy
+        if strategy not in SWAP_STRATEGIES:
+            raise ValueError(f"Unknown swap strategy '{strategy}'. Use one of: {', '.join(SWAP_STRATEGIES)}")
+        if not requires_model_file(settings.inference_backend):
+            raise ValueError(f"The {settings.inference_backend} backend has no model file to swap")
+        
+        path = Path(model_path)
+        if path.is_dir():
+            gguf_files = sorted(path.glob("*.gguf"))
+            if not gguf_files:
+                raise ValueError(f"No .gguf files found in {path}")
+            path = gguf_files[0]
+        if not path.is_file():
+            raise ValueError(f"Model not found: {path}")
+        
+        if self.load_state == "loading" or self.swap_status["state"] in ("loading", "draining"):
+            raise RuntimeError("A model load or swap is already in progress")
+        
+        if strategy == "auto":
+            strategy = "side_by_side" if self._fits_alongside(path) else "sequential"
+        
+        self._swap_started = time.monotonic()
+        self.swap_status = {
+            "state": "loading",
+            "strategy": strategy,
+            "from": self.model_file.name if self.model_file else None,
+            "to": path.name,
+            "fraction": 0.0,
+            "in_flight": 0,
+            "error": None,
+        }
+        logger.info(f"Swapping model to {path.name} ({strategy})")
+        
+        self._swap_thread = threading.Thread(
+            target=self._run_swap, args=(path, strategy), name="model-swap", daemon=True
+        )
+        self._swap_thread.start()
+        return self.get_swap_status()
+    
+    def _fits_alongside(self, model_path: Path) -> bool:
+        """Whether free memory can hold the new model next to the current one."""
+        try:
+            import psutil
+        except ImportError:
+            return True
+        needed = model_path.stat().st_size * SWAP_MEMORY_FACTOR
+        return psutil.virtual_memory().available >= needed
+    
+    def _run_swap(self, model_path: Path, strategy: str):
+        """Load the new model, switch over and drain the old one."""
+        status = self.swap_status
+        old = None
+        
+        def on_progress(fraction: float):
+            status["fraction"] = fraction
+            if strategy == "sequential":
+                self._on_load_progress(fraction)
+        
+        try:
+            if strategy == "sequential" and self.model is not None:
+                # Stop admitting requests; they get 503 + Retry-After until the new model is up
+                with self._lease_cond:
+                    old, self.model = self.model, None
+                    self.model_loaded = False
+                    self.load_state = "loading"
+                    self._load_started = time.monotonic()
+                    self.load_progress = {"phase": "draining", "fraction": 0.0}
+                status["state"] = "draining"
+                self._drain(old)
+                old = None
+                gc.collect()
+                status["state"] = "loading"
+                self.load_progress["phase"] = "loading_weights"
+            
+            # Saved tuning profiles apply; autotuning is skipped because its
+            # measurements would compete with the traffic on the current model
+            params = self._backend_params(model_path)
+            plan = self._plan_kv_memory(model_path, params)
+            if settings.autotune and load_profile(model_path) is None:
+                params["n_batch"] = settings.n_batch
+            new_model = load_backend(
+                settings.inference_backend, model_path, progress_callback=on_progress, **params
+            )
+            new_cache = None
+            if settings.kv_cache_enabled:
+                new_cache = self._attach_kv_cache(new_model, model_path)
+            if settings.warmup_first_token:
+                new_model("Hello", max_tokens=1, temperature=0.0)
+            new_format = load_chat_format(model_path, new_model)
+            
+            with self._lease_cond:
+                old, self.model = self.model, new_model
+                self.model_file = model_path
+                self.chat_format = new_format
+                self.kv_cache = new_cache
+                if self.configured_path:
+                    self.configured_path = str(model_path)
+                else:
+                    settings.model_path = str(model_path)
+                self.runtime_params = self._runtime_summary(params)
+                self.kv_plan = plan
+                self.model_loaded = True
+                self.load_state = "ready"
+                self.load_error = None
+                self.sleep_mode = None
+                self.last_used = time.monotonic()
+                self.load_progress["phase"] = "ready"
+                self.load_progress["fraction"] = 1.0
+            new_model = None
+            logger.info(f"Now serving {model_path.name}")
+            
+            if old is not None:
+                status["state"] = "draining"
+                self._drain(old)
+                old = None
+                gc.collect()
+            
+            status["state"] = "completed"
+            logger.info(f"Model swap finished in {time.monotonic() - self._swap_started:.1f}s")
+            
+        except Exception as e:
+            logger.error(f"Model swap failed: {str(e)}")
+            status["state"] = "failed"
+            status["error"] = str(e)
+            if self.model is None:
+                self._fail_load(str(e))
+    
+    def _drain(self, model: InferenceBackend):
+        """Wait for in-flight requests on a swapped-out model to finish."""
+        deadline = time.monotonic() + settings.swap_drain_timeout
+        key = id(model)
+        with self._lease_cond:
+            while True:
+                remaining = self._leases.get(key, 0)
+                self.swap_status["in_flight"] = remaining
+                if remaining == 0:
+                    return
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    # Remaining streams keep their own reference; memory is freed when they end
+                    logger.warning(f"Drain timed out with {remaining} request(s) still on the old model")
+                    return
+                self._lease_cond.wait(timeout=min(wait, 1.0))
+    
+    def get_swap_status(self) -> dict:
+        """
+        Get the state of the current or most recent model swap.
+        
+        Returns:
+            Dictionary with state, strategy, source and target models, load
+            fraction, requests still draining, elapsed time and error
+        """
+        elapsed = None
+        if self._swap_started is not None:
+            elapsed = round(time.monotonic() - self._swap_started, 2)
+        return {**self.swap_status, "elapsed": elapsed}
+    
     def generate(self, prompt: str, max_tokens: Optional[int] = None, 
                  temperature: Optional[float] = None, 
-                 top_p: Optional[float] = None) -> str:
+                 top_p: Optional[float] = None,
+                 timings: Optional[dict] = None,
+                 grammar: Optional[GrammarSpec] = None,
+                 pinned_prefix: Optional[str] = None) -> str:
         """
         Generate text from a prompt.
         
@@ -82,40 +893,151 @@ class ModelEngine:
             max_tokens: Maximum tokens to generate
             temperature: Sampling temperature
             top_p: Nucleus sampling parameter
+            timings: Filled with token counts, finish reason, context shift and repetition statistics
+            grammar: Grammar the output must follow, or None for free text
+            pinned_prefix: Start of the prompt kept by context shifting (see system_prefix())
             
         Returns:
             Generated text string
         """
-        if not self.model_loaded or self.model is None:
-            raise RuntimeError("Model not loaded. Call load_model() first.")
-        
         # Use defaults from settings if not provided
         max_tokens = max_tokens or settings.max_tokens
         temperature = temperature or settings.temperature
         top_p = top_p or settings.top_p
         
-        try:
-            logger.info(f"Generating response (max_tokens={max_tokens}, temp={temperature})")
+        with self.lock_model() as model, grammar_cache.use(grammar) as compiled:
+            try:
+                logger.info(f"Generating response (max_tokens={max_tokens}, temp={temperature})")
+                
+                # Generate response, shifting the context if it would overflow
+                timings = timings if timings is not None else {}
+                guard = make_guard(model, compiled)
+                response = complete(
+                    model,
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    stop=self.chat_format.stop,  # The model's end-of-turn markers
+                    timings=timings,
+                    pinned_prefix=pinned_prefix,
+                    grammar=compiled,
+                    logits_processor=with_guard(self.chat_format.logits_processor(temperature), guard)
+                )
+                usage = response.get("usage") or {}
+                timings["finish_reason"] = response['choices'][0].get('finish_reason')
+                timings.setdefault("prompt_tokens", usage.get("prompt_tokens"))
+                timings.setdefault("completion_tokens", usage.get("completion_tokens"))
+                finish(guard, timings, max_tokens)
+                if timings["context_shifts"] or timings["prompt_tokens_dropped"]:
+                    logger.info(f"Context shifted {timings['context_shifts']} times "
+                                f"({timings['tokens_discarded']} tokens discarded, "
+                                f"{timings['prompt_tokens_dropped']} prompt tokens dropped)")
+            
+                # Extract generated text
+                generated_text = response['choices'][0]['text'].strip()
+                
+                logger.info(f"Generated {len(generated_text)} characters")
+                return generated_text
+                
+            except Exception as e:
+                logger.error(f"Error during generation: {str(e)}")
+                raise
+    
+    def stream(self, prompt: str, max_tokens: Optional[int] = None,
+               temperature: Optional[float] = None, top_p: Optional[float] = None,
+               timings: Optional[dict] = None,
+               grammar: Optional[GrammarSpec] = None,
+               pinned_prefix: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream generated tokens, holding the model until the iterator is closed.
+        
+        Blocks while decoding; run it with streaming.start_stream().
+        
+        Args:
+            prompt: Input text prompt
+            max_tokens: Maximum tokens to generate
+            temperature: Sampling temperature
+            top_p: Nucleus sampling parameter
+            timings: Filled with token counts, finish reason, context shift and repetition statistics
+            grammar: Grammar the output must follow, or None for free text
+            pinned_prefix: Start of the prompt kept by context shifting (see system_prefix())
             
-            # Generate response
-            response = self.model(
+        Yields:
+            Generated text tokens one at a time
+        """
+        max_tokens = max_tokens or settings.max_tokens
+        timings = timings if timings is not None else {}
+        with self.lock_model() as model, grammar_cache.use(grammar) as compiled:
+            guard = make_guard(model, compiled)
+            yield from stream_generate(
+                model,
                 prompt,
                 max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=top_p,
-                echo=False,  # Don't echo the prompt
-                stop=["</s>", "User:", "\n\n\n"]  # Stop sequences
+                temperature=temperature or settings.temperature,
+                top_p=top_p or settings.top_p,
+                timings=timings,
+                grammar=compiled,
+                stop=self.chat_format.stop,
+                pinned_prefix=pinned_prefix,
+                logits_processor=with_guard(
+                    self.chat_format.logits_processor(temperature or settings.temperature), guard
+                )
             )
+            finish(guard, timings, max_tokens)
+    
+    def stream_n(self, prompt: str, n: int, max_tokens: Optional[int] = None,
+                 temperature: Optional[float] = None, top_p: Optional[float] = None,
+                 timings: Optional[dict] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Stream n completions of one prompt, holding the model until the iterator is closed.
+        
+        The prompt is evaluated once and the completions are decoded together
+        (see nbest.sample_n).
+        
+        Args:
+            prompt: Input text prompt
+            n: Number of completions
+            max_tokens: Maximum tokens per completion
+            temperature: Sampling temperature
+            top_p: Nucleus sampling parameter
+            timings: Filled with token counts and per-completion finish reasons
             
-            # Extract generated text
-            generated_text = response['choices'][0]['text'].strip()
-            
-            logger.info(f"Generated {len(generated_text)} characters")
-            return generated_text
+        Yields:
+            (completion index, text) pieces, interleaved across completions
+        """
+        with self.lock_model() as model:
+            logger.info(f"Generating {n} completions (max_tokens={max_tokens or settings.max_tokens})")
+            yield from sample_n(
+                model,
+                prompt,
+                n,
+                max_tokens=max_tokens or settings.max_tokens,
+                temperature=temperature or settings.temperature,
+                top_p=top_p or settings.top_p,
+                stop=self.chat_format.stop,
+                stop_token_ids=self.chat_format.stop_token_ids,
+                timings=timings
+            )
+    
+    def generate_n(self, prompt: str, n: int, max_tokens: Optional[int] = None,
+                   temperature: Optional[float] = None, top_p: Optional[float] = None,
+                   timings: Optional[dict] = None) -> List[str]:
+        """
+        Generate n completions of one prompt from a single prompt evaluation.
+        
+        Args:
+            prompt: Input text prompt
+            n: Number of completions
+            max_tokens: Maximum tokens per completion
+            temperature: Sampling temperature
+            top_p: Nucleus sampling parameter
+            timings: Filled with token counts and per-completion finish reasons
             
-        except Exception as e:
-            logger.error(f"Error during generation: {str(e)}")
-            raise
+        Returns:
+            Generated texts, in completion index order
+        """
+        return collect(self.stream_n(prompt, n, max_tokens, temperature, top_p, timings), n)
     
     def get_model_info(self) -> dict:
         """
@@ -126,13 +1048,47 @@ class ModelEngine:
         """
         return {
             "model_name": settings.hf_model,
+            "backend": settings.inference_backend,
             "loaded": self.model_loaded,
-            "model_path": settings.model_path,
+            "model_path": self.configured_path or settings.model_path,
+            "model_file": self.model_file.name if self.model_file else None,
             "max_tokens": settings.max_tokens,
             "temperature": settings.temperature,
-            "top_p": settings.top_p
+            "top_p": settings.top_p,
+            "runtime": self.runtime_params,
+            "idle": self.get_idle_status(),
+            "kv_cache": self.kv_cache.get_status() if self.kv_cache else None,
+            "kv_plan": dict(self.kv_plan.as_status(), applied=settings.kv_plan) if self.kv_plan else None,
+            "chat_format": self.chat_format.describe()
+        }
+    
+    def get_idle_status(self) -> dict:
+        """
+        Get the idle policy and cold/warm wake latency metrics.
+        
+        Returns:
+            Dictionary with policy settings, sleep state, idle time and wake stats
+        """
+        wakes = {}
+        for kind, stats in self.wake_stats.items():
+            count = stats["count"]
+            wakes[kind] = {
+                "count": count,
+                "mean_s": round(stats["total_s"] / count, 3) if count else None,
+                "last_s": round(stats["last_s"], 3) if stats["last_s"] is not None else None,
+                "max_s": round(stats["max_s"], 3) if stats["max_s"] is not None else None,
+            }
+        idle_seconds = None
+        if self.last_used is not None:
+            idle_seconds = round(time.monotonic() - self.last_used, 1)
+        return {
+            "unload_after_s": settings.idle_unload_seconds,
+            "mode": settings.idle_unload_mode,
+            "sleeping": self.sleep_mode,
+            "idle_seconds": idle_seconds,
+            "wakes": wakes,
         }
 
 
 # Global model engine instance
-model_engine = ModelEngine()
+model_engine = ModelEngine(queue=request_queue)
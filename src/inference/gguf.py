@@ -0,0 +1,141 @@
+"""Minimal GGUF header reader for model metadata."""
+
+import struct
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, NamedTuple
+
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types
+_SCALAR_FORMATS = {
+    0: "<B",   # uint8
+    1: "<b",   # int8
+    2: "<H",   # uint16
+    3: "<h",   # int16
+    4: "<I",   # uint32
+    5: "<i",   # int32
+    6: "<f",   # float32
+    7: "<?",   # bool
+    10: "<Q",  # uint64
+    11: "<q",  # int64
+    12: "<d",  # float64
+}
+_TYPE_STRING = 8
+_TYPE_ARRAY = 9
+
+
+class _SkippedArray(NamedTuple):
+    """Placeholder for an array too long to decode."""
+    count: int
+
+
+def _read(f: BinaryIO, fmt: str):
+    """Read one little-endian value."""
+    size = struct.calcsize(fmt)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Unexpected end of GGUF header")
+    return struct.unpack(fmt, data)[0]
+
+
+def _read_string(f: BinaryIO) -> str:
+    """Read a length-prefixed UTF-8 string."""
+    length = _read(f, "<Q")
+    return f.read(length).decode("utf-8", errors="replace")
+
+
+def _skip_value(f: BinaryIO, value_type: int):
+    """Skip over a value without decoding it."""
+    if value_type in _SCALAR_FORMATS:
+        f.seek(struct.calcsize(_SCALAR_FORMATS[value_type]), 1)
+    elif value_type == _TYPE_STRING:
+        f.seek(_read(f, "<Q"), 1)
+    elif value_type == _TYPE_ARRAY:
+        item_type = _read(f, "<I")
+        count = _read(f, "<Q")
+        if item_type in _SCALAR_FORMATS:
+            f.seek(count * struct.calcsize(_SCALAR_FORMATS[item_type]), 1)
+        else:
+            for _ in range(count):
+                _skip_value(f, item_type)
+    else:
+        raise ValueError(f"Unknown GGUF value type: {value_type}")
+
+
+def _read_value(f: BinaryIO, value_type: int, max_array_len: int) -> Any:
+    """Read a value; arrays longer than max_array_len are skipped and only their length returned."""
+    if value_type in _SCALAR_FORMATS:
+        return _read(f, _SCALAR_FORMATS[value_type])
+    if value_type == _TYPE_STRING:
+        return _read_string(f)
+    if value_type == _TYPE_ARRAY:
+        item_type = _read(f, "<I")
+        count = _read(f, "<Q")
+        if count > max_array_len:
+            start = f.tell()
+            if item_type in _SCALAR_FORMATS:
+                f.seek(start + count * struct.calcsize(_SCALAR_FORMATS[item_type]))
+            else:
+                for _ in range(count):
+                    _skip_value(f, item_type)
+            return _SkippedArray(count)
+        return [_read_value(f, item_type, max_array_len) for _ in range(count)]
+    raise ValueError(f"Unknown GGUF value type: {value_type}")
+
+
+def read_gguf_metadata(path: Path, max_array_len: int = 64) -> Dict[str, Any]:
+    """
+    Read the key/value metadata from a GGUF file header.
+
+    Only the header is read, so this is cheap even for multi-GB models.
+    Large arrays (such as the tokenizer vocabulary) are skipped; their
+    lengths are kept under ``<key>.count``.
+
+    Args:
+        path: Path to the .gguf file
+        max_array_len: Arrays longer than this are omitted from the result
+
+    Returns:
+        Mapping of metadata key to value
+
+    Raises:
+        ValueError: If the file is not a GGUF file
+    """
+    with open(path, "rb") as f:
+        if f.read(4) != GGUF_MAGIC:
+            raise ValueError(f"Not a GGUF file: {path}")
+
+        version = _read(f, "<I")
+        if version == 1:
+            raise ValueError(f"GGUF version 1 is not supported: {path}")
+        _read(f, "<Q")  # tensor count
+        kv_count = _read(f, "<Q")
+
+        metadata: Dict[str, Any] = {"gguf.version": version}
+        for _ in range(kv_count):
+            key = _read_string(f)
+            value_type = _read(f, "<I")
+            value = _read_value(f, value_type, max_array_len)
+            if isinstance(value, _SkippedArray):
+                metadata[f"{key}.count"] = value.count
+            else:
+                metadata[key] = value
+
+    return metadata
+
+
+def architecture_value(metadata: Dict[str, Any], name: str, default: Any = None) -> Any:
+    """
+    Look up an architecture-scoped key such as ``llama.block_count``.
+
+    Args:
+        metadata: Output of read_gguf_metadata
+        name: Key without the architecture prefix (e.g. "block_count")
+        default: Value returned when the key is missing
+
+    Returns:
+        The metadata value or default
+    """
+    arch = metadata.get("general.architecture", "llama")
+    return metadata.get(f"{arch}.{name}", default)
@@ -0,0 +1,440 @@
+"""Grammar-constrained decoding: GBNF and JSON schema grammars with a compiled-grammar cache."""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# GrammarSpec kinds
+GRAMMAR_KINDS = ("gbnf", "json_schema")
+
+
+class GrammarError(ValueError):
+    """Raised when a grammar or JSON schema is invalid or cannot be compiled."""
+
+
+@dataclass(frozen=True)
+class GrammarSpec:
+    """A requested output grammar: GBNF text or a JSON schema (serialized as given)."""
+    kind: str
+    source: str
+
+    @property
+    def key(self) -> str:
+        """Cache key: hash of the kind and source."""
+        return hashlib.sha256(f"{self.kind}\0{self.source}".encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_request(cls, grammar: Optional[str] = None,
+                     json_schema: Optional[Dict[str, Any]] = None) -> Optional["GrammarSpec"]:
+        """
+        Build a spec from request fields.
+
+        Args:
+            grammar: GBNF grammar text
+            json_schema: JSON schema the output must match
+
+        Returns:
+            GrammarSpec, or None if neither was given
+
+        Raises:
+            GrammarError: If both were given
+        """
+        if grammar and json_schema is not None:
+            raise GrammarError("Give either grammar or json_schema, not both")
+        if grammar:
+            return cls("gbnf", grammar)
+        if json_schema is not None:
+            # Key order is kept: it sets the property order of the generated JSON
+            return cls("json_schema", json.dumps(json_schema))
+        return None
+
+
+class _Entry:
+    """A compiled grammar; its lock gives one generation at a time use of its parser state."""
+
+    def __init__(self, grammar: Any, compile_s: float):
+        self.grammar = grammar
+        self.compile_s = compile_s
+        self.lock = threading.Lock()
+
+
+class _GbnfParser:
+    """
+    Reads GBNF into rules of alternatives of (kind, value, nullable quantifier) elements.
+
+    Only as much structure as check_gbnf needs: which rules are defined,
+    which are referenced, and what can come first in each rule.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.rules: Dict[str, list] = {}
+
+    def _skip(self):
+        text = self.text
+        while self.pos < len(text):
+            if text[self.pos].isspace():
+                self.pos += 1
+            elif text[self.pos] == "#":
+                end = text.find("\n", self.pos)
+                self.pos = len(text) if end < 0 else end
+            else:
+                break
+
+    def _name(self) -> str:
+        start = self.pos
+        while self.pos < len(self.text) and (self.text[self.pos].isalnum() or self.text[self.pos] in "-_"):
+            self.pos += 1
+        return self.text[start:self.pos]
+
+    def _quoted(self, close: str) -> str:
+        """Body of a "literal" or [class]; the opening character is already consumed."""
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] != close:
+            self.pos += 2 if self.text[self.pos] == "\\" else 1
+        if self.pos >= len(self.text):
+            what = "literal" if close == '"' else "character class"
+            raise GrammarError(f"Unterminated {what} at {start - 1}")
+        self.pos += 1
+        return self.text[start:self.pos - 1]
+
+    def _defines_rule(self) -> bool:
+        """Whether a name followed by ::= starts at the current position."""
+        saved = self.pos
+        found = bool(self._name())
+        self._skip()
+        found = found and self.text.startswith("::=", self.pos)
+        self.pos = saved
+        return found
+
+    def _quantifier(self) -> bool:
+        """Consume a quantifier; True if it allows zero repetitions."""
+        text = self.text
+        if self.pos < len(text) and text[self.pos] in "*?+":
+            self.pos += 1
+            return text[self.pos - 1] != "+"
+        if self.pos < len(text) and text[self.pos] == "{":
+            end = text.find("}", self.pos)
+            if end < 0:
+                raise GrammarError(f"Unterminated repetition at {self.pos}")
+            low = text[self.pos + 1:end].split(",")[0].strip()
+            self.pos = end + 1
+            return low in ("", "0")
+        return False
+
+    def _alternatives(self, nested: bool) -> list:
+        alternatives = [[]]
+        while True:
+            self._skip()
+            if self.pos >= len(self.text):
+                break
+            char = self.text[self.pos]
+            if char == "|":
+                self.pos += 1
+                alternatives.append([])
+                continue
+            if char == ")":
+                if not nested:
+                    raise GrammarError(f"Unexpected ')' at {self.pos}")
+                break
+            if not nested and self._defines_rule():
+                break
+            self.pos += 1
+            if char == '"':
+                element = ("literal", self._quoted('"'))
+            elif char == "[":
+                element = ("class", self._quoted("]"))
+            elif char == ".":
+                element = ("any", None)
+            elif char == "(":
+                element = ("group", self._alternatives(nested=True))
+                if not self.text.startswith(")", self.pos):
+                    raise GrammarError("Unclosed '(' in grammar")
+                self.pos += 1
+            else:
+                self.pos -= 1
+                name = self._name()
+                if not name:
+                    raise GrammarError(f"Unexpected '{char}' at {self.pos}")
+                element = ("rule", name)
+            alternatives[-1].append((*element, self._quantifier()))
+        return alternatives
+
+    def parse(self) -> Dict[str, list]:
+        self._skip()
+        while self.pos < len(self.text):
+            name = self._name()
+            self._skip()
+            if not name or not self.text.startswith("::=", self.pos):
+                raise GrammarError(f"Expected a rule definition at {self.pos}")
+            self.pos += 3
+            self.rules[name] = self._alternatives(nested=False)
+            self._skip()
+        return self.rules
+
+
+def check_gbnf(text: str):
+    """
+    Reject GBNF that llama.cpp accepts but cannot run.
+
+    The bundled grammar engine segfaults on a reference to an undefined
+    rule and recurses until the process runs out of memory on a
+    left-recursive rule, neither of which an exception handler can catch.
+
+    Raises:
+        GrammarError: If root is missing, a rule is undefined or a rule is left-recursive
+    """
+    rules = _GbnfParser(text).parse()
+    if "root" not in rules:
+        raise GrammarError("Grammar has no 'root' rule")
+
+    def elements(alternatives: list) -> Iterator[tuple]:
+        for sequence in alternatives:
+            for element in sequence:
+                yield element
+                if element[0] == "group":
+                    yield from elements(element[1])
+
+    for name, alternatives in rules.items():
+        for kind, value, _ in elements(alternatives):
+            if kind == "rule" and value not in rules:
+                raise GrammarError(f"Rule '{name}' references undefined rule '{value}'")
+
+    # Rules that can match the empty string, to a fixed point
+    nullable: Dict[str, bool] = dict.fromkeys(rules, False)
+
+    def can_be_empty(element: tuple) -> bool:
+        kind, value, optional = element
+        if optional or kind == "literal" and not value:
+            return True
+        if kind == "rule":
+            return nullable[value]
+        if kind == "group":
+            return any(all(can_be_empty(e) for e in sequence) for sequence in value)
+        return False
+
+    changed = True
+    while changed:
+        changed = False
+        for name, alternatives in rules.items():
+            if not nullable[name] and any(all(can_be_empty(e) for e in sequence) for sequence in alternatives):
+                nullable[name] = changed = True
+
+    def leading(alternatives: list) -> set:
+        """Rules that can be matched first, before any input is consumed."""
+        names = set()
+        for sequence in alternatives:
+            for element in sequence:
+                if element[0] == "rule":
+                    names.add(element[1])
+                elif element[0] == "group":
+                    names |= leading(element[1])
+                if not can_be_empty(element):
+                    break
+        return names
+
+    first = {name: leading(alternatives) for name, alternatives in rules.items()}
+    for name in rules:
+        seen, pending = set(), list(first[name])
+        while pending:
+            current = pending.pop()
+            if current == name:
+                raise GrammarError(f"Rule '{name}' is left-recursive")
+            if current not in seen:
+                seen.add(current)
+                pending.extend(first[current])
+
+
+def parse_gbnf(text: str) -> Any:
+    """
+    Parse GBNF with llama-cpp's parser, keeping its error message.
+
+    LlamaGrammar.from_string prints parse errors to stdout and raises a
+    generic "rules is empty" error, so its parse loop is run here instead.
+    The bundled llama-cpp-python (0.2.56) does not support {m,n}
+    repetition counts, which newer grammars such as llama.cpp's json.gbnf
+    use; such elements have to be written out or use ?, * and +.
+
+    Raises:
+        GrammarError: With the parser's message if the grammar does not parse
+    """
+    from llama_cpp import llama_grammar
+
+    state = llama_grammar.parse_state()
+    try:
+        pos = llama_grammar.parse_space(llama_grammar.const_char_p(text), True)
+        while pos[0]:
+            pos = llama_grammar.parse_rule(state, pos)
+    except Exception as e:
+        message = str(e).splitlines()[0][:120]
+        if " at {" in message:
+            message += " ({m,n} repetition is not supported by the bundled llama.cpp)"
+        raise GrammarError(message)
+    if state.rules.empty():
+        raise GrammarError("Grammar defines no rules")
+    return llama_grammar.LlamaGrammar(state)
+
+
+def compile_grammar(spec: GrammarSpec) -> Any:
+    """
+    Compile a spec into a llama-cpp LlamaGrammar.
+
+    Raises:
+        GrammarError: If the grammar or schema is invalid
+    """
+    from llama_cpp.llama_grammar import json_schema_to_gbnf
+
+    try:
+        gbnf = json_schema_to_gbnf(spec.source) if spec.kind == "json_schema" else spec.source
+        check_gbnf(gbnf)
+        return parse_gbnf(gbnf)
+    except Exception as e:
+        raise GrammarError(f"Invalid {'JSON schema' if spec.kind == 'json_schema' else 'grammar'}: {e}")
+
+
+class GrammarCache:
+    """
+    LRU cache of compiled grammars keyed by grammar hash.
+
+    Compiling a JSON schema or a large GBNF grammar costs milliseconds to
+    seconds; course tools send the same few schemas over and over, so
+    repeats reuse the compiled grammar. Also counts how constrained
+    outputs turn out: valid, or cut off before the grammar completed.
+    """
+
+    def __init__(self, max_entries: int = 64):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Compiled grammars kept, least recently used evicted first
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "compile_s_total": 0.0,
+            "compile_s_max": 0.0,
+            "requests": 0,
+            "valid_outputs": 0,
+            "invalid_outputs": 0,
+            "completion_tokens": 0,
+        }
+
+    def _entry(self, spec: GrammarSpec, count: bool = True) -> Tuple[_Entry, bool]:
+        """Get or compile the entry for a spec; returns (entry, cache hit)."""
+        key = spec.key
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.stats["hits"] += 1
+                return entry, True
+
+        start = time.perf_counter()
+        compiled = compile_grammar(spec)
+        entry = _Entry(compiled, time.perf_counter() - start)
+        with self._lock:
+            self.stats["misses"] += 1
+            self.stats["compile_s_total"] += entry.compile_s
+            self.stats["compile_s_max"] = max(self.stats["compile_s_max"], entry.compile_s)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"Compiled {spec.kind} grammar in {entry.compile_s * 1000:.1f} ms")
+        return entry, False
+
+    def prepare(self, spec: GrammarSpec) -> Dict[str, Any]:
+        """
+        Compile a grammar ahead of generation so errors surface before queueing.
+
+        Args:
+            spec: Requested grammar
+
+        Returns:
+            Details for the response timings: kind, cache hit and compile time
+
+        Raises:
+            GrammarError: If the grammar or schema is invalid
+        """
+        entry, hit = self._entry(spec)
+        return {
+            "grammar": spec.kind,
+            "grammar_cache_hit": hit,
+            "grammar_compile_s": 0.0 if hit else round(entry.compile_s, 4),
+        }
+
+    @contextmanager
+    def use(self, spec: Optional[GrammarSpec]) -> Iterator[Any]:
+        """
+        Hold a compiled grammar for one generation.
+
+        Yields:
+            LlamaGrammar, or None when spec is None
+        """
+        if spec is None:
+            yield None
+            return
+        # Normally prepared moments ago; only an eviction in between compiles again
+        entry, _ = self._entry(spec, count=False)
+        with entry.lock:
+            yield entry.grammar
+
+    def record_output(self, spec: GrammarSpec, text: str, finish_reason: Optional[str],
+                      completion_tokens: Optional[int] = None):
+        """
+        Count a finished constrained generation.
+
+        Output is valid when the grammar ran to completion (and, for JSON
+        schemas, the text parses); cutting it off at max_tokens leaves it invalid.
+        """
+        valid = finish_reason == "stop"
+        if valid and spec.kind == "json_schema":
+            try:
+                json.loads(text)
+            except ValueError:
+                valid = False
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["valid_outputs" if valid else "invalid_outputs"] += 1
+            self.stats["completion_tokens"] += completion_tokens or 0
+
+    def get_status(self) -> Dict[str, Any]:
+        """Cache contents, compile times and constrained output counts."""
+        with self._lock:
+            stats = dict(self.stats)
+            cached = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            "cached_grammars": cached,
+            "max_entries": self.max_entries,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None,
+            "compile_ms_mean": (round(stats["compile_s_total"] / stats["misses"] * 1000, 2)
+                                if stats["misses"] else None),
+            "compile_ms_max": round(stats["compile_s_max"] * 1000, 2),
+            "compile_s_saved_est": (round(stats["hits"] * stats["compile_s_total"] / stats["misses"], 3)
+                                    if stats["misses"] else 0.0),
+            "constrained_requests": stats["requests"],
+            "valid_outputs": stats["valid_outputs"],
+            "invalid_outputs": stats["invalid_outputs"],
+            "constrained_completion_tokens": stats["completion_tokens"],
+        }
+
+
+# Global compiled grammar cache
+grammar_cache = GrammarCache(settings.grammar_cache_size)
@@ -0,0 +1,306 @@
+"""Persistent llama prompt/KV state cache that survives restarts."""
+
+import hashlib
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_cpp.llama import Llama, LlamaState
+from llama_cpp.llama_cache import BaseLlamaCache
+
+from src.utils.logger import logger
+
+
+# Bytes hashed from each end of the model file
+HASH_SAMPLE_BYTES = 4 * 1024 * 1024
+
+# Pending writes beyond this are dropped rather than delaying generation
+WRITE_QUEUE_SIZE = 4
+
+# Seconds between saves of the hit counters when no states are being written
+USAGE_SAVE_INTERVAL = 10.0
+
+# Caches with a writer thread, flushed at shutdown
+_open_caches = weakref.WeakSet()
+
+
+def model_file_hash(path: Path) -> str:
+    """
+    Fingerprint a model file without reading all of it.
+
+    Hashes the size plus the first and last few MB, which covers the GGUF
+    header, the tensor layout and the final tensors, so any re-quantized or
+    re-downloaded file gets a new value.
+
+    Args:
+        path: Path to the .gguf file
+
+    Returns:
+        16-character hex digest
+    """
+    size = path.stat().st_size
+    digest = hashlib.sha256(str(size).encode("utf-8"))
+    with open(path, "rb") as f:
+        digest.update(f.read(HASH_SAMPLE_BYTES))
+        if size > HASH_SAMPLE_BYTES:
+            f.seek(max(HASH_SAMPLE_BYTES, size - HASH_SAMPLE_BYTES))
+            digest.update(f.read(HASH_SAMPLE_BYTES))
+    return digest.hexdigest()[:16]
+
+
+class CompactState:
+    """
+    LlamaState without the unused rows of the logits matrix.
+
+    ``Llama.save_state`` copies the full (n_ctx x n_vocab) scores array, but
+    only the row of the last evaluated token is needed to continue sampling.
+    """
+
+    def __init__(self, state: LlamaState):
+        """Compact a state captured by ``Llama.save_state``."""
+        self.n_ctx = len(state.input_ids)
+        self.n_tokens = state.n_tokens
+        self.input_ids = state.input_ids[: state.n_tokens].copy()
+        self.last_scores = state.scores[state.n_tokens - 1].copy()
+        self.llama_state = state.llama_state
+        self.llama_state_size = state.llama_state_size
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held by this state."""
+        return len(self.llama_state) + self.input_ids.nbytes + self.last_scores.nbytes
+
+    def expand(self) -> LlamaState:
+        """Rebuild a LlamaState that ``Llama.load_state`` accepts."""
+        input_ids = np.zeros((self.n_ctx,), dtype=np.intc)
+        input_ids[: self.n_tokens] = self.input_ids
+        scores = np.zeros((self.n_ctx, len(self.last_scores)), dtype=np.single)
+        scores[self.n_tokens - 1] = self.last_scores
+        return LlamaState(
+            input_ids=input_ids,
+            scores=scores,
+            n_tokens=self.n_tokens,
+            llama_state=self.llama_state,
+            llama_state_size=self.llama_state_size,
+        )
+
+
+class PersistentKVCache(BaseLlamaCache):
+    """
+    Disk-backed cache of evaluated prompt state for ``Llama.set_cache``.
+
+    Entries are keyed by a model namespace (file hash and context size) and
+    the token sequence, stored in a size-bounded LRU ``diskcache.Cache``
+    shared by all models. Recently used entries for the loaded model are
+    kept in memory; when the cache opens, the most frequently hit entries are
+    read from disk so common system prompts are ready before the first
+    request. Writes happen on a background thread so saving state never
+    delays the next token.
+    """
+
+    def __init__(self, cache_dir: str, namespace: str, capacity_bytes: int,
+                 ram_bytes: int, min_prefix: int):
+        """
+        Open the cache and warm the in-memory tier from disk.
+
+        Args:
+            cache_dir: Directory of the disk cache
+            namespace: Model hash and context size; entries for other models are ignored
+            capacity_bytes: Disk size limit across all models
+            ram_bytes: Memory kept for recently used entries of this model
+            min_prefix: Tokens a prompt must share with an entry for it to be used
+        """
+        import diskcache
+
+        super().__init__(capacity_bytes)
+        self.namespace = namespace
+        self.ram_bytes = ram_bytes
+        self.min_prefix = min_prefix
+        self.disk = diskcache.Cache(
+            cache_dir, size_limit=capacity_bytes, eviction_policy="least-recently-used"
+        )
+
+        self._keys = set()
+        self._usage: Dict[Tuple[int, ...], int] = self.disk.get((namespace, "usage"), {})
+        self._usage_dirty = False
+        self._ram: "OrderedDict[Tuple[int, ...], CompactState]" = OrderedDict()
+        self._ram_used = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "dropped_writes": 0}
+
+        self._writes: "queue.Queue" = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._writer = threading.Thread(target=self._write_loop, name="kv-cache-writer", daemon=True)
+        self._writer.start()
+        _open_caches.add(self)
+
+        self._warm()
+
+    # ------------------------------------------------------------
+    # BaseLlamaCache interface
+    # ------------------------------------------------------------
+
+    @property
+    def cache_size(self) -> int:
+        """Bytes used on disk."""
+        return int(self.disk.volume())
+
+    def _find_longest_prefix_key(self, key: Tuple[int, ...]) -> Optional[Tuple[int, ...]]:
+        """Cached token sequence sharing the longest prefix (at least min_prefix) with key."""
+        best_len = self.min_prefix - 1
+        best_key = None
+        with self._lock:
+            keys = list(self._keys)
+        for tokens in keys:
+            prefix_len = Llama.longest_token_prefix(tokens, key)
+            if prefix_len > best_len:
+                best_len = prefix_len
+                best_key = tokens
+        return best_key
+
+    def __getitem__(self, key: Sequence[int]) -> LlamaState:
+        tokens = self._find_longest_prefix_key(tuple(key))
+        if tokens is None:
+            self.stats["misses"] += 1
+            raise KeyError("Key not found")
+
+        with self._lock:
+            compact = self._ram.get(tokens)
+            if compact is not None:
+                self._ram.move_to_end(tokens)
+        if compact is None:
+            compact = self.disk.get((self.namespace, tokens))
+            if compact is None:
+                # Evicted from disk by another writer
+                with self._lock:
+                    self._keys.discard(tokens)
+                    self._usage.pop(tokens, None)
+                self.stats["misses"] += 1
+                raise KeyError("Key not found")
+            self._remember(tokens, compact)
+
+        self.stats["hits"] += 1
+        with self._lock:
+            self._usage[tokens] = self._usage.get(tokens, 0) + 1
+            self._usage_dirty = True
+        return compact.expand()
+
+    def __contains__(self, key: Sequence[int]) -> bool:
+        return self._find_longest_prefix_key(tuple(key)) is not None
+
+    def __setitem__(self, key: Sequence[int], value: LlamaState):
+        tokens = tuple(key)
+        if len(tokens) < self.min_prefix:
+            return
+        with self._lock:
+            if tokens in self._keys:
+                return
+
+        compact = CompactState(value)
+        try:
+            self._writes.put_nowait((tokens, compact))
+        except queue.Full:
+            self.stats["dropped_writes"] += 1
+            return
+        with self._lock:
+            self._keys.add(tokens)
+        self._remember(tokens, compact)
+
+    # ------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------
+
+    def _remember(self, tokens: Tuple[int, ...], compact: CompactState):
+        """Add an entry to the in-memory tier, evicting least recently used entries."""
+        if compact.nbytes > self.ram_bytes:
+            return
+        with self._lock:
+            self._keys.add(tokens)
+            if tokens in self._ram:
+                self._ram.move_to_end(tokens)
+                return
+            self._ram[tokens] = compact
+            self._ram_used += compact.nbytes
+            while self._ram_used > self.ram_bytes and self._ram:
+                _, evicted = self._ram.popitem(last=False)
+                self._ram_used -= evicted.nbytes
+
+    def _write_loop(self):
+        """Persist queued states, and the hit counters whenever they changed."""
+        while True:
+            try:
+                tokens, compact = self._writes.get(timeout=USAGE_SAVE_INTERVAL)
+            except queue.Empty:
+                self._save_usage()
+                continue
+            try:
+                self.disk.set((self.namespace, tokens), compact)
+                self.stats["writes"] += 1
+                self._save_usage()
+            except Exception as e:
+                logger.warning(f"KV cache write failed: {e}")
+            finally:
+                self._writes.task_done()
+
+    def _save_usage(self):
+        """Persist per-entry hit counts, used to pick entries to warm at startup."""
+        with self._lock:
+            if not self._usage_dirty:
+                return
+            usage = dict(self._usage)
+            self._usage_dirty = False
+        self.disk.set((self.namespace, "usage"), usage)
+
+    def _warm(self):
+        """Index this model's entries and load the most frequently hit into memory."""
+        entries = []
+        for key in self.disk.iterkeys():
+            if (isinstance(key, tuple) and len(key) == 2 and key[0] == self.namespace
+                    and isinstance(key[1], tuple)):
+                entries.append(key[1])
+        with self._lock:
+            self._keys.update(entries)
+
+        entries.sort(key=lambda tokens: self._usage.get(tokens, 0), reverse=True)
+        for tokens in entries:
+            if self._ram_used >= self.ram_bytes:
+                break
+            compact = self.disk.get((self.namespace, tokens))
+            if compact is not None:
+                self._remember(tokens, compact)
+
+    def flush(self, timeout: float = 30.0):
+        """Wait for queued writes to reach disk."""
+        done = threading.Event()
+
+        def wait():
+            self._writes.join()
+            self._save_usage()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        done.wait(timeout)
+
+    def get_status(self) -> Dict[str, object]:
+        """
+        Get cache size and hit statistics.
+
+        Returns:
+            Dictionary with entry counts, disk and memory use, and hit/miss counters
+        """
+        return {
+            "entries": len(self._keys),
+            "warm_entries": len(self._ram),
+            "disk_mb": round(self.cache_size / (1024 * 1024), 1),
+            "ram_mb": round(self._ram_used / (1024 * 1024), 1),
+            **self.stats,
+        }
+
+
+def flush_all(timeout: float = 30.0):
+    """Flush pending writes of every open cache, e.g. at shutdown."""
+    for cache in list(_open_caches):
+        cache.flush(timeout)
@@ -0,0 +1,237 @@
+"""KV cache memory planner: context size and KV type from model shape and RAM."""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from src.inference.gguf import architecture_value, read_gguf_metadata
+
+
+# Context sizes the planner chooses from
+CONTEXT_SIZES = (512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Key cache types in order of preference (higher precision first)
+KV_TYPES = ("f16", "q8_0", "q4_0")
+
+# (bytes per block, elements per block) of each ggml type
+KV_TYPE_LAYOUT = {
+    "f16": (2, 1),
+    "q8_0": (34, 32),
+    "q4_0": (18, 32),
+}
+
+# ggml_type enum values, for llama_context_params.type_k
+GGML_TYPE_IDS = {
+    "f16": 1,
+    "q4_0": 2,
+    "q8_0": 8,
+}
+
+# Share of the free RAM left unplanned for compute buffers and the OS
+HEADROOM = 0.2
+
+# Assumed when the GGUF header does not say
+DEFAULT_VOCAB_SIZE = 32000
+
+
+@dataclass
+class KVShape:
+    """Model dimensions that determine KV cache size."""
+    n_layer: int
+    n_head_kv: int
+    key_length: int
+    value_length: int
+    n_vocab: int
+    context_length: Optional[int] = None
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any]) -> "KVShape":
+        """
+        Read the shape from GGUF metadata.
+
+        Args:
+            metadata: Output of read_gguf_metadata
+
+        Returns:
+            KVShape for the model
+
+        Raises:
+            ValueError: If the layer or head counts are missing
+        """
+        n_layer = architecture_value(metadata, "block_count")
+        n_head = architecture_value(metadata, "attention.head_count")
+        n_embd = architecture_value(metadata, "embedding_length")
+        if not n_layer or not n_head or not n_embd:
+            raise ValueError("GGUF metadata lacks block_count, head_count or embedding_length")
+
+        n_head_kv = architecture_value(metadata, "attention.head_count_kv", n_head)
+        if isinstance(n_head_kv, list):  # per-layer counts
+            n_head_kv = max(n_head_kv)
+        if isinstance(n_head, list):
+            n_head = max(n_head)
+        head_dim = n_embd // n_head
+        n_vocab = (architecture_value(metadata, "vocab_size")
+                   or metadata.get("tokenizer.ggml.tokens.count")
+                   or DEFAULT_VOCAB_SIZE)
+        return cls(
+            n_layer=n_layer,
+            n_head_kv=n_head_kv,
+            key_length=architecture_value(metadata, "attention.key_length", head_dim),
+            value_length=architecture_value(metadata, "attention.value_length", head_dim),
+            n_vocab=n_vocab,
+            context_length=architecture_value(metadata, "context_length"),
+        )
+
+    def supports(self, kv_type: str) -> bool:
+        """Whether keys can be stored as kv_type (head size must be a whole number of blocks)."""
+        return self.key_length % KV_TYPE_LAYOUT[kv_type][1] == 0
+
+    def kv_bytes_per_token(self, kv_type: str = "f16") -> int:
+        """
+        KV cache bytes for one token of one sequence.
+
+        Only keys are quantized: the bundled llama.cpp cannot run attention
+        over a quantized value cache, so values stay f16.
+
+        Args:
+            kv_type: Key cache type, one of KV_TYPES
+
+        Returns:
+            Bytes per token across all layers
+        """
+        block_bytes, block_size = KV_TYPE_LAYOUT[kv_type]
+        key_bytes = self.key_length * block_bytes // block_size
+        value_bytes = self.value_length * 2
+        return self.n_layer * self.n_head_kv * (key_bytes + value_bytes)
+
+    def sequence_bytes(self, n_ctx: int, kv_type: str = "f16") -> int:
+        """
+        Memory for one sequence of n_ctx tokens.
+
+        Includes the (n_ctx x n_vocab) float32 logits array that
+        llama-cpp-python keeps next to every context.
+        """
+        return n_ctx * (self.kv_bytes_per_token(kv_type) + self.n_vocab * 4)
+
+
+@dataclass
+class KVPlan:
+    """Context size and KV type chosen for a RAM budget."""
+    n_ctx: int
+    kv_type: str
+    max_fit: int
+    kv_bytes_per_token: int
+    sequence_bytes: int
+    budget_bytes: Optional[int]
+    note: str = ""
+
+    def as_status(self) -> Dict[str, Any]:
+        """Plan summary for /status, with sizes in MB."""
+        mb = 1024 * 1024
+        return {
+            "n_ctx": self.n_ctx,
+            "kv_type": self.kv_type,
+            "max_fit": self.max_fit,
+            "kv_kb_per_token": round(self.kv_bytes_per_token / 1024, 1),
+            "sequence_mb": round(self.sequence_bytes / mb, 1),
+            "budget_mb": round(self.budget_bytes / mb) if self.budget_bytes is not None else None,
+            "note": self.note,
+        }
+
+
+def plan_kv(shape: KVShape, budget_bytes: Optional[int],
+            max_ctx: int = 8192, min_ctx: int = 1024,
+            kv_types: Sequence[str] = KV_TYPES) -> KVPlan:
+    """
+    Pick the largest context that fits a budget.
+
+    The engine serves each model from a single llama context and runs one
+    generation at a time on it, so only one context is planned: queued
+    requests wait for the context instead of holding KV memory of their
+    own. Contexts are tried from largest to smallest, and for each the most
+    precise KV type that fits is used.
+
+    Args:
+        shape: Model dimensions
+        budget_bytes: RAM available for the KV cache, or None if unknown
+        max_ctx: Largest context to consider (also capped by the training context)
+        min_ctx: Smallest context to consider
+        kv_types: Allowed key cache types, most preferred first
+
+    Returns:
+        The chosen KVPlan
+    """
+    limit = min(max_ctx, shape.context_length or max_ctx)
+    sizes = [c for c in CONTEXT_SIZES if min(min_ctx, limit) <= c <= limit] or [limit]
+    types = [t for t in kv_types if t in KV_TYPE_LAYOUT and shape.supports(t)] or ["f16"]
+
+    def make(n_ctx: int, kv_type: str, note: str = "") -> KVPlan:
+        per_seq = shape.sequence_bytes(n_ctx, kv_type)
+        return KVPlan(
+            n_ctx=n_ctx,
+            kv_type=kv_type,
+            max_fit=budget_bytes // per_seq if budget_bytes is not None else 1,
+            kv_bytes_per_token=shape.kv_bytes_per_token(kv_type),
+            sequence_bytes=per_seq,
+            budget_bytes=budget_bytes,
+            note=note,
+        )
+
+    if budget_bytes is None:
+        n_ctx = 2048 if 2048 in sizes else sizes[-1]
+        return make(n_ctx, types[0], "RAM unknown; default context")
+
+    for n_ctx in reversed(sizes):
+        for kv_type in types:
+            plan = make(n_ctx, kv_type)
+            if plan.max_fit >= 1:
+                return plan
+
+    return make(sizes[0], types[-1], "budget too small for the smallest context; expect swapping")
+
+
+def kv_budget_bytes(model_path: Path, loaded: bool = False) -> Optional[int]:
+    """
+    RAM available for the KV cache, from free memory minus the weights.
+
+    Args:
+        model_path: Model file whose weights still need to be mapped
+        loaded: Whether the weights are already resident (counted in used memory)
+
+    Returns:
+        Bytes, or None if psutil is not installed
+    """
+    try:
+        import psutil
+    except ImportError:
+        return None
+    free = psutil.virtual_memory().available
+    if not loaded:
+        free -= model_path.stat().st_size
+    return max(0, int(free * (1 - HEADROOM)))
+
+
+def plan_for_model(model_path: Path, budget_mb: int = 0,
+                   kv_type: str = "auto", max_ctx: int = 8192, min_ctx: int = 1024,
+                   loaded: bool = False) -> KVPlan:
+    """
+    Plan KV memory for a GGUF model file.
+
+    Args:
+        model_path: Path to the .gguf file
+        budget_mb: RAM for the KV cache; 0 = free RAM after the weights, less headroom
+        kv_type: Key cache type, or "auto" to let the planner choose
+        max_ctx: Largest context to consider
+        min_ctx: Smallest context to consider
+        loaded: Whether the weights are already resident
+
+    Returns:
+        The chosen KVPlan
+
+    Raises:
+        ValueError: If the file is not a GGUF model with the needed metadata
+    """
+    shape = KVShape.from_metadata(read_gguf_metadata(model_path))
+    budget = budget_mb * 1024 * 1024 if budget_mb > 0 else kv_budget_bytes(model_path, loaded)
+    kv_types = KV_TYPES if kv_type == "auto" else (kv_type,)
+    return plan_kv(shape, budget, max_ctx=max_ctx, min_ctx=min_ctx, kv_types=kv_types)
@@ -0,0 +1,251 @@
+"""N-best sampling: several completions of one prompt from a single prompt evaluation."""
+
+import codecs
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from src.inference.backends import InferenceBackend
+from src.inference.repetition import finish, make_guard
+from src.utils.logger import logger
+
+
+# Candidates kept before top-p, as llama-cpp's default top_k
+TOP_K = 40
+
+
+def sample_token(logits: Any, temperature: float, top_p: float, rng: Any) -> int:
+    """
+    Sample one token id from a row of logits.
+
+    Args:
+        logits: (n_vocab,) float array
+        temperature: Sampling temperature; 0 picks the most likely token
+        top_p: Nucleus sampling parameter
+        rng: numpy Generator of the completion being sampled
+
+    Returns:
+        Token id
+    """
+    import numpy as np
+
+    if temperature <= 0:
+        return int(np.argmax(logits))
+    candidates = np.argpartition(-logits, TOP_K - 1)[:TOP_K] if len(logits) > TOP_K else np.arange(len(logits))
+    candidates = candidates[np.argsort(-logits[candidates])]
+    z = logits[candidates].astype(np.float64) / temperature
+    p = np.exp(z - z.max())
+    p /= p.sum()
+    if top_p < 1.0:
+        keep = int(np.searchsorted(np.cumsum(p), top_p)) + 1
+        candidates, p = candidates[:keep], p[:keep] / p[:keep].sum()
+    return int(candidates[rng.choice(len(candidates), p=p)])
+
+
+def _held_back(text: str, stop: Sequence[str]) -> int:
+    """Characters at the end of text that could be the start of a stop sequence."""
+    held = 0
+    for s in stop:
+        for size in range(min(len(s) - 1, len(text)), held, -1):
+            if text.endswith(s[:size]):
+                held = size
+                break
+    return held
+
+
+class _Choice:
+    """Decoding state of one completion."""
+
+    def __init__(self, index: int, seed: int):
+        import numpy as np
+
+        self.index = index
+        self.rng = np.random.default_rng([seed, index])
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.text = ""
+        self.sent = 0
+        self.tokens = 0
+        self.finish_reason: Optional[str] = None
+        self.guard = None
+
+    def add(self, piece: bytes, stop: Sequence[str]) -> str:
+        """Append a token's bytes; returns the text that is now safe to send."""
+        self.text += self.decoder.decode(piece)
+        for s in stop:
+            at = self.text.find(s, max(0, self.sent - len(s)))
+            if at >= 0:
+                self.text = self.text[:at]
+                self.finish_reason = "stop"
+        end = len(self.text) if self.finish_reason else len(self.text) - _held_back(self.text, stop)
+        out, self.sent = self.text[self.sent:end], max(self.sent, end)
+        return out
+
+
+def _sequential(model: InferenceBackend, prompt: str, n: int, max_tokens: int, temperature: float,
+                top_p: float, stop: List[str], seed: int, timings: dict) -> Iterator[Tuple[int, str]]:
+    """
+    Fallback for backends without multi-sequence decoding: one completion at a time.
+
+    The prompt is evaluated again for every completion, and completion i
+    is sampled with seed + i so the completions differ.
+    """
+    timings.update(completion_tokens=0, prompt_evals=n, prompt_shared=False, seed=seed, choices=[])
+    for index in range(n):
+        finish, count = None, 0
+        for chunk in model(prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p,
+                           stop=stop, stream=True, seed=seed + index):
+            choice = chunk["choices"][0]
+            if choice.get("text"):
+                count += 1
+                yield index, choice["text"]
+            finish = choice.get("finish_reason") or finish
+        timings["completion_tokens"] += count
+        timings["choices"].append({"index": index, "finish_reason": finish, "completion_tokens": count})
+
+
+def sample_n(model: InferenceBackend, prompt: str, n: int, max_tokens: int, temperature: float,
+             top_p: float, stop: List[str], stop_token_ids: Sequence[int] = (),
+             seed: Optional[int] = None, timings: Optional[dict] = None) -> Iterator[Tuple[int, str]]:
+    """
+    Generate n completions of a prompt, decoded together.
+
+    The prompt is evaluated once into KV sequence 0, which is then shared
+    with sequences 1..n-1 (llama_kv_cache_seq_cp adds the sequence ids to
+    the same cells, so nothing is copied). Each step decodes one token per
+    unfinished completion in a single batch, and each completion samples
+    from its own random generator and has its own repetition guard.
+
+    Args:
+        model: Loaded backend; backends without a llama context run the completions one by one
+        prompt: Prompt text
+        n: Number of completions
+        max_tokens: Maximum tokens per completion
+        temperature: Sampling temperature
+        top_p: Nucleus sampling parameter
+        stop: Stop sequences
+        stop_token_ids: Token ids that end a completion, besides EOS
+        seed: Base seed; completion i uses (seed, i), or seed + i on the fallback
+        timings: Filled with token counts, per-completion finish reasons and timing
+
+    Yields:
+        (completion index, text) pieces, interleaved across completions
+
+    Raises:
+        ValueError: If the prompt and n * max_tokens do not fit in the context
+    """
+    import numpy as np
+
+    timings = timings if timings is not None else {}
+    seed = int(np.random.default_rng().integers(2 ** 31)) if seed is None else seed
+    if not (hasattr(model, "_ctx") and hasattr(model, "_batch")):
+        yield from _sequential(model, prompt, n, max_tokens, temperature, top_p, stop, seed, timings)
+        return
+
+    import llama_cpp
+
+    ctx = model._ctx.ctx
+    batch = model._batch
+    n_batch = model.n_batch
+    n_vocab = model.n_vocab()
+    end_ids = {model.token_eos(), *stop_token_ids}
+
+    tokens = model.tokenize(prompt.encode("utf-8"), add_bos=True, special=True)
+    n_prompt = len(tokens)
+    room = (model.n_ctx() - n_prompt) // n
+    if room < 1:
+        raise ValueError(f"Prompt ({n_prompt} tokens) leaves no room for {n} completions")
+    if room < max_tokens:
+        logger.info(f"n={n} completions limited to {room} tokens each by the context size")
+        max_tokens = room
+
+    choices = [_Choice(index, seed) for index in range(n)]
+    for choice in choices:
+        choice.guard = make_guard(model)
+    timings.update(prompt_tokens=n_prompt, completion_tokens=0, prompt_evals=1, prompt_shared=True, seed=seed)
+
+    def add(token: int, pos: int, seq_ids: Sequence[int], logits: bool):
+        j = batch.batch.n_tokens
+        batch.batch.token[j] = token
+        batch.batch.pos[j] = pos
+        for k, seq in enumerate(seq_ids):
+            batch.batch.seq_id[j][k] = seq
+        batch.batch.n_seq_id[j] = len(seq_ids)
+        batch.batch.logits[j] = logits
+        batch.batch.n_tokens += 1
+
+    def logits_at(j: int) -> Any:
+        return np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(ctx, j), shape=(n_vocab,))
+
+    try:
+        # The model's own completion state is discarded; its next call starts from scratch
+        model.reset()
+        llama_cpp.llama_kv_cache_clear(ctx)
+
+        start = time.perf_counter()
+        for offset in range(0, n_prompt, n_batch):
+            batch.reset()
+            for pos in range(offset, min(offset + n_batch, n_prompt)):
+                add(tokens[pos], pos, [0], pos == n_prompt - 1)
+            model._ctx.decode(batch)
+        first = logits_at(batch.batch.n_tokens - 1).copy()
+        for seq in range(1, n):
+            llama_cpp.llama_kv_cache_seq_cp(ctx, 0, seq, 0, n_prompt)
+        timings["prompt_eval_s"] = round(time.perf_counter() - start, 4)
+
+        start = time.perf_counter()
+        rows = {choice.index: first for choice in choices}
+        for step in range(max_tokens):
+            batch.reset()
+            active = []
+            for choice in choices:
+                if choice.finish_reason:
+                    continue
+                row = rows[choice.index]
+                if choice.guard is not None:
+                    row = choice.guard.adjust(row.copy())
+                token = sample_token(row, temperature, top_p, choice.rng)
+                choice.tokens += 1
+                timings["completion_tokens"] += 1
+                if token in end_ids:
+                    choice.finish_reason = "stop"
+                else:
+                    text = choice.add(model.detokenize([token]), stop)
+                    if text:
+                        yield choice.index, text
+                    if choice.guard is not None and not choice.finish_reason:
+                        choice.guard.observe(token)
+                        if choice.guard.stopped:
+                            choice.finish_reason = "repetition"
+                if choice.finish_reason:
+                    continue
+                if step == max_tokens - 1:
+                    choice.finish_reason = "length"
+                    continue
+                add(token, n_prompt + step, [choice.index], True)
+                active.append(choice.index)
+            if not active:
+                break
+            model._ctx.decode(batch)
+            rows = {index: logits_at(j) for j, index in enumerate(active)}
+
+        for choice in choices:
+            choice.finish_reason = choice.finish_reason or "length"
+            if choice.sent < len(choice.text):
+                yield choice.index, choice.text[choice.sent:]
+        decode_s = time.perf_counter() - start
+        timings["decode_s"] = round(decode_s, 4)
+        timings["tokens_per_s"] = round(timings["completion_tokens"] / decode_s, 1) if decode_s > 0 else None
+        timings["choices"] = [{"index": c.index, "finish_reason": c.finish_reason, "completion_tokens": c.tokens}
+                              for c in choices]
+        for choice, entry in zip(choices, timings["choices"]):
+            finish(choice.guard, entry, max_tokens)
+    finally:
+        llama_cpp.llama_kv_cache_clear(ctx)
+        model.reset()
+
+
+def collect(pieces: Iterator[Tuple[int, str]], n: int) -> List[str]:
+    """Join streamed pieces into one text per completion."""
+    texts: Dict[int, List[str]] = {index: [] for index in range(n)}
+    for index, text in pieces:
+        texts[index].append(text)
+    return ["".join(texts[index]).strip() for index in range(n)]
@@ -0,0 +1,228 @@
+"""Token-aware prompt budgeting: count, reject or truncate prompts before they are queued."""
+
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.inference.backends import InferenceBackend
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# PROMPT_BUDGET_STRATEGY values: "off" skips the check, "reject" refuses oversized
+# prompts, the others name the part of the prompt that is kept
+BUDGET_STRATEGIES = ("off", "reject", "head", "tail", "middle_out")
+
+# Prompts are tokenized per segment so a shared system prompt is tokenized once
+_SEGMENT_SPLIT = re.compile(r"(?<=\n\n)")
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt exceeds its token budget and the strategy is "reject"."""
+
+    def __init__(self, prompt_tokens: int, budget: int):
+        super().__init__(
+            f"Prompt is {prompt_tokens} tokens but only {budget} fit in the context "
+            f"after reserving room for the response"
+        )
+        self.prompt_tokens = prompt_tokens
+        self.budget = budget
+
+
+class PromptTokenizer:
+    """
+    Tokenizer with a cache of prompt segment tokenizations.
+
+    Prompts are split after blank lines and each segment is tokenized on its
+    own, so repeated segments (system prompts, pasted instructions) hit the
+    cache. Counts can exceed a whole-prompt tokenization by about one token
+    per segment, which errs on the side of rejecting or truncating.
+    """
+
+    def __init__(self, backend: InferenceBackend, cache_size: int = 1024):
+        """
+        Initialize the tokenizer.
+
+        Args:
+            backend: Object with tokenize/detokenize/token_bos, e.g. a vocab-only Llama
+            cache_size: Segment tokenizations kept, least recently used evicted first
+        """
+        self.backend = backend
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _segment_tokens(self, segment: str) -> List[int]:
+        """Tokenize one segment without BOS, through the cache."""
+        with self._lock:
+            tokens = self._cache.get(segment)
+            if tokens is not None:
+                self._cache.move_to_end(segment)
+                self.stats["hits"] += 1
+                return tokens
+
+        tokens = self.backend.tokenize(segment.encode("utf-8"), add_bos=False, special=True)
+        with self._lock:
+            self.stats["misses"] += 1
+            self._cache[segment] = tokens
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def tokenize(self, prompt: str) -> List[int]:
+        """Tokenize a prompt (without BOS)."""
+        tokens: List[int] = []
+        for segment in _SEGMENT_SPLIT.split(prompt):
+            if segment:
+                tokens.extend(self._segment_tokens(segment))
+        return tokens
+
+    def detokenize(self, tokens: List[int]) -> str:
+        """Convert tokens back to text."""
+        return self.backend.detokenize(tokens).decode("utf-8", errors="ignore")
+
+    def get_status(self) -> Dict[str, int]:
+        """Cache size and hit counters."""
+        return {"cached_segments": len(self._cache), **self.stats}
+
+
+_tokenizers: Dict[str, PromptTokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(model_file: Optional[Path],
+                  fallback: Optional[InferenceBackend] = None) -> Optional[PromptTokenizer]:
+    """
+    Get the cached tokenizer for a model file.
+
+    GGUF models get a vocab-only llama-cpp load, which reads the vocabulary
+    but no weights and is independent of the serving context, so prompts
+    can be counted while the model is loading, asleep or generating.
+
+    Args:
+        model_file: The model's .gguf file, or None for backends without one
+        fallback: Loaded backend used when there is no model file (the stub)
+
+    Returns:
+        PromptTokenizer, or None if no tokenizer is available
+    """
+    key = str(model_file) if model_file is not None else f"backend-{id(fallback)}"
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(key)
+        if tokenizer is not None:
+            return tokenizer
+
+        if model_file is not None and settings.inference_backend == "llama":
+            try:
+                from llama_cpp import Llama
+                backend = Llama(model_path=str(model_file), vocab_only=True, n_ctx=8, verbose=False)
+            except Exception as e:
+                logger.warning(f"Prompt tokenizer unavailable for {model_file.name}: {e}")
+                return None
+        elif fallback is not None and hasattr(fallback, "tokenize"):
+            backend = fallback
+        else:
+            return None
+
+        tokenizer = PromptTokenizer(backend, settings.prompt_token_cache_size)
+        _tokenizers[key] = tokenizer
+        return tokenizer
+
+
+def truncate_tokens(tokens: List[int], budget: int, strategy: str) -> Tuple[List[int], List[int]]:
+    """
+    Cut tokens down to a budget.
+
+    Args:
+        tokens: Prompt tokens
+        budget: Tokens that may be kept
+        strategy: "head" keeps the start, "tail" keeps the end, "middle_out"
+            keeps both ends and drops the middle
+
+    Returns:
+        Tuple of (leading tokens, trailing tokens) to keep; one is empty unless middle_out
+    """
+    budget = max(0, budget)
+    if strategy == "head":
+        return tokens[:budget], []
+    if strategy == "tail":
+        return [], tokens[len(tokens) - budget:] if budget else []
+    if strategy == "middle_out":
+        head = budget // 2
+        tail = budget - head
+        return tokens[:head], tokens[len(tokens) - tail:] if tail else []
+    raise ValueError(f"Unknown truncation strategy '{strategy}'. Use one of: {', '.join(BUDGET_STRATEGIES)}")
+
+
+def fit_prompt(tokenizer: PromptTokenizer, render: Callable[[str, int], str], content: str, n_ctx: int,
+               max_tokens: int, strategy: Optional[str] = None, history: int = 0) -> Tuple[str, Dict[str, object]]:
+    """
+    Check a rendered prompt against the context budget and truncate or reject it.
+
+    The budget is n_ctx minus max_tokens minus one token for BOS. Only the
+    parts a user wrote are cut, never the chat template around them (whose
+    control tokens would not survive a detokenize): the oldest exchanges of
+    the conversation are dropped first, then the strategy is applied to the
+    latest user message, and the prompt is rendered again.
+
+    Args:
+        tokenizer: Tokenizer of the model serving the request
+        render: Renders (latest user message, number of oldest exchanges dropped) to prompt text
+        content: The latest user message
+        n_ctx: Context window of the model
+        max_tokens: Tokens reserved for the response
+        strategy: One of BUDGET_STRATEGIES; defaults to PROMPT_BUDGET_STRATEGY
+        history: Older exchanges that may be dropped
+
+    Returns:
+        Tuple of (prompt to use, budget details)
+
+    Raises:
+        PromptTooLongError: If the prompt does not fit and the strategy is "reject",
+            or if the template and system messages alone do not fit
+    """
+    strategy = strategy or settings.prompt_budget_strategy
+    text = render(content, 0)
+    total = len(tokenizer.tokenize(text))
+    budget = max(1, n_ctx - max_tokens - 1)
+    info: Dict[str, object] = {"budget_prompt_tokens": total, "token_budget": budget,
+                               "prompt_tokens_truncated": 0}
+    if total <= budget:
+        return text, info
+    if strategy == "reject":
+        raise PromptTooLongError(total, budget)
+
+    dropped = 0
+    size = total
+    while size > budget and dropped < history:
+        dropped += 1
+        text = render(content, dropped)
+        size = len(tokenizer.tokenize(text))
+    if dropped:
+        info["turns_dropped"] = dropped
+
+    # Rendering around a shorter message can shift a token at the seams, so re-check
+    tokens = tokenizer.tokenize(content)
+    room = len(tokens) - (size - budget)
+    for _ in range(3):
+        if size <= budget:
+            break
+        if room < 1:
+            raise PromptTooLongError(total, budget)
+        head, tail = truncate_tokens(tokens, room, strategy)
+        kept = tokenizer.detokenize(head) + tokenizer.detokenize(tail)
+        if kept.startswith(" ") and not content.startswith(" "):
+            kept = kept[1:]  # leading space of the SentencePiece word marker
+        text = render(kept, dropped)
+        excess = len(tokenizer.tokenize(text)) - budget
+        size = budget + excess
+        room -= max(excess, 0)
+    if size > budget:
+        raise PromptTooLongError(total, budget)
+
+    info["prompt_tokens_truncated"] = total - size
+    info["truncation"] = strategy
+    return text, info
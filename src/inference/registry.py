@@ -0,0 +1,265 @@
+"""Registry of local models with memory-budgeted residency."""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.inference.backends import requires_model_file
+from src.inference.engine import SWAP_MEMORY_FACTOR, ModelEngine, model_engine
+from src.utils.config import settings
+from src.utils.logger import logger
+from src.utils.queue import RequestQueue, request_queue
+
+
+class UnknownModelError(ValueError):
+    """Raised when a request names a model that is not installed."""
+
+
+class ModelBudgetError(RuntimeError):
+    """Raised when a model cannot be loaded without exceeding the RAM budget."""
+
+
+@dataclass
+class ModelEntry:
+    """An installed model and the engine that serves it once requested."""
+    name: str
+    path: Path
+    size: int
+    engine: Optional[ModelEngine] = None
+    queue: Optional[RequestQueue] = None
+
+
+class ModelRegistry:
+    """
+    Indexes every GGUF model under MODELS_DIR and loads them on demand.
+
+    The model from MODEL_PATH is served by the global ``model_engine`` and
+    ``request_queue``; every other model gets its own engine and queue the
+    first time it is requested. Loaded models are kept within
+    MODEL_RAM_BUDGET_MB by unloading the least recently used idle model.
+    """
+
+    def __init__(self, models_dir: Optional[str] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            models_dir: Directory to index; defaults to MODELS_DIR from config.env
+        """
+        self.models_dir = Path(models_dir or settings.models_dir)
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Re-scan the models directory for added or removed files."""
+        found = {path.stem: path for path in sorted(self.models_dir.glob("*.gguf"))}
+        with self._lock:
+            for name, path in found.items():
+                if name not in self._entries:
+                    self._entries[name] = ModelEntry(name, path, path.stat().st_size)
+            for name in list(self._entries):
+                entry = self._entries[name]
+                if name not in found and (entry.engine is None or not entry.engine.model_loaded):
+                    del self._entries[name]
+
+    def _default_path(self) -> Optional[Path]:
+        """The file served by the default engine."""
+        if model_engine.model_file is not None:
+            return model_engine.model_file
+        path = Path(settings.model_path)
+        if path.is_dir():
+            return next(iter(path.glob("*.gguf")), None)
+        return path if path.is_file() else None
+
+    def _is_default(self, entry: ModelEntry) -> bool:
+        """Whether an entry is the model served by the default engine."""
+        default = self._default_path()
+        return default is not None and default.resolve() == entry.path.resolve()
+
+    def _lookup(self, name: str) -> Optional[ModelEntry]:
+        """Find an entry by stem, file name or unique case-insensitive prefix."""
+        if name in self._entries:
+            return self._entries[name]
+        for entry in self._entries.values():
+            if entry.path.name == name:
+                return entry
+        wanted = name.lower()
+        matches = [e for e in self._entries.values() if e.name.lower().startswith(wanted)]
+        return matches[0] if len(matches) == 1 else None
+
+    def resolve(self, name: Optional[str]) -> Tuple[ModelEngine, RequestQueue]:
+        """
+        Route a request to the engine and queue for a model.
+
+        Args:
+            name: Requested model name, or None for the default model
+
+        Returns:
+            Tuple of (engine, queue) serving the model
+
+        Raises:
+            UnknownModelError: If no installed model matches the name
+        """
+        if not name or not requires_model_file(settings.inference_backend):
+            return model_engine, request_queue
+
+        entry = self._lookup(name)
+        if entry is None:
+            self.refresh()
+            entry = self._lookup(name)
+        if entry is None:
+            raise UnknownModelError(
+                f"Unknown model '{name}'. Available: {', '.join(self._entries) or 'none'}"
+            )
+
+        if self._is_default(entry):
+            return model_engine, request_queue
+
+        with self._lock:
+            if entry.engine is None:
+                entry.queue = RequestQueue()
+                entry.engine = ModelEngine(str(entry.path), queue=entry.queue)
+        return entry.engine, entry.queue
+
+    def budget_bytes(self) -> Optional[int]:
+        """RAM available for resident models, or None if unlimited."""
+        if settings.model_ram_budget_mb > 0:
+            return settings.model_ram_budget_mb * 1024 * 1024
+        try:
+            import psutil
+            return int(psutil.virtual_memory().total * 0.75)
+        except ImportError:
+            return None
+
+    def _engines(self) -> List[ModelEngine]:
+        """The default engine plus every engine created for a requested model."""
+        engines = [model_engine]
+        engines += [e.engine for e in self._entries.values()
+                    if e.engine is not None and e.engine is not model_engine]
+        return engines
+
+    @staticmethod
+    def _resident_bytes(engine: ModelEngine) -> int:
+        """Estimated memory held by an engine whose weights are loaded or loading."""
+        if engine.load_state not in ("loading", "ready", "sleeping"):
+            return 0
+        path = engine.model_file or (Path(engine.configured_path) if engine.configured_path else None)
+        if path is None or not path.is_file():
+            return 0
+        return int(path.stat().st_size * SWAP_MEMORY_FACTOR)
+
+    def ensure_loaded(self, engine: ModelEngine):
+        """
+        Start loading a model that is not resident, evicting others if needed.
+
+        Sleeping models are woken instead. Returns immediately; callers wait
+        for a waking engine and report 503 + Retry-After for a fresh load.
+
+        Args:
+            engine: Engine returned by resolve()
+
+        Raises:
+            ModelBudgetError: If busy models leave no room within the budget
+        """
+        if engine.load_state == "sleeping":
+            engine.wake()
+            return
+        if engine.load_state != "idle":
+            return
+
+        with self._lock:
+            if engine.load_state != "idle":
+                return
+            budget = self.budget_bytes()
+            path = Path(engine.configured_path or settings.model_path)
+            needed = int(path.stat().st_size * SWAP_MEMORY_FACTOR) if path.is_file() else 0
+
+            if budget is not None:
+                others = [e for e in self._engines() if e is not engine]
+                used = sum(self._resident_bytes(e) for e in others)
+                while used + needed > budget:
+                    idle = [e for e in others
+                            if e.load_state in ("ready", "sleeping") and not e.busy()]
+                    if not idle and used == 0:
+                        logger.warning(f"{path.name} alone exceeds MODEL_RAM_BUDGET_MB; loading anyway")
+                        break
+                    if not idle:
+                        raise ModelBudgetError(
+                            f"Not enough model memory for {path.name} while other models are busy"
+                        )
+                    victim = min(idle, key=lambda e: e.last_used or 0.0)
+                    used -= self._resident_bytes(victim)
+                    logger.info(f"Evicting least recently used model to fit {path.name} in the budget")
+                    victim.unload()
+                    others.remove(victim)
+
+            if engine.sleep_mode:
+                engine.wake()
+            else:
+                engine.start_background_load()
+
+    async def wait_ready(self, engine: ModelEngine, timeout: float) -> bool:
+        """
+        Wait for an engine to become ready, loading it again if it was evicted meanwhile.
+
+        A request resolved before another model's load evicted this one
+        finds it idle; without a new load it would wait the full timeout.
+
+        Args:
+            engine: Engine returned by resolve()
+            timeout: Maximum seconds to wait
+
+        Returns:
+            bool: True once the model is loaded, False on timeout or load failure
+
+        Raises:
+            ModelBudgetError: If busy models leave no room to load it again
+        """
+        deadline = time.monotonic() + timeout
+        while not engine.model_loaded:
+            if engine.load_state == "failed" or time.monotonic() >= deadline:
+                return False
+            if engine.load_state in ("idle", "sleeping"):
+                self.ensure_loaded(engine)
+            await asyncio.sleep(0.05)
+        return True
+
+    def get_status(self) -> dict:
+        """
+        Get the registry contents and memory use.
+
+        Returns:
+            Dictionary with budget, resident estimate and per-model state
+        """
+        self.refresh()
+        now = time.monotonic()
+        models = []
+        for entry in self._entries.values():
+            default = self._is_default(entry)
+            engine = model_engine if default else entry.engine
+            queue = request_queue if default else entry.queue
+            models.append({
+                "name": entry.name,
+                "file": entry.path.name,
+                "size_mb": round(entry.size / (1024 * 1024)),
+                "default": default,
+                "state": engine.load_state if engine else "idle",
+                "in_flight": engine.in_flight() if engine else 0,
+                "idle_seconds": round(now - engine.last_used, 1) if engine and engine.last_used else None,
+                "queue": queue.get_status() if queue else None,
+            })
+
+        budget = self.budget_bytes()
+        return {
+            "models_dir": str(self.models_dir),
+            "budget_mb": round(budget / (1024 * 1024)) if budget else None,
+            "resident_mb": round(sum(self._resident_bytes(e) for e in self._engines()) / (1024 * 1024)),
+            "models": models,
+        }
+
+
+# Global model registry instance
+model_registry = ModelRegistry()
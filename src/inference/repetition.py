@@ -0,0 +1,242 @@
+"""Online detection of degenerate repetition loops in generated tokens."""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# REPETITION_MODE values
+REPETITION_MODES = ("off", "stop", "penalty")
+
+
+class RepetitionDetector:
+    """
+    Spots a block of tokens repeating back to back.
+
+    For every period p up to max_period it keeps the number of consecutive
+    tokens equal to the token p positions earlier. When that run covers
+    min_repeats copies of a p-token block (and at least min_tokens tokens),
+    the output is looping with period p. Each token costs O(max_period).
+    """
+
+    def __init__(self, max_period: int = 64, min_repeats: int = 3, min_tokens: int = 32):
+        """
+        Initialize the detector.
+
+        Args:
+            max_period: Longest repeated block detected, in tokens
+            min_repeats: Copies of the block needed back to back
+            min_tokens: Shortest repeated span acted on
+        """
+        self.max_period = max_period
+        self.min_repeats = min_repeats
+        self.min_tokens = min_tokens
+        self._history: List[int] = []
+        self._runs = [0] * (max_period + 1)
+
+    def add(self, token: int) -> Optional[int]:
+        """
+        Record a generated token.
+
+        Returns:
+            The loop's period in tokens, or None if the output is not looping
+        """
+        history = self._history
+        found = None
+        for period in range(1, min(self.max_period, len(history)) + 1):
+            if history[-period] == token:
+                self._runs[period] += 1
+                run = self._runs[period]
+                if (found is None and run >= period * (self.min_repeats - 1)
+                        and run + period >= self.min_tokens):
+                    found = period
+            else:
+                self._runs[period] = 0
+        history.append(token)
+        if len(history) > self.max_period:
+            del history[0]
+        return found
+
+    def block(self, period: int) -> List[int]:
+        """The last period tokens: one copy of the repeating block."""
+        return self._history[-period:]
+
+    def reset(self):
+        """Forget the current runs, keeping the token history."""
+        self._runs = [0] * (self.max_period + 1)
+
+
+class RepetitionGuard:
+    """
+    llama-cpp logits processor that ends or breaks up repetition loops.
+
+    Llama calls it once per sampled token with every token evaluated so
+    far, so the newest generated token is input_ids[-1]. In "stop" mode a
+    detected loop makes EOS the only candidate, ending the generation at
+    the next token. In "penalty" mode the tokens of the looping block get a
+    logit penalty that grows each time the loop comes back, and the
+    generation is stopped once max_escalations penalties did not help.
+    """
+
+    def __init__(self, eos_id: int, mode: str = "stop", detector: Optional[RepetitionDetector] = None,
+                 penalty_step: float = 2.0, max_escalations: int = 3):
+        """
+        Initialize the guard for one generation.
+
+        Args:
+            eos_id: End-of-sequence token id
+            mode: "stop" or "penalty"
+            detector: Loop detector; defaults to one built from settings
+            penalty_step: Logit penalty added per escalation
+            max_escalations: Penalty escalations before stopping
+        """
+        if mode not in REPETITION_MODES:
+            raise ValueError(f"Unknown repetition mode '{mode}'. Use one of: {', '.join(REPETITION_MODES)}")
+        self.eos_id = eos_id
+        self.mode = mode
+        self.detector = detector or RepetitionDetector(
+            settings.repetition_max_period, settings.repetition_min_repeats, settings.repetition_min_tokens
+        )
+        self.penalty_step = penalty_step
+        self.max_escalations = max_escalations
+        self.loops = 0
+        self.period: Optional[int] = None
+        self.level = 0
+        self.stopped = False
+        self.generated = 0
+        self._penalties: Dict[int, float] = {}
+        self._started = False
+
+    def observe(self, token: int):
+        """Record a generated token and react to a loop."""
+        self.generated += 1
+        period = self.detector.add(token)
+        if period is None:
+            return
+        self.loops += 1
+        self.period = period
+        if self.mode == "stop" or self.level >= self.max_escalations:
+            self.stopped = True
+            return
+        self.level += 1
+        for loop_token in set(self.detector.block(period)):
+            self._penalties[loop_token] = self.penalty_step * self.level
+        self.detector.reset()
+
+    def __call__(self, input_ids: Any, scores: Any) -> Any:
+        # The first call comes right after the prompt: nothing generated yet
+        if self._started:
+            self.observe(int(input_ids[-1]))
+        self._started = True
+        return self.adjust(scores)
+
+    def adjust(self, scores: Any) -> Any:
+        """Apply the current stop or penalties to a row of logits, in place."""
+        import numpy as np
+
+        if self.stopped:
+            scores[:] = -np.inf
+            scores[self.eos_id] = 0.0
+        elif self._penalties:
+            ids = np.fromiter(self._penalties, dtype=np.intc)
+            scores[ids] -= np.fromiter(self._penalties.values(), dtype=scores.dtype)
+        return scores
+
+    def tokens_saved(self, max_tokens: int) -> int:
+        """Tokens of the budget left unused by stopping the loop."""
+        return max(0, max_tokens - self.generated) if self.stopped else 0
+
+    def report(self, max_tokens: int) -> Dict[str, Any]:
+        """Details for the response timings; empty when no loop was seen."""
+        if not self.loops:
+            return {}
+        return {
+            "loops": self.loops,
+            "period": self.period,
+            "penalty_level": self.level,
+            "tokens_saved": self.tokens_saved(max_tokens),
+        }
+
+
+def finish(guard: Optional[RepetitionGuard], timings: dict, max_tokens: int):
+    """
+    Fold a finished generation's repetition outcome into its timings.
+
+    A generation the guard ended gets finish_reason "repetition" and
+    tokens_saved; every generation is counted in repetition_stats.
+    """
+    saved = 0
+    if guard is not None and guard.loops:
+        timings["repetition"] = guard.report(max_tokens)
+        if guard.stopped:
+            saved = guard.tokens_saved(max_tokens)
+            timings["finish_reason"] = "repetition"
+            timings["tokens_saved"] = saved
+            logger.info(f"Stopped a repetition loop (period {guard.period} tokens, {saved} tokens saved)")
+    repetition_stats.record(timings.get("finish_reason"), guard, saved)
+
+
+def make_guard(model: Any, grammar: Any = None) -> Optional[RepetitionGuard]:
+    """
+    Guard for one generation with a loaded model, or None when REPETITION_MODE is off.
+
+    Grammar-constrained generations are left alone: forcing EOS there could
+    leave the grammar with no allowed token. Backends without an EOS token
+    are not guarded either. The stub gets a guard but never calls it, since
+    it ignores logits_processor.
+    """
+    if settings.repetition_mode == "off" or grammar is not None or not hasattr(model, "token_eos"):
+        return None
+    eos_id = model.token_eos()
+    if eos_id is None or eos_id < 0:
+        return None
+    return RepetitionGuard(eos_id, settings.repetition_mode, penalty_step=settings.repetition_penalty_step,
+                           max_escalations=settings.repetition_max_escalations)
+
+
+def with_guard(processor: Any, guard: Optional[RepetitionGuard]) -> Any:
+    """Append a guard to a logits processor list (either may be None)."""
+    if guard is None:
+        return processor
+    from llama_cpp import LogitsProcessorList
+
+    return LogitsProcessorList([*(processor or []), guard])
+
+
+class RepetitionStats:
+    """Counts of finish reasons and of tokens saved by stopping loops."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.finish_reasons: Dict[str, int] = {}
+        self.loops_detected = 0
+        self.penalized = 0
+        self.tokens_saved = 0
+
+    def record(self, finish_reason: Optional[str], guard: Optional[RepetitionGuard] = None,
+               tokens_saved: int = 0):
+        """Count one finished generation."""
+        with self._lock:
+            reason = finish_reason or "unknown"
+            self.finish_reasons[reason] = self.finish_reasons.get(reason, 0) + 1
+            if guard is not None and guard.loops:
+                self.loops_detected += 1
+                self.penalized += 1 if guard.level else 0
+            self.tokens_saved += tokens_saved
+
+    def get_status(self) -> Dict[str, Any]:
+        """Finish reasons, loops seen and tokens saved since startup."""
+        with self._lock:
+            return {
+                "mode": settings.repetition_mode,
+                "finish_reasons": dict(self.finish_reasons),
+                "generations_looping": self.loops_detected,
+                "generations_penalized": self.penalized,
+                "tokens_saved": self.tokens_saved,
+            }
+
+
+# Global finish reason and repetition counters
+repetition_stats = RepetitionStats()
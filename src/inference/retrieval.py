@@ -0,0 +1,394 @@
+"""Retrieval over course documents: chunking, a memory-mapped vector index and top-k search."""
+
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.inference.embeddings import embedding_model
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# Files in an index directory; rows of vectors.f32 and lines of chunks.jsonl share one order
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+CHUNK_OFFSETS_FILE = "chunk_offsets.npy"
+CENTROIDS_FILE = "centroids.npy"
+LIST_OFFSETS_FILE = "list_offsets.npy"
+
+# Document types the ingestion CLI reads
+TEXT_SUFFIXES = (".txt", ".md", ".rst")
+
+
+class RetrievalError(RuntimeError):
+    """Raised when there is no usable index."""
+
+
+def chunk_text(text: str, chunk_chars: int = 1200, overlap: int = 200) -> List[str]:
+    """
+    Split a document into passages of about chunk_chars characters.
+
+    Paragraphs are kept whole where they fit; longer ones are cut at word
+    boundaries. Each chunk starts with the last ~overlap characters of the
+    previous one so a sentence split across chunks is found from either side.
+
+    Args:
+        text: Document text
+        chunk_chars: Target chunk length
+        overlap: Characters repeated from the end of the previous chunk
+
+    Returns:
+        Non-empty chunks in document order
+    """
+    # Leave room for the overlap in front of a cut-up paragraph
+    piece_chars = max(chunk_chars - overlap, chunk_chars // 2)
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        while len(paragraph) > piece_chars:
+            cut = paragraph.rfind(" ", 0, piece_chars)
+            cut = cut if cut > piece_chars // 2 else piece_chars
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        if paragraph:
+            pieces.append(paragraph)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > chunk_chars:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap > 0 else ""
+            space = tail.find(" ")
+            current = tail[space + 1:] if 0 <= space < len(tail) - 1 else ""
+        current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def train_ivf(vectors: Any, n_lists: int, iterations: int = 10, seed: int = 0) -> Any:
+    """
+    Cluster unit vectors into n_lists partitions (spherical k-means).
+
+    Trains on a sample of at most 256 vectors per list.
+
+    Args:
+        vectors: (n, dim) float32 array of unit vectors
+        n_lists: Number of partitions
+        iterations: k-means rounds
+        seed: Sampling seed
+
+    Returns:
+        (n_lists, dim) float32 array of unit centroids
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = vectors[np.sort(rng.choice(n, size=min(n, 256 * n_lists), replace=False))]
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = assign_lists(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        # Reseed empty lists from random sample points
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+    return centroids
+
+
+def assign_lists(vectors: Any, centroids: Any, block: int = 8192) -> Any:
+    """Nearest centroid (by dot product) of each vector, computed in blocks."""
+    import numpy as np
+
+    return np.concatenate([
+        np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), block)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+def write_index(index_dir: Path, chunks: List[Dict[str, Any]], vectors: Any,
+                model_path: Path, n_lists: int = 0) -> Dict[str, Any]:
+    """
+    Write an index directory.
+
+    Vectors are stored as a raw row-major float32 file that is memory-mapped
+    at query time. With n_lists > 0, rows are ordered by IVF partition so each
+    partition is one contiguous slice. index.json is written last; a server
+    picks up the new index when it changes.
+
+    Args:
+        index_dir: Output directory
+        chunks: Metadata per vector ({"source", "chunk", "text"})
+        vectors: (n, dim) float32 array of unit vectors
+        model_path: Embedding model used, recorded for query embedding
+        n_lists: IVF partitions (0 = exhaustive search only)
+
+    Returns:
+        The index.json contents
+    """
+    import numpy as np
+
+    index_dir.mkdir(parents=True, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    order = np.arange(len(vectors))
+
+    if n_lists > 0:
+        centroids = train_ivf(vectors, n_lists)
+        assign = assign_lists(vectors, centroids)
+        order = np.argsort(assign, kind="stable")
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_lists))])
+        _save_npy(index_dir / CENTROIDS_FILE, centroids)
+        _save_npy(index_dir / LIST_OFFSETS_FILE, list_offsets.astype(np.int64))
+
+    tmp = index_dir / (VECTORS_FILE + ".tmp")
+    vectors[order].tofile(tmp)
+    os.replace(tmp, index_dir / VECTORS_FILE)
+
+    offsets = []
+    tmp = index_dir / (CHUNKS_FILE + ".tmp")
+    with open(tmp, "wb") as f:
+        for row in order:
+            offsets.append(f.tell())
+            f.write(json.dumps(chunks[row], ensure_ascii=False).encode("utf-8") + b"\n")
+    os.replace(tmp, index_dir / CHUNKS_FILE)
+    _save_npy(index_dir / CHUNK_OFFSETS_FILE, np.array(offsets, dtype=np.int64))
+
+    info = {
+        "count": int(len(vectors)),
+        "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        "n_lists": int(n_lists),
+        "model_path": str(model_path.resolve()),
+        "model": model_path.name,
+        "sources": len({chunk["source"] for chunk in chunks}),
+        "created": time.time(),
+    }
+    tmp = index_dir / (INDEX_FILE + ".tmp")
+    tmp.write_text(json.dumps(info, indent=2), encoding="utf-8")
+    os.replace(tmp, index_dir / INDEX_FILE)
+    return info
+
+
+def _save_npy(path: Path, array: Any):
+    """Write a .npy file atomically."""
+    import numpy as np
+
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+class VectorIndex:
+    """
+    A loaded index: memory-mapped vectors, chunk offsets and IVF partitions.
+
+    Only the vectors a query scans are paged in, and only the top-k
+    chunks' metadata lines are read from disk.
+    """
+
+    def __init__(self, index_dir: Path):
+        """
+        Open an index directory.
+
+        Raises:
+            RetrievalError: If the directory has no complete index
+        """
+        import numpy as np
+
+        self.index_dir = index_dir
+        try:
+            self.info = json.loads((index_dir / INDEX_FILE).read_text(encoding="utf-8"))
+            count, dim = self.info["count"], self.info["dim"]
+            self.vectors = (np.memmap(index_dir / VECTORS_FILE, dtype=np.float32, mode="r", shape=(count, dim))
+                            if count else np.zeros((0, dim), dtype=np.float32))
+            self.chunk_offsets = np.load(index_dir / CHUNK_OFFSETS_FILE)
+            self.centroids = self.list_offsets = None
+            if self.info.get("n_lists"):
+                self.centroids = np.load(index_dir / CENTROIDS_FILE)
+                self.list_offsets = np.load(index_dir / LIST_OFFSETS_FILE)
+        except (OSError, ValueError, KeyError) as e:
+            raise RetrievalError(f"No usable retrieval index in {index_dir}: {e}")
+
+    def search(self, query: Any, k: int, n_probe: int = 8) -> List[Tuple[int, float]]:
+        """
+        Find the k rows with the highest dot product with query.
+
+        Args:
+            query: (dim,) float32 unit vector
+            k: Results wanted
+            n_probe: IVF partitions scanned (ignored without IVF)
+
+        Returns:
+            (row, score) pairs, best first
+        """
+        import numpy as np
+
+        query = np.asarray(query, dtype=np.float32)
+        if self.centroids is not None and n_probe < len(self.centroids):
+            lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+            rows = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists])
+            scores = np.concatenate([self.vectors[self.list_offsets[i]:self.list_offsets[i + 1]] @ query
+                                     for i in lists])
+        else:
+            rows = None
+            scores = self.vectors @ query
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i] if rows is not None else i), float(scores[i])) for i in top]
+
+    def read_chunks(self, rows: List[int]) -> List[Dict[str, Any]]:
+        """Read the metadata lines of the given rows."""
+        chunks = []
+        with open(self.index_dir / CHUNKS_FILE, "rb") as f:
+            for row in rows:
+                f.seek(int(self.chunk_offsets[row]))
+                chunks.append(json.loads(f.readline()))
+        return chunks
+
+
+class Retriever:
+    """
+    Serves queries against the index in RETRIEVAL_INDEX_DIR.
+
+    The index is opened on first use and reopened when index.json changes,
+    so rebuilding it with scripts/build_index.py needs no restart.
+    """
+
+    def __init__(self, index_dir: str):
+        """
+        Initialize the retriever.
+
+        Args:
+            index_dir: Directory written by write_index()
+        """
+        self.index_dir = Path(index_dir)
+        self._index: Optional[VectorIndex] = None
+        self._mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats = {"queries": 0, "search_s": 0.0, "search_s_max": 0.0}
+
+    def index(self) -> VectorIndex:
+        """
+        The current index, reloaded if it was rebuilt.
+
+        Raises:
+            RetrievalError: If no index has been built
+        """
+        try:
+            mtime = (self.index_dir / INDEX_FILE).stat().st_mtime
+        except OSError:
+            raise RetrievalError(f"No retrieval index in {self.index_dir}; build one with scripts/build_index.py")
+        with self._lock:
+            if self._index is None or mtime != self._mtime:
+                self._index = VectorIndex(self.index_dir)
+                self._mtime = mtime
+                logger.info(f"Retrieval index loaded: {self._index.info['count']} chunks, "
+                            f"{self._index.info['n_lists']} IVF lists")
+            return self._index
+
+    def search(self, query_vector: Any, k: int) -> Tuple[List[Dict[str, Any]], float]:
+        """
+        Top-k passages for a query embedding.
+
+        Args:
+            query_vector: Unit vector from the index's embedding model
+            k: Passages wanted
+
+        Returns:
+            Tuple of (chunks with "score" added, best first; search seconds)
+        """
+        index = self.index()
+        start = time.perf_counter()
+        hits = index.search(query_vector, k, settings.retrieval_nprobe)
+        passages = [dict(chunk, score=round(score, 4))
+                    for chunk, (_, score) in zip(index.read_chunks([row for row, _ in hits]), hits)]
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats["queries"] += 1
+            self.stats["search_s"] += elapsed
+            self.stats["search_s_max"] = max(self.stats["search_s_max"], elapsed)
+        return passages, elapsed
+
+    def retrieve(self, question: str, k: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Embed a question with the index's model and find its top-k passages (blocking).
+
+        Args:
+            question: Query text
+            k: Passages wanted
+
+        Returns:
+            Tuple of (passages, details for the response timings)
+
+        Raises:
+            RetrievalError: If there is no index or it does not match the embedding model
+        """
+        index = self.index()
+        vectors, embed_timings = embedding_model.embed([question], Path(index.info["model_path"]))
+        if vectors.shape[1] != index.info["dim"]:
+            raise RetrievalError(f"Index has {index.info['dim']}-dim vectors but the model gives "
+                                 f"{vectors.shape[1]}; rebuild it with scripts/build_index.py")
+        passages, search_s = self.search(vectors[0], k)
+        return passages, {
+            "retrieval_embed_s": embed_timings["embed_s"],
+            "retrieval_search_ms": round(search_s * 1000, 3),
+            "retrieved": [{"source": p["source"], "chunk": p["chunk"], "score": p["score"]} for p in passages],
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        """Index size and query latency."""
+        with self._lock:
+            info = dict(self._index.info) if self._index else None
+            stats = dict(self.stats)
+        return {
+            "index": info,
+            "queries": stats["queries"],
+            "search_ms_mean": round(stats["search_s"] / stats["queries"] * 1000, 2) if stats["queries"] else None,
+            "search_ms_max": round(stats["search_s_max"] * 1000, 2),
+        }
+
+
+def ground_prompt(question: str, passages: List[Dict[str, Any]], max_chars: int) -> str:
+    """
+    Put retrieved passages in front of a question.
+
+    Args:
+        question: The user's message
+        passages: Search results, best first
+        max_chars: Upper bound on passage text; lower-ranked passages are dropped first
+
+    Returns:
+        The user message to send instead of question
+    """
+    blocks = []
+    used = 0
+    for number, passage in enumerate(passages, 1):
+        text = passage["text"][:max(0, max_chars - used)]
+        if not text:
+            break
+        blocks.append(f"[{number}] {passage['source']}\n{text}")
+        used += len(text)
+    if not blocks:
+        return question
+    notes = "\n\n".join(blocks)
+    return (f"Answer using these excerpts from the course notes, citing them by number.\n\n"
+            f"{notes}\n\nQuestion: {question}")
+
+
+# Global retriever
+retriever = Retriever(settings.retrieval_index_dir)
@@ -1,66 +1,286 @@
 """Streaming inference support for the model engine."""
 
-from typing import AsyncGenerator, Optional
-from llama_cpp import Llama
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from src.inference.backends import InferenceBackend
+from src.inference.chat_template import DEFAULT_STOP
+from src.inference.context_shift import complete
 from src.utils.logger import logger
 
 
-async def stream_generate(
-    model: Llama,
+# TokenBuffer policies for a consumer that stops reading
+SLOW_CLIENT_POLICIES = ("pause", "abort")
+
+# Seconds between checks for other requests while generation is paused
+CONTENTION_CHECK_S = 0.25
+
+
+class SlowClientError(RuntimeError):
+    """Raised when a stream is aborted because its client fell too far behind."""
+
+
+def stream_generate(
+    model: InferenceBackend,
     prompt: str,
     max_tokens: int = 512,
     temperature: float = 0.7,
-    top_p: float = 0.9
-) -> AsyncGenerator[str, None]:
+    top_p: float = 0.9,
+    timings: Optional[dict] = None,
+    grammar: Any = None,
+    stop: Optional[List[str]] = None,
+    logits_processor: Any = None,
+    pinned_prefix: Optional[str] = None
+) -> Iterator[str]:
     """
     Stream generated tokens from the model.
-    
+
+    This blocks while decoding, so servers run it in a worker thread
+    (see start_stream) rather than on the event loop.
+
     Args:
-        model: Loaded Llama model instance
+        model: Loaded inference backend (a Llama instance or the stub)
         prompt: Input text prompt
         max_tokens: Maximum tokens to generate
         temperature: Sampling temperature
         top_p: Nucleus sampling parameter
-        
+        timings: Filled with token counts and context shift statistics
+        grammar: Compiled LlamaGrammar constraining the output, or None
+        stop: Stop sequences; defaults to DEFAULT_STOP
+        logits_processor: Processor ending the turn on extra stop token ids, or None
+        pinned_prefix: Start of the prompt kept by context shifting, or None
+
     Yields:
         Generated text tokens one at a time
     """
+    logger.info(f"Starting streaming generation (max_tokens={max_tokens}, temp={temperature})")
+
+    # Generate response with streaming, shifting the context if it would overflow
+    timings = timings if timings is not None else {}
+    stream = complete(
+        model,
+        prompt,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        stop=stop if stop is not None else DEFAULT_STOP,
+        stream=True,  # Enable streaming
+        timings=timings,
+        pinned_prefix=pinned_prefix,
+        grammar=grammar,
+        logits_processor=logits_processor
+    )
+
+    token_count = 0
+
     try:
-        logger.info(f"Starting streaming generation (max_tokens={max_tokens}, temp={temperature})")
-        
-        # Generate response with streaming
-        stream = model(
-            prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            top_p=top_p,
-            echo=False,
-            stream=True,  # Enable streaming
-            stop=["</s>", "User:", "\n\n\n"]
-        )
-        
-        token_count = 0
-        
         # Yield tokens as they're generated
         for output in stream:
             if 'choices' in output and len(output['choices']) > 0:
                 choice = output['choices'][0]
-                
+
                 # Check if generation is complete
                 if choice.get('finish_reason') is not None:
+                    timings["finish_reason"] = choice['finish_reason']
                     logger.info(f"Generation complete. Total tokens: {token_count}")
+                    if timings["context_shifts"]:
+                        logger.info(f"Context shifted {timings['context_shifts']} times "
+                                    f"({timings['tokens_discarded']} tokens discarded)")
                     break
-                
+
                 # Extract and yield the token
                 if 'text' in choice:
                     token = choice['text']
                     if token:
                         token_count += 1
                         yield token
-        
-        if token_count == 0:
-            logger.warning("No tokens generated during streaming")
-            
-    except Exception as e:
-        logger.error(f"Error during streaming generation: {str(e)}")
-        yield f"[Error: {str(e)}]"
+    finally:
+        # Stops decoding when the consumer goes away mid-stream
+        if hasattr(stream, "close"):
+            stream.close()
+
+    if token_count == 0:
+        logger.warning("No tokens generated during streaming")
+
+
+class TokenBuffer:
+    """
+    Bounded hand-off of generated text from a worker thread to the event loop.
+
+    The worker appends tokens with put(); the consumer takes everything
+    pending at once, so text that arrives while the client is busy is sent
+    together. When more than max_bytes are waiting, the "pause" policy
+    blocks generation until the client catches up (aborting after timeout)
+    and the "abort" policy ends the stream right away. A paused producer
+    still holds the model, so while contended() reports other requests
+    waiting for it the pause is cut to shared_timeout.
+    """
+
+    def __init__(self, max_bytes: int = 65536, policy: str = "pause", timeout: float = 30.0,
+                 contended: Optional[Callable[[], bool]] = None, shared_timeout: float = 1.0):
+        """
+        Initialize the buffer. Must be created on the event loop thread.
+
+        Args:
+            max_bytes: Unsent text allowed before the slow-client policy applies
+            policy: "pause" or "abort"
+            timeout: Seconds generation may stay paused before the stream is aborted
+            contended: Whether other requests are waiting for the model, e.g. ModelEngine.contended
+            shared_timeout: Seconds generation may stay paused while contended() is true
+        """
+        if policy not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy '{policy}'. Use one of: {', '.join(SLOW_CLIENT_POLICIES)}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.timeout = timeout
+        self.contended = contended
+        self.shared_timeout = min(shared_timeout, timeout)
+        self.tokens = 0
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self.cancelled = False
+        self._parts: List[Tuple[int, str]] = []  # (completion index, text)
+        self._bytes = 0
+        self._cond = threading.Condition()
+        self._loop = asyncio.get_running_loop()
+        self._ready = asyncio.Event()
+        self._generated = asyncio.Event()
+
+    # ------------------------------------------------------------
+    # Producer side (worker thread)
+    # ------------------------------------------------------------
+
+    def put(self, text: str, index: int = 0) -> bool:
+        """
+        Add generated text.
+
+        Args:
+            text: Token text
+            index: Completion the text belongs to, for n-best streams
+
+        Returns:
+            bool: False if the stream was cancelled or aborted and generation should stop
+        """
+        size = len(text.encode("utf-8"))
+        with self._cond:
+            if self._bytes + size > self.max_bytes and self._bytes > 0:
+                if self.policy == "abort":
+                    self.error = SlowClientError("Client is not reading the stream fast enough")
+                    return False
+                paused = time.monotonic()
+                while self._bytes + size > self.max_bytes and self._bytes > 0 and not self.cancelled:
+                    shared = self.contended is not None and self.contended()
+                    limit = self.shared_timeout if shared else self.timeout
+                    remaining = paused + limit - time.monotonic()
+                    if remaining <= 0:
+                        self.error = SlowClientError(
+                            f"Client fell behind for more than {limit:g}s"
+                            + (" while other requests waited for the model" if shared else "")
+                        )
+                        return False
+                    # Woken periodically to notice requests that start waiting meanwhile
+                    self._cond.wait(min(remaining, CONTENTION_CHECK_S))
+            if self.cancelled:
+                return False
+            self._parts.append((index, text))
+            self._bytes += size
+            self.tokens += 1
+        self._loop.call_soon_threadsafe(self._ready.set)
+        return True
+
+    def close(self, error: Optional[BaseException] = None):
+        """Mark the end of generation, optionally with the error that ended it."""
+        with self._cond:
+            self.closed = True
+            if error is not None and self.error is None:
+                self.error = error
+        self._loop.call_soon_threadsafe(self._ready.set)
+        self._loop.call_soon_threadsafe(self._generated.set)
+
+    # ------------------------------------------------------------
+    # Consumer side (event loop)
+    # ------------------------------------------------------------
+
+    @property
+    def pending_bytes(self) -> int:
+        """Bytes of text waiting to be taken."""
+        return self._bytes
+
+    @property
+    def finished(self) -> bool:
+        """Whether generation has ended and everything has been taken."""
+        return self.closed and not self._parts
+
+    def take(self) -> str:
+        """Remove and return all pending text, unblocking a paused producer."""
+        return "".join(text for _, text in self._take_parts())
+
+    def take_choices(self) -> Dict[int, str]:
+        """Like take(), with the text grouped by completion index."""
+        choices: Dict[int, str] = {}
+        for index, text in self._take_parts():
+            choices[index] = choices.get(index, "") + text
+        return dict(sorted(choices.items()))
+
+    def _take_parts(self) -> List[Tuple[int, str]]:
+        """Remove all pending parts."""
+        with self._cond:
+            parts = self._parts
+            self._parts = []
+            self._bytes = 0
+            self._cond.notify_all()
+        return parts
+
+    async def wait(self, timeout: Optional[float] = None):
+        """Wait until text is added or generation ends, or the timeout passes."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+
+    async def wait_closed(self):
+        """Wait until generation has ended; its text may still be pending."""
+        await self._generated.wait()
+
+    def cancel(self):
+        """Stop the producer at its next token (e.g. the client disconnected)."""
+        with self._cond:
+            self.cancelled = True
+            self._cond.notify_all()
+
+
+def start_stream(tokens: Iterator[Union[str, Tuple[int, str]]], buffer: TokenBuffer) -> threading.Thread:
+    """
+    Drain a token iterator into a buffer from a worker thread.
+
+    Args:
+        tokens: Blocking token iterator, e.g. ModelEngine.stream(), or of
+            (index, text) pairs from ModelEngine.stream_n()
+        buffer: Buffer the event loop reads from
+
+    Returns:
+        The started thread
+    """
+    def run():
+        error = None
+        try:
+            for token in tokens:
+                index, text = token if isinstance(token, tuple) else (0, token)
+                if not buffer.put(text, index):
+                    break
+        except Exception as e:
+            logger.error(f"Error during streaming generation: {str(e)}")
+            error = e
+        finally:
+            # The buffer closes once the iterator has let go of the model
+            try:
+                if hasattr(tokens, "close"):
+                    tokens.close()
+            finally:
+                buffer.close(error)
+
+    thread = threading.Thread(target=run, name="stream-generate", daemon=True)
+    thread.start()
+    return thread
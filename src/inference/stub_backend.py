@@ -0,0 +1,221 @@
+"""Deterministic stub inference backend for testing without a model file."""
+
+import random
+import threading
+import time
+import uuid
+from typing import Iterator, List, Optional, Union
+
+from src.inference.backends import InferenceBackend
+
+
+# Special token ids; byte tokens follow, then the word vocabulary
+BOS_TOKEN = 1
+EOS_TOKEN = 2
+BYTE_OFFSET = 3
+WORD_OFFSET = BYTE_OFFSET + 256
+
+STUB_VOCABULARY = [
+    "the", "model", "answer", "is", "a", "function", "that", "returns", "value",
+    "data", "student", "campus", "example", "first", "then", "because", "and",
+    "of", "to", "in", "python", "list", "loop", "energy", "cell", "result",
+    "step", "we", "can", "see", "this", "means", "each", "input", "output",
+]
+
+
+class StubFailure(RuntimeError):
+    """Raised when the stub backend simulates a generation failure."""
+
+
+class StubBackend(InferenceBackend):
+    """
+    Emits deterministic tokens at configurable speeds.
+
+    Token content depends only on the seed and the prompt, so two runs with
+    the same inputs produce identical text. Timing behaviour (jitter, stalls,
+    failures) is drawn from a separate generator so it never changes content.
+    """
+
+    def __init__(self, n_ctx: int = 2048, prompt_eval_rate: float = 500.0,
+                 decode_rate: float = 20.0, jitter: float = 0.0,
+                 stall_probability: float = 0.0, stall_seconds: float = 1.0,
+                 failure_probability: float = 0.0, seed: int = 0):
+        """
+        Initialize the stub backend.
+
+        Args:
+            n_ctx: Reported context window in tokens
+            prompt_eval_rate: Simulated prompt evaluation speed (tokens/s, 0 = instant)
+            decode_rate: Simulated decode speed (tokens/s, 0 = instant)
+            jitter: Relative random variation applied to every delay (0.2 = ±20%)
+            stall_probability: Chance that a decode step stalls
+            stall_seconds: Duration of a simulated stall
+            failure_probability: Chance that a request fails part-way through
+            seed: Seed for token content and timing behaviour
+        """
+        self._n_ctx = n_ctx
+        self.prompt_eval_rate = prompt_eval_rate
+        self.decode_rate = decode_rate
+        self.jitter = jitter
+        self.stall_probability = stall_probability
+        self.stall_seconds = stall_seconds
+        self.failure_probability = failure_probability
+        self.seed = seed
+        self.model_path = "stub"
+        self.metadata = {"general.name": "stub"}
+
+        self._timing_rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.context_released = False
+
+    # ------------------------------------------------------------
+    # Tokenizer
+    # ------------------------------------------------------------
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False) -> List[int]:
+        """Byte-level tokenization, so every input round-trips exactly."""
+        tokens = [BYTE_OFFSET + b for b in text]
+        return [BOS_TOKEN] + tokens if add_bos else tokens
+
+    def detokenize(self, tokens: List[int], prev_tokens: Optional[List[int]] = None) -> bytes:
+        """Convert byte and word token ids back to text."""
+        out = bytearray()
+        for token in tokens:
+            if BYTE_OFFSET <= token < WORD_OFFSET:
+                out.append(token - BYTE_OFFSET)
+            elif token >= WORD_OFFSET:
+                out.extend(self._word(token).encode("utf-8"))
+        return bytes(out)
+
+    def n_ctx(self) -> int:
+        """Return the simulated context window size."""
+        return self._n_ctx
+
+    def token_eos(self) -> int:
+        """Return the end-of-sequence token id."""
+        return EOS_TOKEN
+
+    def _word(self, token: int) -> str:
+        """Text of a word-vocabulary token."""
+        return " " + STUB_VOCABULARY[(token - WORD_OFFSET) % len(STUB_VOCABULARY)]
+
+    # ------------------------------------------------------------
+    # Context lifecycle
+    # ------------------------------------------------------------
+
+    def release_context(self):
+        """Simulate freeing the context; completions fail until it is restored."""
+        self.context_released = True
+
+    def restore_context(self):
+        """Simulate recreating the context."""
+        self.context_released = False
+
+    # ------------------------------------------------------------
+    # Timing simulation
+    # ------------------------------------------------------------
+
+    def _draw(self) -> float:
+        """Draw a uniform number from the shared timing generator."""
+        with self._rng_lock:
+            return self._timing_rng.random()
+
+    def _sleep(self, seconds: float):
+        """Sleep for a jittered duration."""
+        if seconds <= 0:
+            return
+        if self.jitter:
+            seconds *= max(0.0, 1.0 + self.jitter * (2 * self._draw() - 1))
+        time.sleep(seconds)
+
+    # ------------------------------------------------------------
+    # Completion
+    # ------------------------------------------------------------
+
+    def __call__(self, prompt: str, max_tokens: int = 16, temperature: float = 0.8,
+                 top_p: float = 0.95, echo: bool = False, stream: bool = False,
+                 stop: Optional[List[str]] = None, **kwargs) -> Union[dict, Iterator[dict]]:
+        """Run a simulated completion with the llama_cpp.Llama call signature."""
+        if self.context_released:
+            raise RuntimeError("Context has been released")
+        chunks = self._generate(prompt, max_tokens, stop or [], kwargs.get("stopping_criteria"),
+                                kwargs.get("seed"))
+        if stream:
+            return chunks
+
+        text, finish_reason, n_prompt, n_completion = "", None, 0, 0
+        for chunk in chunks:
+            choice = chunk["choices"][0]
+            text += choice["text"]
+            finish_reason = choice["finish_reason"]
+            n_prompt, n_completion = chunk["usage"]["prompt_tokens"], chunk["usage"]["completion_tokens"]
+
+        return self._completion(text, finish_reason, n_prompt, n_completion)
+
+    def _completion(self, text: str, finish_reason: Optional[str], n_prompt: int,
+                    n_completion: int) -> dict:
+        """Build a completion payload (or stream chunk) shaped like llama-cpp-python's."""
+        return {
+            "id": f"cmpl-{uuid.uuid4()}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": n_prompt,
+                "completion_tokens": n_completion,
+                "total_tokens": n_prompt + n_completion,
+            },
+        }
+
+    def _generate(self, prompt: str, max_tokens: int, stop: List[str],
+                  stopping_criteria=None, seed: Optional[int] = None) -> Iterator[dict]:
+        """Yield completion chunks one token at a time; seed overrides the backend's content seed."""
+        prompt_tokens = self.tokenize(prompt.encode("utf-8"))
+        n_prompt = len(prompt_tokens)
+        if n_prompt >= self._n_ctx:
+            raise ValueError(
+                f"Requested tokens ({n_prompt}) exceed context window of {self._n_ctx}"
+            )
+        max_tokens = min(max_tokens, self._n_ctx - n_prompt)
+
+        # Decide up front whether (and where) this request fails
+        fail_at = None
+        if self.failure_probability and self._draw() < self.failure_probability:
+            fail_at = int(self._draw() * max_tokens)
+
+        if self.prompt_eval_rate:
+            self._sleep(n_prompt / self.prompt_eval_rate)
+
+        content_rng = random.Random(f"{self.seed if seed is None else seed}:{prompt}")
+        input_ids = list(prompt_tokens)
+        text = ""
+        finish_reason = "length"
+
+        for i in range(max_tokens):
+            if fail_at is not None and i >= fail_at:
+                raise StubFailure("Stub backend simulated a generation failure")
+
+            if self.stall_probability and self._draw() < self.stall_probability:
+                time.sleep(self.stall_seconds)
+            if self.decode_rate:
+                self._sleep(1.0 / self.decode_rate)
+
+            token = WORD_OFFSET + content_rng.randrange(len(STUB_VOCABULARY))
+            piece = self._word(token)
+            input_ids.append(token)
+
+            hit = next((s for s in stop if s and s in text + piece), None)
+            if hit is not None:
+                piece = (text + piece).split(hit, 1)[0][len(text):]
+                finish_reason = "stop"
+
+            text += piece
+            yield self._completion(piece, None, n_prompt, i + 1)
+            if finish_reason == "stop":
+                break
+            if stopping_criteria is not None and stopping_criteria(input_ids, None):
+                finish_reason = "stop"
+                break
+
+        yield self._completion("", finish_reason, n_prompt, len(input_ids) - n_prompt)
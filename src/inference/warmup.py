@@ -0,0 +1,199 @@
+"""Startup warmup from recorded traffic: mine frequent prompt prefixes and replay them."""
+
+import json
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.utils.config import settings
+from src.utils.logger import logger
+
+
+# Only the most recent lines of a request log are mined
+MAX_LOG_LINES = 5000
+
+# Prefixes shorter than this are not worth evaluating ahead of time
+MIN_PREFIX_CHARS = 32
+
+# Longer prompts are cut here before prefixes are counted
+MAX_PREFIX_CHARS = 4000
+
+_record_lock = threading.Lock()
+
+
+def record_prompt(prompt: str):
+    """
+    Append a prompt to PROMPT_LOG_FILE for later warmups.
+
+    Does nothing unless PROMPT_LOG_FILE is set. Only the first
+    MAX_PREFIX_CHARS characters are kept, since only prefixes are replayed.
+
+    Args:
+        prompt: Prompt text as sent to the model
+    """
+    if not settings.prompt_log_file:
+        return
+    line = json.dumps({"timestamp": time.time(), "prompt": prompt[:MAX_PREFIX_CHARS]})
+    try:
+        path = Path(settings.prompt_log_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with _record_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"Could not record prompt: {e}")
+
+
+def load_logged_prompts(path: Path, limit: int = MAX_LOG_LINES) -> List[str]:
+    """
+    Read prompts from the tail of a JSONL request log.
+
+    Each line may carry a ``prompt`` field, or a ``title``/``body`` pair as in
+    the backlog file at the repository root. Malformed lines are skipped.
+
+    Args:
+        path: Path to the JSONL file
+        limit: Number of most recent lines to read
+
+    Returns:
+        List of prompt strings in file order
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = deque(f, maxlen=limit)
+
+    prompts = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(record, dict):
+            continue
+        if record.get("prompt"):
+            prompts.append(str(record["prompt"]))
+        elif record.get("body"):
+            title = record.get("title")
+            prompts.append(f"{title}\n\n{record['body']}" if title else str(record["body"]))
+    return prompts
+
+
+def frequent_prefixes(prompts: List[str], count: int, min_support: int = 2) -> List[Tuple[str, int]]:
+    """
+    Find the longest prompt prefixes shared by the most prompts.
+
+    Prefixes are cut at line breaks, where system prompts and templates end,
+    plus each whole prompt so repeated questions are found too. A prefix is
+    dropped when an already chosen longer prefix covers the same prompts.
+
+    Args:
+        prompts: Logged prompts
+        count: Maximum number of prefixes to return
+        min_support: Minimum number of prompts that must share a prefix
+
+    Returns:
+        List of (prefix, prompt count), most shared first
+    """
+    counts: Counter = Counter()
+    for prompt in prompts:
+        prompt = prompt[:MAX_PREFIX_CHARS]
+        cuts = {i + 1 for i, ch in enumerate(prompt) if ch == "\n"}
+        cuts.add(len(prompt))
+        for cut in cuts:
+            if cut >= MIN_PREFIX_CHARS:
+                counts[prompt[:cut]] += 1
+
+    ranked = sorted(
+        ((prefix, n) for prefix, n in counts.items() if n >= min_support),
+        key=lambda item: (item[1], len(item[0])),
+        reverse=True,
+    )
+    chosen: List[Tuple[str, int]] = []
+    for prefix, n in ranked:
+        if len(chosen) >= count:
+            break
+        if any(longer.startswith(prefix) and support >= n for longer, support in chosen):
+            continue
+        chosen.append((prefix, n))
+    return chosen
+
+
+def mine_warmup_prompts() -> List[str]:
+    """
+    Pick the prefixes to replay at startup from the configured request log.
+
+    Uses WARMUP_PROMPT_FILE, falling back to PROMPT_LOG_FILE.
+
+    Returns:
+        Prefixes to evaluate, or an empty list if warmup is off or there is no log
+    """
+    source = settings.warmup_prompt_file or settings.prompt_log_file
+    if settings.warmup_prompts <= 0 or not source:
+        return []
+
+    path = Path(source)
+    if not path.is_file():
+        logger.info(f"Prompt warmup skipped: {path} does not exist yet")
+        return []
+
+    try:
+        prompts = load_logged_prompts(path)
+    except OSError as e:
+        logger.warning(f"Prompt warmup skipped: {e}")
+        return []
+
+    prefixes = frequent_prefixes(prompts, settings.warmup_prompts)
+    logger.info(f"Prompt warmup: {len(prefixes)} frequent prefixes mined from "
+                f"{len(prompts)} prompts in {path.name}")
+    return [prefix for prefix, _ in prefixes]
+
+
+def replay_prompts(model, prompts: List[str], timeout: float,
+                   kv_cache: Optional[object] = None) -> Dict[str, object]:
+    """
+    Evaluate prompts once each so their pages and cached state are warm.
+
+    Each prompt is run for a single token, which faults in the weights it
+    touches and, when the persistent KV cache is attached, stores the
+    evaluated prefix so matching requests skip prompt evaluation.
+
+    Args:
+        model: Loaded backend
+        prompts: Prefixes to evaluate
+        timeout: Seconds after which remaining prompts are skipped
+        kv_cache: Attached PersistentKVCache, used to count new entries
+
+    Returns:
+        Dictionary with prompts evaluated, prompt tokens, cache entries created and seconds
+    """
+    start = time.perf_counter()
+    entries_before = kv_cache.get_status()["entries"] if kv_cache is not None else 0
+    evaluated = 0
+    tokens = 0
+
+    for prompt in prompts:
+        if time.perf_counter() - start > timeout:
+            logger.warning(f"Prompt warmup stopped after {timeout:.0f}s "
+                           f"({evaluated}/{len(prompts)} prompts)")
+            break
+        try:
+            result = model(prompt, max_tokens=1, temperature=0.0)
+        except Exception as e:
+            logger.warning(f"Prompt warmup skipped a prompt: {e}")
+            continue
+        evaluated += 1
+        tokens += result.get("usage", {}).get("prompt_tokens", 0)
+
+    created = 0
+    if kv_cache is not None:
+        kv_cache.flush()
+        created = kv_cache.get_status()["entries"] - entries_before
+    return {
+        "prompts": evaluated,
+        "prompt_tokens": tokens,
+        "cache_entries_created": created,
+        "seconds": time.perf_counter() - start,
+    }
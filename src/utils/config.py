@@ -24,6 +24,117 @@ class Settings(BaseSettings):
     temperature: float = 0.7
     top_p: float = 0.9
     
+    # Llama Runtime Tuning (0 threads = library default of half the CPUs)
+    n_ctx: int = 2048
+    n_batch: int = 512
+    n_threads: int = 0
+    n_threads_batch: int = 0
+    use_mmap: bool = True
+    use_mlock: bool = False
+    autotune: bool = False  # benchmark threads/batch on first start, reuse saved profile after
+    autotune_profile_dir: str = "./models/tuning"
+    
+    # Cold Load ("off", "advise" = kernel readahead hint, "read" = parallel read into page cache)
+    prewarm_mode: str = "off"
+    prewarm_threads: int = 4
+    warmup_first_token: bool = True  # run one token before reporting ready
+    
+    # Hot Model Swap ("auto" loads side by side when free RAM allows, else drains first)
+    swap_strategy: str = "auto"
+    swap_drain_timeout: float = 600.0  # seconds to wait for streams on the old model
+    admin_token: Optional[str] = None  # required as X-Admin-Token; unset = localhost only
+    
+    # Multi-Model Registry (requests pick a model by name; MODEL_PATH is the default)
+    models_dir: str = "./models"
+    model_ram_budget_mb: int = 0  # 0 = 75% of system RAM
+    
+    # Idle Unload ("context" frees the KV cache only, "weights" frees the whole model)
+    idle_unload_seconds: int = 0  # 0 = never
+    idle_unload_mode: str = "context"
+    wake_timeout: float = 120.0  # seconds a request waits for a sleeping model
+    
+    # Persistent KV Cache (evaluated prompt state reused across requests and restarts)
+    kv_cache_enabled: bool = False
+    kv_cache_dir: str = "./cache/kv"
+    kv_cache_size_mb: int = 4096  # disk limit, least recently used entries evicted
+    kv_cache_ram_mb: int = 512  # entries kept in memory, warmed from disk at load
+    kv_cache_min_prefix: int = 32  # tokens a prompt must share with a cached entry
+    
+    # Context Shifting (keep generating past a full window by discarding the oldest middle tokens)
+    context_shift: bool = True
+    context_keep_tokens: int = 256  # most tokens pinned at the start (system prompt)
+    
+    # SSE Transport (tokens coalesced into frames, bounded buffering for slow clients)
+    sse_flush_ms: int = 30  # gap between frames after the first token, 0 = no coalescing
+    sse_flush_bytes: int = 512  # send a frame early once this much text is pending
+    sse_buffer_bytes: int = 65536  # unsent text before the slow-client policy applies
+    sse_slow_client: str = "pause"  # "pause" generation until the client catches up, or "abort"
+    sse_slow_client_timeout: float = 30.0  # seconds paused before the stream is aborted
+    sse_slow_client_shared_timeout: float = 1.0  # seconds paused while other requests wait for the model
+    
+    # WebSocket (/ws carries many streams per connection)
+    ws_max_streams: int = 8  # concurrent streams per connection (each still takes a queue slot)
+    ws_stream_window: int = 32  # token frames a stream may send before the client acks, 0 = no limit
+    
+    # Batch Jobs (JSONL prompt files run while no interactive requests are in flight)
+    batch_dir: str = "./cache/batch"  # job inputs, checkpointed results and progress
+    batch_max_prompts: int = 10000  # prompts per submitted file
+    batch_idle_poll_ms: int = 200  # how often a waiting job checks whether the model is idle
+    batch_retry_s: float = 30.0  # pause before retrying a job that failed to run (e.g. model load error)
+    
+    # Constrained Decoding (grammar / json_schema request fields)
+    grammar_cache_size: int = 64  # compiled grammars kept, least recently used evicted first
+    
+    # Chat Template (prompt format and end-of-turn stops read from the GGUF file)
+    chat_template: str = "auto"  # "auto" = render with the model's template, "off" = send prompts raw
+    
+    # Embeddings (/api/embeddings; a separate embedding-mode context, loaded on first use)
+    embedding_model_path: str = ""  # .gguf to embed with; empty = the chat model's file
+    embedding_batch_tokens: int = 2048  # tokens evaluated per batch; also the per-input limit
+    embedding_max_inputs: int = 256  # texts per request
+    
+    # Retrieval (course notes indexed by scripts/build_index.py; /api/chat "retrieve" injects passages)
+    retrieval_index_dir: str = "./cache/retrieval"  # memory-mapped vectors and chunk metadata
+    retrieval_chunk_chars: int = 1200  # passage length when ingesting
+    retrieval_chunk_overlap: int = 200  # characters repeated between neighbouring passages
+    retrieval_nprobe: int = 8  # IVF partitions scanned per query (indexes built with --ivf-lists)
+    retrieval_max_context_chars: int = 6000  # passage text added to one prompt
+    
+    # Repetition Guard (ends generations stuck repeating the same block of tokens)
+    repetition_mode: str = "stop"  # "stop" at the loop, "penalty" to push the model out of it first, or "off"
+    repetition_max_period: int = 64  # longest repeating block detected, in tokens
+    repetition_min_repeats: int = 3  # back-to-back copies of the block that count as a loop
+    repetition_min_tokens: int = 32  # shortest repeated span acted on (spares short lists and "ha ha ha")
+    repetition_penalty_step: float = 2.0  # logit penalty on the block's tokens per escalation
+    repetition_max_escalations: int = 3  # penalty escalations before the generation is stopped
+    
+    # Prompt Budget (checked in tokens before a request is queued)
+    prompt_budget_strategy: str = "middle_out"  # "off", "reject", or keep "head", "tail", "middle_out"
+    prompt_token_cache_size: int = 1024  # tokenized prompt segments kept for reuse
+    
+    # KV Memory Planner (size context, key cache type and concurrency to RAM from GGUF shape)
+    kv_plan: bool = False  # true = plan overrides N_CTX and KV_CACHE_TYPE
+    kv_plan_budget_mb: int = 0  # RAM for the KV cache, 0 = free RAM after weights minus 20%
+    kv_plan_max_ctx: int = 8192
+    kv_plan_min_ctx: int = 1024  # smallest context the plan picks
+    kv_cache_type: str = "f16"  # key cache: "f16", "q8_0", "q4_0", or "auto" (planner picks)
+    
+    # Prompt Warmup (replay frequent prompt prefixes from a request log before reporting ready)
+    prompt_log_file: Optional[str] = None  # record incoming prompts here (JSONL); unset = off
+    warmup_prompt_file: Optional[str] = None  # JSONL to mine; defaults to prompt_log_file
+    warmup_prompts: int = 8  # prefixes replayed at startup, 0 = off
+    warmup_timeout: float = 120.0  # seconds before remaining prefixes are skipped
+    
+    # Inference Backend ("llama" for GGUF models, "stub" for model-free testing)
+    inference_backend: str = "llama"
+    stub_prompt_eval_rate: float = 500.0  # tokens/s, 0 = instant
+    stub_decode_rate: float = 20.0  # tokens/s, 0 = instant
+    stub_jitter: float = 0.0  # relative delay variation, 0.2 = +/-20%
+    stub_stall_probability: float = 0.0  # chance per decoded token
+    stub_stall_seconds: float = 1.0
+    stub_failure_probability: float = 0.0  # chance per request
+    stub_seed: int = 0
+    
     # Logging
     log_level: str = "INFO"
     log_file: str = "./logs/server.log"
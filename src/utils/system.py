@@ -0,0 +1,89 @@
+"""Host introspection helpers used by benchmarks and runtime tuning."""
+
+import hashlib
+import json
+import os
+import platform
+from pathlib import Path
+from typing import Any, Dict, List
+
+
+# CPU feature flags that change llama.cpp kernel selection
+_CPU_FLAGS = ("avx", "avx2", "avx512f", "avx512_vnni", "fma", "f16c", "neon", "asimd")
+
+
+def _cpu_model() -> str:
+    """Best-effort CPU model name."""
+    cpuinfo = Path("/proc/cpuinfo")
+    if cpuinfo.exists():
+        for line in cpuinfo.read_text(errors="ignore").splitlines():
+            if line.lower().startswith(("model name", "hardware")):
+                return line.split(":", 1)[1].strip()
+    return platform.processor() or platform.machine()
+
+
+def _cpu_flags() -> List[str]:
+    """CPU feature flags relevant to inference speed."""
+    cpuinfo = Path("/proc/cpuinfo")
+    if not cpuinfo.exists():
+        return []
+    for line in cpuinfo.read_text(errors="ignore").splitlines():
+        if line.lower().startswith(("flags", "features")):
+            present = set(line.split(":", 1)[1].split())
+            return [flag for flag in _CPU_FLAGS if flag in present]
+    return []
+
+
+def machine_fingerprint() -> Dict[str, Any]:
+    """
+    Describe the host in enough detail to tell benchmark results apart.
+
+    Returns:
+        Dictionary with CPU, memory, OS and runtime library information
+    """
+    info = {
+        "hostname": platform.node(),
+        "os": f"{platform.system()} {platform.release()}",
+        "machine": platform.machine(),
+        "cpu_model": _cpu_model(),
+        "cpu_flags": _cpu_flags(),
+        "logical_cpus": os.cpu_count(),
+        "physical_cpus": None,
+        "ram_gb": None,
+        "python": platform.python_version(),
+        "llama_cpp": None,
+    }
+
+    try:
+        import psutil
+        info["physical_cpus"] = psutil.cpu_count(logical=False)
+        info["ram_gb"] = round(psutil.virtual_memory().total / (1024**3), 1)
+    except ImportError:
+        pass
+
+    try:
+        import llama_cpp
+        info["llama_cpp"] = llama_cpp.__version__
+    except ImportError:
+        pass
+
+    return info
+
+
+def fingerprint_id(fingerprint: Dict[str, Any]) -> str:
+    """
+    Short stable identifier for the performance-relevant parts of a fingerprint.
+
+    The hostname is excluded so identical lab machines share tuning results.
+
+    Args:
+        fingerprint: Output of machine_fingerprint()
+
+    Returns:
+        12-character hex digest
+    """
+    keys = ("machine", "cpu_model", "cpu_flags", "logical_cpus", "physical_cpus",
+            "ram_gb", "llama_cpp")
+    stable = {key: fingerprint.get(key) for key in keys}
+    digest = hashlib.sha256(json.dumps(stable, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:12]